@@ -0,0 +1,264 @@
+"""
+Streaming anomaly detection over the multi-band feature stream
+
+Combines a rolling robust z-score (median/MAD per band over a bounded ring
+buffer) with an optional Half-Space Trees model (Tan et al., 2011). Both use
+fixed-size NumPy arrays and vectorized updates, so one detector per session
+costs tens of microseconds per tick.
+"""
+import os
+from typing import Optional, Sequence, Dict, Any
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Scales MAD to the standard deviation of a normal distribution
+_MAD_SCALE = 0.6745
+_EPS = 1e-12
+
+WINDOW = int(os.getenv("ANOMALY_WINDOW", "120"))
+Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.5"))
+USE_HST = os.getenv("ANOMALY_HST", "0").lower() in ("1", "true", "yes")
+HST_THRESHOLD = float(os.getenv("ANOMALY_HST_THRESHOLD", "0.85"))
+MIN_SAMPLES = 10
+# Rows per vectorized median block in robust_z_batch, to bound temporary memory
+_BATCH_BLOCK = 4096
+
+
+def _robust_z(history: np.ndarray, values: np.ndarray) -> np.ndarray:
+    median = np.median(history, axis=0)
+    mad = np.median(np.abs(history - median), axis=0)
+    return _MAD_SCALE * (values - median) / np.maximum(mad, _EPS)
+
+
+def _padded_median(block: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Median along the last axis of rows holding counts[i] values followed by NaN padding"""
+    ordered = np.sort(block, axis=-1)  # NaN sorts last
+    low = ((counts - 1) // 2)[:, None, None]
+    high = (counts // 2)[:, None, None]
+    return 0.5 * (np.take_along_axis(ordered, low, -1) + np.take_along_axis(ordered, high, -1))[..., 0]
+
+
+def robust_z_batch(values: np.ndarray, history: Optional[np.ndarray] = None, window: int = WINDOW) -> np.ndarray:
+    """
+    Robust z-scores for consecutive rows, each against the rows before it
+
+    Gives the same result as feeding the rows one at a time through
+    RollingRobustZ, but all rows with a full window are scored in vectorized
+    blocks. history holds up to `window` rows that precede values in the
+    same session. Rows still warming up are NaN.
+    """
+    num_features = values.shape[1]
+    history = np.empty((0, num_features)) if history is None else history[-window:]
+    data = np.concatenate([history, values])
+    offset = len(history)
+    z = np.full(values.shape, np.nan)
+
+    # Rows that see fewer than `window` earlier rows: NaN-padded lookbacks of varying length
+    first_full = min(max(window - offset, 0), len(values))
+    first_scored = min(max(MIN_SAMPLES - offset, 0), first_full)
+    if first_scored < first_full:
+        rows = np.arange(offset + first_scored, offset + first_full)
+        lookback = np.full((len(rows), num_features, window), np.nan)
+        # Row r looks back over data[:r]
+        for j in range(rows[-1]):
+            valid = rows > j
+            lookback[valid, :, j] = data[j]
+        counts = np.minimum(rows, window)
+        median = _padded_median(lookback, counts)
+        mad = _padded_median(np.abs(lookback - median[..., None]), counts)
+        z[first_scored:first_full] = _MAD_SCALE * (data[rows] - median) / np.maximum(mad, _EPS)
+
+    # windows[k] is data[k:k + window], the lookback of row k + window
+    windows = sliding_window_view(data[:-1], window, axis=0) if len(data) > window else None
+    for start in range(first_full, len(values), _BATCH_BLOCK):
+        stop = min(start + _BATCH_BLOCK, len(values))
+        block = windows[offset + start - window:offset + stop - window]
+        median = np.median(block, axis=-1)
+        mad = np.median(np.abs(block - median[..., None]), axis=-1)
+        z[start:stop] = _MAD_SCALE * (data[offset + start:offset + stop] - median) / np.maximum(mad, _EPS)
+    return z
+
+
+def robust_z_to_score(z: np.ndarray, z_threshold: float = Z_THRESHOLD) -> np.ndarray:
+    """0-100 anomaly score per row, as StreamingAnomalyDetector reports it (0 while warming up)"""
+    peak = np.nanmax(np.abs(z), axis=-1, initial=0.0)
+    return np.clip(peak / (2 * z_threshold), 0.0, 1.0) * 100
+
+
+class RollingRobustZ:
+    """Median/MAD z-scores over the last `window` feature vectors"""
+
+    def __init__(self, num_features: int, window: int = WINDOW):
+        self.buffer = np.zeros((window, num_features))
+        self.window = window
+        self.count = 0
+
+    def score(self, values: np.ndarray) -> Optional[np.ndarray]:
+        """Robust z-score of values against the current window (None while warming up)"""
+        filled = min(self.count, self.window)
+        if filled < MIN_SAMPLES:
+            return None
+        return _robust_z(self.buffer[:filled], values)
+
+    def update(self, values: np.ndarray):
+        self.buffer[self.count % self.window] = values
+        self.count += 1
+
+
+class HalfSpaceTrees:
+    """Half-Space Trees with all trees stored as flat arrays
+
+    Nodes are numbered heap-style (children of n are 2n+1 and 2n+2), so scoring
+    and updating walk every tree at once, one depth level per NumPy step.
+    Mass profiles swap every `window` samples; the first window is used to
+    size the feature workspace.
+    """
+
+    def __init__(self, num_features: int, num_trees: int = 25, depth: int = 8,
+                 window: int = 250, seed: int = 0):
+        self.num_features = num_features
+        self.num_trees = num_trees
+        self.depth = depth
+        self.window = window
+        self.size_limit = 0.1 * window
+        self.rng = np.random.default_rng(seed)
+        num_nodes = 2 ** (depth + 1) - 1
+        self.split_dim = np.zeros((num_trees, num_nodes), dtype=np.int64)
+        self.split_value = np.zeros((num_trees, num_nodes))
+        self.reference = np.zeros((num_trees, num_nodes))
+        self.latest = np.zeros((num_trees, num_nodes))
+        self.warmup = np.zeros((window, num_features))
+        self.seen = 0
+        self.built = False
+        self.has_reference = False
+        self.typical_score: Optional[float] = None
+        self._trees = np.arange(num_trees)
+        self._level_weights = 2.0 ** np.arange(depth + 1)
+
+    def _build(self):
+        low = self.warmup.min(axis=0)
+        high = self.warmup.max(axis=0)
+        for t in range(self.num_trees):
+            # Random workspace around the observed range, as in the original algorithm
+            pivot = self.rng.uniform(low, high)
+            radius = 2 * np.maximum(pivot - low, high - pivot) + _EPS
+            self._build_node(t, 0, pivot - radius, pivot + radius, 0)
+        self.built = True
+
+    def _build_node(self, tree: int, node: int, low: np.ndarray, high: np.ndarray, level: int):
+        if level == self.depth:
+            return
+        dim = self.rng.integers(self.num_features)
+        middle = (low[dim] + high[dim]) / 2
+        self.split_dim[tree, node] = dim
+        self.split_value[tree, node] = middle
+        left_high = high.copy()
+        left_high[dim] = middle
+        right_low = low.copy()
+        right_low[dim] = middle
+        self._build_node(tree, 2 * node + 1, low, left_high, level + 1)
+        self._build_node(tree, 2 * node + 2, right_low, high, level + 1)
+
+    def _paths(self, values: np.ndarray) -> np.ndarray:
+        """Node index at every depth level for every tree, shape (trees, depth + 1)"""
+        paths = np.zeros((self.num_trees, self.depth + 1), dtype=np.int64)
+        node = paths[:, 0]
+        for level in range(1, self.depth + 1):
+            goes_right = values[self.split_dim[self._trees, node]] >= self.split_value[self._trees, node]
+            node = 2 * node + 1 + goes_right
+            paths[:, level] = node
+        return paths
+
+    def score_and_update(self, values: np.ndarray) -> Optional[float]:
+        """Anomaly score in [0, 1] for values, then learn from them (None while warming up)"""
+        if not self.built:
+            self.warmup[self.seen] = values
+            self.seen += 1
+            if self.seen == self.window:
+                self._build()
+                for row in self.warmup:
+                    self.latest[self._trees[:, None], self._paths(row)] += 1
+                self._swap()
+            return None
+
+        paths = self._paths(values)
+        score = None
+        if self.has_reference:
+            masses = self.reference[self._trees[:, None], paths]
+            # Stop at the first node on each path whose mass is too small to trust
+            small = masses <= self.size_limit
+            terminal = np.where(small.any(axis=1), small.argmax(axis=1), self.depth)
+            mass_score = float((masses[self._trees, terminal] * self._level_weights[terminal]).sum())
+            # Mass scores are only meaningful relative to what typical points get;
+            # points in sparse regions score well below the running typical value
+            if self.typical_score is None:
+                self.typical_score = mass_score
+            score = float(np.clip(1.0 - mass_score / max(self.typical_score, _EPS), 0.0, 1.0))
+            self.typical_score += 0.01 * (mass_score - self.typical_score)
+
+        self.latest[self._trees[:, None], paths] += 1
+        self.seen += 1
+        if self.seen % self.window == 0:
+            self._swap()
+        return score
+
+    def _swap(self):
+        self.reference, self.latest = self.latest, self.reference
+        self.latest[:] = 0
+        self.has_reference = True
+
+
+class StreamingAnomalyDetector:
+    """Per-session detector producing an anomaly score and edge-triggered events"""
+
+    def __init__(self, feature_names: Sequence[str], window: int = WINDOW,
+                 z_threshold: float = Z_THRESHOLD, use_hst: bool = USE_HST,
+                 hst_threshold: float = HST_THRESHOLD):
+        self.feature_names = tuple(feature_names)
+        self.z_threshold = z_threshold
+        self.hst_threshold = hst_threshold
+        self.robust = RollingRobustZ(len(self.feature_names), window)
+        self.hst = HalfSpaceTrees(len(self.feature_names)) if use_hst else None
+        self.in_anomaly = False
+
+    def update(self, features: Dict[str, float]) -> Dict[str, Any]:
+        """
+        Score one tick of band powers and learn from it
+
+        Returns {"score": 0-100, "is_anomaly", "event"} where event is set only
+        on the tick an anomaly starts, so subscribers aren't flooded.
+        """
+        values = np.log10(np.maximum(
+            np.fromiter((features[name] for name in self.feature_names), dtype=float,
+                        count=len(self.feature_names)), _EPS))
+
+        z = self.robust.score(values)
+        self.robust.update(values)
+        hst_score = self.hst.score_and_update(values) if self.hst else None
+        if z is None:
+            return {"score": 0.0, "is_anomaly": False, "event": None}
+
+        abs_z = np.abs(z)
+        # |z| at the threshold maps to 50, twice the threshold to 100
+        score = float(robust_z_to_score(z, self.z_threshold))
+        flagged = [name for name, value in zip(self.feature_names, abs_z) if value > self.z_threshold]
+        methods = ["robust_z"] if flagged else []
+        if hst_score is not None:
+            score = max(score, hst_score * 100)
+            if hst_score > self.hst_threshold:
+                methods.append("half_space_trees")
+
+        is_anomaly = bool(methods)
+        event = None
+        if is_anomaly and not self.in_anomaly:
+            event = {
+                "score": round(score, 2),
+                "methods": methods,
+                "bands": flagged,
+                "z": {name: round(float(value), 3) for name, value in zip(self.feature_names, z)},
+            }
+            if hst_score is not None:
+                event["hst_score"] = round(hst_score, 4)
+        self.in_anomaly = is_anomaly
+        return {"score": score, "is_anomaly": is_anomaly, "event": event}
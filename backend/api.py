@@ -7,21 +7,49 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, PlainTextResponse
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 
-from backend.database import get_db, init_db, Event
+from backend.database import get_db, init_db, Event, EventRollup, RecordingSession
 from backend.models import (
     EventCreate, EventResponse,
-    FirebaseInsertRequest, FirebaseUpdateRequest, FirebaseQueryRequest, FirebaseResponse
+    FirebaseInsertRequest, FirebaseUpdateRequest, FirebaseQueryRequest, FirebaseResponse,
+    ProfileRequest
 )
 from backend.firebase_service import FirebaseService
+from backend.recommender import Recommender
+from backend.sessions import session_to_dict
+from backend.downsample import (
+    METHODS, SERIES_COLUMNS, MAX_POINTS, as_naive_utc, minmax_series, lttb_series
+)
+from backend.serialization import dumps_bytes
+from backend.contexts import ContextStore
+from backend import postgres
+from backend.retention import HOUR
+from backend.profiler import Profiler, ProfilerBusy, is_admin
+from backend.metrics import REGISTRY, CONTENT_TYPE, DB_COMMIT_SECONDS, FIRESTORE_WRITE_SECONDS, FAILED_SYNCS
 
 app = FastAPI(title="NeuroCalm API", version="1.0.0")
 
+# Columns of EventResponse, selected directly for listing endpoints; the context
+# is filled in from context_id (interned) or the legacy inline column
+EVENT_RESPONSE_COLUMNS = (
+    Event.id, Event.timestamp, Event.mode, Event.focus_score, Event.load_score,
+    Event.anomaly_score, Event.user_id
+)
+EVENT_RESPONSE_FIELDS = tuple(column.key for column in EVENT_RESPONSE_COLUMNS)
+
+def event_to_dict(event: Event, db: Session) -> dict:
+    """EventResponse fields of an ORM event, with its context resolved"""
+    data = {field: getattr(event, field) for field in EVENT_RESPONSE_FIELDS}
+    data["context"] = ContextStore.get_instance().resolve(db, event.context_id, event.context)
+    return data
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -49,6 +77,36 @@ def startup_event():
 def root():
     return {"message": "NeuroCalm API", "version": "1.0.0"}
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.post("/admin/profile")
+async def profile_api(request: ProfileRequest, format: str = "json", x_admin_token: Optional[str] = Header(None)):
+    """
+    Profile this API process for a while (admin only, X-Admin-Token)
+    
+    format=collapsed returns just the sampled stacks as text for flamegraph tools.
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required (profiling is off unless ADMIN_TOKEN is set)")
+    if request.mode == "cprofile":
+        # cProfile only sees the event loop thread, and sync routes run in the thread pool
+        raise HTTPException(status_code=400, detail="mode=cprofile only covers the event loop thread, not the "
+                                                    "thread pool running sync routes; use mode=sample")
+    try:
+        result = await Profiler.get_instance().run(
+            request.mode, request.seconds, request.interval, request.memory, request.top
+        )
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "collapsed":
+        return PlainTextResponse(result.get("collapsed", ""))
+    return result
+
 @app.post("/events", response_model=EventResponse)
 def create_event(event: EventCreate, db: Session = Depends(get_db), sync_firebase: bool = True):
     """Create a new event (optionally syncs to Firebase if available)"""
@@ -58,11 +116,12 @@ def create_event(event: EventCreate, db: Session = Depends(get_db), sync_firebas
         focus_score=event.focus_score,
         load_score=event.load_score,
         anomaly_score=event.anomaly_score,
-        context=event.context,
+        context_id=ContextStore.get_instance().intern(event.context),
         user_id=event.user_id
     )
     db.add(db_event)
-    db.commit()
+    with DB_COMMIT_SECONDS.time():
+        db.commit()
     db.refresh(db_event)
     
     # Optionally sync to Firebase
@@ -75,15 +134,17 @@ def create_event(event: EventCreate, db: Session = Depends(get_db), sync_firebas
                     "focus_score": db_event.focus_score,
                     "load_score": db_event.load_score,
                     "anomaly_score": db_event.anomaly_score,
-                    "context": db_event.context,
+                    "context": event.context,
                     "user_id": db_event.user_id,
                     "timestamp": db_event.timestamp
                 }
-                firebase_service.insert_event(firebase_data)
+                with FIRESTORE_WRITE_SECONDS.time():
+                    firebase_service.insert_event(firebase_data)
         except Exception as e:
+            FAILED_SYNCS.inc(target="firestore")
             print(f"Warning: Failed to sync event to Firebase: {e}")
     
-    return db_event
+    return event_to_dict(db_event, db)
 
 @app.get("/events", response_model=List[EventResponse])
 def get_events(
@@ -92,16 +153,67 @@ def get_events(
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
-    """Get events with optional filtering"""
-    query = db.query(Event)
+    """Get events with optional filtering
+    
+    Selects plain column tuples and encodes them straight to JSON bytes: ORM
+    hydration and per-row EventResponse validation dominate large pages.
+    The response has the EventResponse schema.
+    """
+    query = select(*EVENT_RESPONSE_COLUMNS, Event.context_id, Event.context)
     
     if user_id:
-        query = query.filter(Event.user_id == user_id)
+        query = query.where(Event.user_id == user_id)
     if mode:
-        query = query.filter(Event.mode == mode)
+        query = query.where(Event.mode == mode)
     
-    events = query.order_by(Event.timestamp.desc()).limit(limit).all()
-    return events
+    rows = db.execute(query.order_by(Event.timestamp.desc()).limit(limit)).all()
+    contexts = ContextStore.get_instance().lookup(db, {row.context_id for row in rows})
+    events = []
+    for row in rows:
+        event = dict(zip(EVENT_RESPONSE_FIELDS, row))
+        event["context"] = contexts.get(row.context_id, {}) if row.context_id is not None else row.context or {}
+        events.append(event)
+    return Response(content=dumps_bytes(events), media_type="application/json")
+
+@app.get("/events/series")
+def get_event_series(
+    user_id: Optional[str] = None,
+    mode: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 500,
+    method: str = "minmax",
+    metrics: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Downsampled score series for charts; at most `points` points whatever the time range
+
+    method=minmax returns min/max/mean per time bucket (aggregated in SQL),
+    method=lttb returns the raw points Largest-Triangle-Three-Buckets keeps.
+    Defaults to the last 7 days.
+    """
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of: {', '.join(METHODS)}")
+    columns = [m.strip() for m in metrics.split(",") if m.strip()] if metrics else list(SERIES_COLUMNS)
+    unknown = [column for column in columns if column not in SERIES_COLUMNS]
+    if unknown or not columns:
+        raise HTTPException(status_code=400, detail=f"metrics must be among: {', '.join(SERIES_COLUMNS)}")
+    end = as_naive_utc(end) if end else datetime.utcnow()
+    start = as_naive_utc(start) if start else end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    points = min(max(points, 3), MAX_POINTS)
+
+    series = (minmax_series if method == "minmax" else lttb_series)(db, user_id, mode, start, end, points, columns)
+    return {
+        "user_id": user_id,
+        "mode": mode,
+        "start": start,
+        "end": end,
+        "method": method,
+        "points": points,
+        **series
+    }
 
 @app.get("/events/{event_id}", response_model=EventResponse)
 def get_event(event_id: int, db: Session = Depends(get_db)):
@@ -109,20 +221,46 @@ def get_event(event_id: int, db: Session = Depends(get_db)):
     event = db.query(Event).filter(Event.id == event_id).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
-    return event
+    return event_to_dict(event, db)
 
 @app.get("/users")
 def get_users(db: Session = Depends(get_db)):
-    """Get list of all users"""
-    users = db.query(Event.user_id).distinct().all()
-    return [user[0] for user in users]
+    """Get list of all users, including those whose events are all compacted"""
+    users = select(Event.user_id).union(select(EventRollup.user_id).where(EventRollup.resolution == HOUR))
+    return [user[0] for user in db.execute(users).all()]
 
 @app.get("/stats/{user_id}")
 def get_user_stats(user_id: str, db: Session = Depends(get_db)):
-    """Get statistics for a user"""
-    events = db.query(Event).filter(Event.user_id == user_id).all()
+    """Get statistics for a user, overall and per mode
     
-    if not events:
+    Aggregated in the database: from the hourly stats aggregate on
+    PostgreSQL (see backend/postgres.py), which outlives compacted events;
+    otherwise from events plus the hourly rollups of compacted ones.
+    """
+    if db.bind.dialect.name == "postgresql" and postgres.has_stats_aggregate(db.connection()):
+        rows = postgres.stats_by_mode(db.connection(), user_id)
+    else:
+        raw = (
+            select(func.coalesce(Event.mode, "").label("mode"), func.count().label("count"),
+                   func.sum(Event.focus_score).label("focus"), func.sum(Event.load_score).label("load"),
+                   func.sum(Event.anomaly_score).label("anomaly"))
+            .where(Event.user_id == user_id)
+            .group_by(func.coalesce(Event.mode, ""))
+        )
+        compacted = (
+            select(EventRollup.mode, EventRollup.count, EventRollup.focus_sum, EventRollup.load_sum,
+                   EventRollup.anomaly_sum)
+            .where(EventRollup.user_id == user_id, EventRollup.resolution == HOUR)
+        )
+        combined = raw.union_all(compacted).subquery()
+        rows = db.execute(
+            select(combined.c.mode, func.sum(combined.c.count), func.sum(combined.c.focus),
+                   func.sum(combined.c.load), func.sum(combined.c.anomaly))
+            .group_by(combined.c.mode)
+        ).all()
+    
+    total = sum(row[1] for row in rows)
+    if not total:
         return {
             "user_id": user_id,
             "total_events": 0,
@@ -131,15 +269,58 @@ def get_user_stats(user_id: str, db: Session = Depends(get_db)):
             "avg_anomaly": 0
         }
     
+    def averages(count, focus, load, anomaly):
+        return {
+            "total_events": count,
+            "avg_focus": (focus or 0) / count,
+            "avg_load": (load or 0) / count,
+            "avg_anomaly": (anomaly or 0) / count,
+        }
+    
     return {
         "user_id": user_id,
-        "total_events": len(events),
-        "avg_focus": sum(e.focus_score for e in events) / len(events),
-        "avg_load": sum(e.load_score for e in events) / len(events),
-        "avg_anomaly": sum(e.anomaly_score for e in events) / len(events),
-        "modes": {}
+        **averages(total, *(sum(row[i] or 0 for row in rows) for i in (2, 3, 4))),
+        "modes": {mode or "": averages(*values) for mode, *values in rows}
     }
 
+@app.get("/sessions")
+def get_sessions(user_id: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
+    """List recording sessions with their summaries, newest first"""
+    query = db.query(RecordingSession)
+    if user_id:
+        query = query.filter(RecordingSession.user_id == user_id)
+    sessions = query.order_by(RecordingSession.started_at.desc()).limit(limit).all()
+    return [session_to_dict(session) for session in sessions]
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: int, db: Session = Depends(get_db)):
+    """Get a recording session and its summary"""
+    session = db.get(RecordingSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session_to_dict(session)
+
+@app.get("/recommendations/{user_id}")
+def get_recommendation(user_id: str, mode: Optional[str] = None, db: Session = Depends(get_db)):
+    """Recommend a relaxation action from the user's recent events
+    
+    Read-only: outcomes are only learned from recommendations issued over
+    the WebSocket, where the score stream that follows them is observed.
+    """
+    recent = db.query(Event).filter(Event.user_id == user_id).order_by(Event.timestamp.desc()).limit(60).all()
+    recent.reverse()
+    recommender = Recommender.get_instance()
+    state = recommender.state_from_events(recent)
+    latest = recent[-1] if recent else None
+    recommendation = recommender.recommend(
+        user_id,
+        mode or (latest.mode if latest else "background"),
+        ContextStore.get_instance().resolve(db, latest.context_id, latest.context) if latest else {},
+        state=state,
+        track=False
+    )
+    return {"user_id": user_id, **recommendation}
+
 # ==================== Firebase Endpoints ====================
 
 @app.get("/firebase/status")
@@ -1,115 +1,230 @@
 """
 Auto-detect Ganglion board and BLE dongle
 Similar to OpenBCI GUI's auto-detection
+
+Candidate dongle ports are probed concurrently in worker threads, each with
+its own timeout, and the first port that opens a session wins. The last
+working port/MAC is cached to a local file and tried first next time.
 """
 import os
+import json
 import glob
-import subprocess
-import platform
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Any
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
 
-def find_ble_dongle_ports():
+# Seconds BrainFlow may spend discovering a Ganglion on one port
+PROBE_TIMEOUT = int(os.getenv("GANGLION_PROBE_TIMEOUT", "8"))
+CACHE_PATH = os.getenv(
+    "GANGLION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".ganglion_cache.json"),
+)
+
+# Check both cu and tty ports (prefer cu for OpenBCI on macOS)
+PORT_PATTERNS = [
+    "/dev/cu.usbserial*",  # Prefer cu ports (matches usbserial-XXX and usbserialXXX)
+    "/dev/cu.usbmodem*",
+    "/dev/cu.USB-Serial*",
+    "/dev/cu.BLED*",
+    "/dev/cu.SLAB_USBtoUART*",
+    "/dev/tty.usbserial*",  # Fallback to tty
+    "/dev/tty.usbmodem*",
+    "/dev/tty.USB-Serial*",
+    "/dev/tty.BLED*",
+    "/dev/tty.SLAB_USBtoUART*",
+]
+SKIP_TERMS = ("bluetooth", "debug")
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+def find_ble_dongle_ports() -> List[str]:
     """Find BLE dongle serial ports on macOS
-    
+
     On macOS, OpenBCI devices should use /dev/cu.* ports, not /dev/tty.*
     """
-    # Check both tty and cu ports (prefer cu for OpenBCI)
-    patterns = [
-        "/dev/cu.usbserial-*",  # Prefer cu ports
-        "/dev/cu.usbmodem-*",
-        "/dev/cu.USB-Serial-*",
-        "/dev/cu.BLED*",
-        "/dev/cu.SLAB_USBtoUART*",
-        "/dev/tty.usbserial-*",  # Fallback to tty
-        "/dev/tty.usbmodem-*",
-        "/dev/tty.USB-Serial-*",
-        "/dev/tty.BLED*",
-        "/dev/tty.SLAB_USBtoUART*",
-    ]
-    
-    ports = []
     cu_ports = []  # Prefer cu ports
     tty_ports = []
-    
-    for pattern in patterns:
-        found = glob.glob(pattern)
-        for port in found:
+
+    for pattern in PORT_PATTERNS:
+        for port in glob.glob(pattern):
             # Skip common non-BLE ports
-            if 'Bluetooth' not in port and 'debug' not in port.lower():
-                if '/dev/cu.' in port:
-                    cu_ports.append(port)
-                else:
-                    tty_ports.append(port)
-    
+            if any(term in port.lower() for term in SKIP_TERMS):
+                continue
+            target = cu_ports if '/dev/cu.' in port else tty_ports
+            if port not in target:
+                target.append(port)
+
     # Return cu ports first (preferred for OpenBCI), then tty ports
     return cu_ports + tty_ports
 
-def try_connect_ganglion(mac_address=None, dongle_port=None):
+def load_cached_connection() -> Optional[Dict[str, Any]]:
+    """Return the last working connection parameters, if any"""
+    try:
+        with open(CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_cached_connection(dongle_port: str, mac_address: Optional[str] = None):
+    try:
+        with open(CACHE_PATH, "w") as f:
+            json.dump({"dongle_port": dongle_port, "mac_address": mac_address, "saved_at": time.time()}, f)
+    except OSError as e:
+        print(f"Warning: Could not cache Ganglion connection: {e}")
+
+def _board_params(dongle_port: Optional[str], mac_address: Optional[str], timeout: int) -> BrainFlowInputParams:
+    params = BrainFlowInputParams()
+    if mac_address:
+        params.mac_address = mac_address
+    if dongle_port:
+        params.serial_port = dongle_port
+    # Bounds BrainFlow's BLE discovery instead of its much longer default
+    params.timeout = timeout
+    return params
+
+def try_connect_ganglion(mac_address=None, dongle_port=None, timeout: int = PROBE_TIMEOUT):
     """Try to connect to Ganglion with given parameters"""
     try:
-        params = BrainFlowInputParams()
-        if mac_address:
-            params.mac_address = mac_address
-        if dongle_port:
-            params.serial_port = dongle_port
-        
-        board = BoardShim(BoardIds.GANGLION_BOARD, params)
+        board = BoardShim(BoardIds.GANGLION_BOARD, _board_params(dongle_port, mac_address, timeout))
         board.prepare_session()
         board.release_session()
         return True
     except Exception as e:
         return False
 
+def detect_ganglion(ports: Optional[List[str]] = None, mac_address: Optional[str] = None,
+                    board_id: int = BoardIds.GANGLION_BOARD, timeout: int = PROBE_TIMEOUT,
+                    progress: Optional[ProgressCallback] = None, keep_session: bool = False,
+                    use_cache: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Probe candidate dongle ports concurrently and return the first that connects
+
+    Args:
+        ports: Ports to probe (defaults to find_ble_dongle_ports())
+        mac_address: Optional Ganglion MAC; otherwise BrainFlow scans for one
+        board_id: BrainFlow board id to open
+        timeout: Per-port discovery timeout in seconds
+        progress: Called from worker threads with {"stage", "port", "message"} dicts
+        keep_session: Return the winning BoardShim with its session still prepared
+        use_cache: Try the cached port first and update the cache on success
+
+    Returns:
+        {"dongle_port", "mac_address", "method", "elapsed", "board"} or None
+    """
+    def report(stage: str, message: str, port: Optional[str] = None):
+        if progress:
+            try:
+                progress({"stage": stage, "port": port, "message": message})
+            except Exception as e:
+                print(f"Warning: progress callback failed: {e}")
+
+    started = time.monotonic()
+    if ports is None:
+        ports = find_ble_dongle_ports()
+    ports = list(ports)
+
+    # Try the last working port on its own first; it almost always still works
+    cached = load_cached_connection() if use_cache else None
+    if cached and cached.get("dongle_port"):
+        cached_port = cached["dongle_port"]
+        mac_address = mac_address or cached.get("mac_address")
+        if cached_port in ports or os.path.exists(cached_port):
+            ports = [p for p in ports if p != cached_port]
+            report("cache", f"Trying last working port {cached_port}", cached_port)
+            result = _probe_all([cached_port], mac_address, board_id, timeout, report, keep_session)
+            if result:
+                result["method"] = "cache"
+                result["elapsed"] = time.monotonic() - started
+                return result
+
+    if not ports:
+        report("failed", "No candidate dongle ports found")
+        return None
+
+    report("scan", f"Probing {len(ports)} port(s) in parallel: {', '.join(ports)}")
+    result = _probe_all(ports, mac_address, board_id, timeout, report, keep_session)
+    if result is None:
+        report("failed", "No Ganglion responded on any port")
+        return None
+    result["method"] = "auto-detect"
+    result["elapsed"] = time.monotonic() - started
+    if use_cache:
+        save_cached_connection(result["dongle_port"], result["mac_address"])
+    return result
+
+def _probe_all(ports: List[str], mac_address: Optional[str], board_id: int, timeout: int,
+               report: Callable, keep_session: bool) -> Optional[Dict[str, Any]]:
+    """Race prepare_session() across ports; losers release their sessions"""
+    winner: Dict[str, Any] = {}
+    lock = threading.Lock()
+
+    def probe(port: str) -> bool:
+        report("probe", f"Trying dongle port {port}", port)
+        try:
+            board = BoardShim(board_id, _board_params(port, mac_address, timeout))
+            board.prepare_session()
+        except Exception as e:
+            error_msg = str(e)
+            if "timeout" in error_msg.lower() or "discovery" in error_msg.lower():
+                report("timeout", f"Timeout on {port} - Ganglion might not be powered on or in range", port)
+            else:
+                report("error", f"Failed on {port}: {error_msg}", port)
+            return False
+        with lock:
+            won = not winner
+            if won:
+                winner.update({"dongle_port": port, "mac_address": mac_address,
+                               "board": board if keep_session else None})
+        if not (won and keep_session):
+            board.release_session()
+        if not won:
+            return False
+        report("connected", f"Ganglion found via {port}", port)
+        return True
+
+    executor = ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="ganglion-probe")
+    futures = {executor.submit(probe, port) for port in ports}
+    # Worker threads cannot be interrupted, so give BrainFlow a little slack past its own timeout
+    deadline = time.monotonic() + timeout + 5
+    try:
+        while futures and time.monotonic() < deadline:
+            done, futures = wait(futures, timeout=deadline - time.monotonic(), return_when=FIRST_COMPLETED)
+            if any(f.result() for f in done):
+                break
+    finally:
+        # Stragglers finish in the background and release any session they open
+        executor.shutdown(wait=False)
+    with lock:
+        if not winner:
+            # Make late successes release their sessions
+            winner["abandoned"] = True
+            return None
+        return dict(winner)
+
 def auto_detect_ganglion():
     """Auto-detect Ganglion connection"""
     print("Scanning for BLE dongle...")
-    
+
     # Find BLE dongle ports
     dongle_ports = find_ble_dongle_ports()
-    
+
     if not dongle_ports:
         print("No BLE dongle found. Checking USB ports...")
         # Try all USB ports
         all_usb = glob.glob("/dev/tty.*")
         dongle_ports = [p for p in all_usb if 'usb' in p.lower() or 'serial' in p.lower()]
-    
+
     print(f"Found {len(dongle_ports)} potential dongle port(s):")
     for port in dongle_ports:
         print(f"  - {port}")
-    
-    # Try each dongle port without MAC address (let BrainFlow scan)
-    for dongle_port in dongle_ports:
-        print(f"\nTrying dongle port: {dongle_port}")
-        print("  (Letting BrainFlow auto-detect Ganglion MAC address...)")
-        print("  This may take 10-15 seconds...")
-        
-        try:
-            params = BrainFlowInputParams()
-            params.serial_port = dongle_port
-            # Don't specify MAC - let BrainFlow scan for it
-            
-            board = BoardShim(BoardIds.GANGLION_BOARD, params)
-            board.prepare_session()
-            print(f"  ✅ Successfully connected via {dongle_port}!")
-            print(f"  ✅ Ganglion auto-detected!")
-            
-            # Get the MAC address if possible
-            board.release_session()
-            
-            return {
-                "dongle_port": dongle_port,
-                "mac_address": None,  # Auto-detected
-                "method": "auto-detect"
-            }
-        except Exception as e:
-            error_msg = str(e)
-            if "timeout" in error_msg.lower() or "discovery" in error_msg.lower():
-                print(f"  ⚠️  Timeout - Ganglion might not be powered on or in range")
-            else:
-                print(f"  ❌ Failed: {error_msg}")
-            continue
-    
-    return None
+    print(f"  (Letting BrainFlow auto-detect Ganglion MAC address, up to {PROBE_TIMEOUT}s per port...)")
+
+    def progress(event):
+        print(f"  [{event['stage']}] {event['message']}")
+
+    return detect_ganglion(dongle_ports, progress=progress)
 
 def main():
     """Main auto-detection function"""
@@ -121,12 +236,12 @@ def main():
     print("  1. Ganglion is powered on (LED blinking)")
     print("  2. BLE dongle is plugged in")
     print()
-    
+
     result = auto_detect_ganglion()
-    
+
     if result:
         print("\n" + "=" * 60)
-        print("✅ Auto-detection successful!")
+        print(f"✅ Auto-detection successful! ({result['elapsed']:.1f}s)")
         print("=" * 60)
         print()
         print("Add to your .env file:")
@@ -151,4 +266,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
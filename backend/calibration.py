@@ -0,0 +1,252 @@
+"""
+Per-user adaptive baseline normalization
+Keeps streaming per-feature means and variances for each user and headset,
+and maps raw scores to z-scores and percentiles against that baseline
+
+Baselines are read and written in worker threads, so a slow database
+(SQLite holding its write lock) never stalls the event loop.
+"""
+import asyncio
+import math
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from backend.database import SessionLocal, Baseline
+
+# Band powers are tracked in log10 space, where they are much closer to normal
+BAND_FEATURES = ("alpha", "beta", "theta", "gamma")
+SCORE_FEATURES = ("focus_score", "load_score", "anomaly_score")
+FEATURES = BAND_FEATURES + SCORE_FEATURES
+_NUM_BANDS = len(BAND_FEATURES)
+
+# EWMA weight applied to each post-calibration tick, so the baseline follows slow drift
+ADAPT_RATE = float(os.getenv("BASELINE_ADAPT_RATE", "0.002"))
+# Persist adapted baselines every N ticks rather than on every update
+PERSIST_EVERY = int(os.getenv("BASELINE_PERSIST_EVERY", "60"))
+MIN_CALIBRATION_SAMPLES = 5
+# A capture still open this long past its deadline (its timer was lost) is finished by the next tick
+CALIBRATION_GRACE_SECONDS = float(os.getenv("CALIBRATION_GRACE_SECONDS", "5"))
+_EPS = 1e-12
+
+
+def _feature_vector(bandpowers: dict) -> np.ndarray:
+    values = np.fromiter((bandpowers[name] for name in FEATURES), dtype=float, count=len(FEATURES))
+    values[:_NUM_BANDS] = np.log10(np.maximum(values[:_NUM_BANDS], _EPS))
+    return values
+
+
+def _percentile(z: float) -> float:
+    """Standard normal CDF scaled to 0-100"""
+    return 50.0 * (1.0 + math.erf(z / math.sqrt(2.0)))
+
+
+class BaselineProfile:
+    """Streaming feature statistics for one user on one board
+
+    Calibration uses Welford's algorithm for an exact mean/variance of the
+    baseline capture; afterwards an EWMA of the same statistics adapts slowly.
+    Memory is a handful of fixed-size vectors regardless of session length.
+    """
+
+    def __init__(self, user_id: str, board_id: int):
+        self.user_id = user_id
+        self.board_id = board_id
+        size = len(FEATURES)
+        # Welford state for the active calibration
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        # Adaptive baseline used for normalization
+        self.ewma_mean = np.zeros(size)
+        self.ewma_var = np.ones(size)
+        self.calibrated_at: Optional[datetime] = None
+        self.updates_since_persist = 0
+
+    @property
+    def is_calibrated(self) -> bool:
+        return self.calibrated_at is not None
+
+    def reset_calibration(self):
+        self.count = 0
+        self.mean[:] = 0.0
+        self.m2[:] = 0.0
+
+    def add_calibration_sample(self, values: np.ndarray):
+        """Welford update, O(features) per sample"""
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    def finish_calibration(self) -> bool:
+        if self.count < MIN_CALIBRATION_SAMPLES:
+            return False
+        self.ewma_mean = self.mean.copy()
+        self.ewma_var = np.maximum(self.m2 / (self.count - 1), _EPS)
+        self.calibrated_at = datetime.utcnow()
+        return True
+
+    def adapt(self, values: np.ndarray, rate: float = ADAPT_RATE):
+        """Exponentially weighted mean/variance update"""
+        delta = values - self.ewma_mean
+        self.ewma_mean += rate * delta
+        self.ewma_var = (1.0 - rate) * (self.ewma_var + rate * delta * delta)
+        self.updates_since_persist += 1
+
+    def zscores(self, values: np.ndarray) -> np.ndarray:
+        return (values - self.ewma_mean) / np.sqrt(np.maximum(self.ewma_var, _EPS))
+
+    def baseline_scores(self) -> Dict[str, float]:
+        """Mean raw scores of the baseline, for display"""
+        return {name: float(self.ewma_mean[_NUM_BANDS + i]) for i, name in enumerate(SCORE_FEATURES)}
+
+    def to_stats(self) -> dict:
+        return {
+            "features": list(FEATURES),
+            "count": self.count,
+            "mean": self.ewma_mean.tolist(),
+            "var": self.ewma_var.tolist(),
+        }
+
+    @classmethod
+    def from_row(cls, row: Baseline) -> "BaselineProfile":
+        profile = cls(row.user_id, row.board_id)
+        stats = row.stats or {}
+        if stats.get("features") == list(FEATURES):
+            profile.count = stats.get("count", 0)
+            profile.ewma_mean = np.asarray(stats["mean"], dtype=float)
+            profile.ewma_var = np.asarray(stats["var"], dtype=float)
+            profile.calibrated_at = row.calibrated_at
+        return profile
+
+
+def normalize(profile: BaselineProfile, bandpowers: dict) -> dict:
+    """Normalize one tick against a calibrated profile in constant time, then adapt the profile"""
+    values = _feature_vector(bandpowers)
+    z = profile.zscores(values)
+    zscores = {name: round(float(value), 4) for name, value in zip(FEATURES, z)}
+    bandpowers["z"] = zscores
+    for name in ("focus_score", "load_score"):
+        bandpowers[f"raw_{name}"] = bandpowers[name]
+        bandpowers[name] = _percentile(zscores[name])
+    profile.adapt(values)
+    return bandpowers
+
+
+def load_profile(user_id: str, board_id: int) -> Optional[BaselineProfile]:
+    """Read a user's saved baseline for a board (blocking)"""
+    db = SessionLocal()
+    try:
+        row = db.query(Baseline).filter(Baseline.user_id == user_id, Baseline.board_id == board_id).first()
+        return BaselineProfile.from_row(row) if row else None
+    except Exception as e:
+        print(f"Warning: Failed to load baseline for {user_id}: {e}")
+        return None
+    finally:
+        db.close()
+
+
+def store_profile(user_id: str, board_id: int, stats: dict, calibrated_at: Optional[datetime]) -> bool:
+    """Write a baseline snapshot (blocking); returns whether it was saved"""
+    db = SessionLocal()
+    try:
+        row = db.query(Baseline).filter(Baseline.user_id == user_id, Baseline.board_id == board_id).first()
+        if row is None:
+            row = Baseline(user_id=user_id, board_id=board_id)
+            db.add(row)
+        row.stats = stats
+        row.calibrated_at = calibrated_at
+        row.updated_at = datetime.utcnow()
+        db.commit()
+        return True
+    except Exception as e:
+        print(f"Error saving baseline for {user_id}: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+class BaselineNormalizer:
+    """Loads, updates and persists baseline profiles and normalizes each tick"""
+
+    def __init__(self):
+        self.profiles: Dict[Tuple[str, int], BaselineProfile] = {}
+        # (user_id, board_id) -> monotonic time an active calibration is due to end
+        self.calibrations: Dict[Tuple[str, int], float] = {}
+
+    async def get_profile(self, user_id: str, board_id: int) -> BaselineProfile:
+        key = (user_id, int(board_id))
+        profile = self.profiles.get(key)
+        if profile is None:
+            loaded = await asyncio.to_thread(load_profile, *key)
+            # Another tick may have loaded it while this one waited
+            profile = self.profiles.setdefault(key, loaded or BaselineProfile(*key))
+        return profile
+
+    async def save(self, profile: BaselineProfile):
+        # Snapshot on the loop; the arrays keep adapting while the write runs
+        stats, calibrated_at = profile.to_stats(), profile.calibrated_at
+        pending = profile.updates_since_persist
+        if await asyncio.to_thread(store_profile, profile.user_id, profile.board_id, stats, calibrated_at):
+            profile.updates_since_persist = max(profile.updates_since_persist - pending, 0)
+
+    async def start_calibration(self, user_id: str, board_id: int, duration: float):
+        profile = await self.get_profile(user_id, board_id)
+        profile.reset_calibration()
+        self.calibrations[(user_id, int(board_id))] = time.monotonic() + duration
+
+    def is_calibrating(self, user_id: str, board_id: int) -> bool:
+        return (user_id, int(board_id)) in self.calibrations
+
+    def cancel_calibration(self, user_id: str, board_id: int):
+        self.calibrations.pop((user_id, int(board_id)), None)
+
+    async def finish_calibration(self, user_id: str, board_id: int) -> Optional[BaselineProfile]:
+        """End a capture; returns the profile if enough samples were collected
+
+        Returns None, leaving the profile alone, if no capture is active
+        (cancelled, or already finished by process() past its deadline).
+        """
+        if self.calibrations.pop((user_id, int(board_id)), None) is None:
+            return None
+        profile = await self.get_profile(user_id, board_id)
+        if not profile.finish_calibration():
+            return None
+        await self.save(profile)
+        return profile
+
+    async def process(self, user_id: str, board_id: int, bandpowers: dict) -> dict:
+        """
+        Feed one tick through the user's baseline
+
+        While calibrating, the tick only updates the capture. Once calibrated,
+        focus_score/load_score become percentiles of the user's baseline (raw
+        values are kept as raw_*), and z-scores per feature are added.
+        """
+        profile = await self.get_profile(user_id, board_id)
+        ends_at = self.calibrations.get((user_id, int(board_id)))
+        if ends_at is not None:
+            if time.monotonic() < ends_at + CALIBRATION_GRACE_SECONDS:
+                profile.add_calibration_sample(_feature_vector(bandpowers))
+                return bandpowers
+            # Nothing finished the capture on time; don't leave the user calibrating forever
+            print(f"Calibration for {user_id} overran its deadline; finishing it")
+            await self.finish_calibration(user_id, board_id)
+        if not profile.is_calibrated:
+            return bandpowers
+
+        normalize(profile, bandpowers)
+        if profile.updates_since_persist >= PERSIST_EVERY:
+            await self.save(profile)
+        return bandpowers
+
+    async def flush(self):
+        """Persist every profile with unsaved adaptation"""
+        for profile in list(self.profiles.values()):
+            if profile.is_calibrated and profile.updates_since_persist:
+                await self.save(profile)
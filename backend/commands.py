@@ -0,0 +1,165 @@
+"""
+Dispatcher for long-running WebSocket client commands
+
+Cheap commands (set_mode, ack, subscribe, ...) are handled inline by the
+server. Slow ones, like start_recording with its board connect and port
+probing, run here as tracked tasks, so the client's receive loop keeps
+going and it can still change mode, stop or "cancel" meanwhile. Commands
+on the same resource take its lock and run one at a time, in arrival
+order. A client may have MAX_CLIENT_COMMANDS queued or running; past that
+new ones are rejected, so one client can't pile up work for everyone.
+"""
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from backend.metrics import COMMAND_SECONDS, COMMANDS_IN_FLIGHT
+
+MAX_CLIENT_COMMANDS = int(os.getenv("MAX_CLIENT_COMMANDS", "4"))
+# Finished commands kept for status queries
+RECENT_COMMANDS = int(os.getenv("RECENT_COMMANDS", "50"))
+
+# Command states; the last three are final
+QUEUED, RUNNING, CANCELLING, DONE, FAILED, CANCELLED = (
+    "queued", "running", "cancelling", "done", "failed", "cancelled"
+)
+FINAL_STATES = {DONE, FAILED, CANCELLED}
+
+
+class CommandRejected(Exception):
+    """The command wasn't accepted (duplicate id, too many in flight)"""
+
+
+class CommandFailed(Exception):
+    """Raised by a handler that has already told the client what went wrong"""
+
+
+class Command:
+    """One tracked run of a long client command"""
+
+    def __init__(self, command_id: str, name: str, client, resource: str):
+        self.id = command_id
+        self.name = name
+        self.client = client
+        self.resource = resource
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.accepted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state not in FINAL_STATES
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.monotonic()
+        return {
+            "command_id": self.id,
+            "command": self.name,
+            "state": self.state,
+            "error": self.error,
+            "queued_seconds": round((self.started_at or end) - self.accepted_at, 3),
+            "elapsed_seconds": round(end - self.accepted_at, 3),
+        }
+
+
+class CommandDispatcher:
+    """Runs long commands as tasks, serialized per resource and capped per client"""
+
+    def __init__(self, on_update: Callable[[Command], Awaitable[None]],
+                 max_per_client: int = MAX_CLIENT_COMMANDS, keep: int = RECENT_COMMANDS):
+        self.on_update = on_update
+        self.max_per_client = max_per_client
+        self.keep = keep
+        self.commands: "OrderedDict[str, Command]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, client, name: str, run: Callable[[], Awaitable], resource: str,
+               command_id: Optional[str] = None) -> Command:
+        """Start run() as a tracked command; raises CommandRejected"""
+        command_id = str(command_id) if command_id else f"cmd-{next(self._ids)}"
+        existing = self.commands.get(command_id)
+        if existing is not None and existing.active:
+            raise CommandRejected(f"Command {command_id} is already in progress")
+        in_flight = sum(1 for command in self.commands.values() if command.client is client and command.active)
+        if in_flight >= self.max_per_client:
+            raise CommandRejected(f"Too many commands in progress ({in_flight}); wait or cancel one")
+        command = Command(command_id, name, client, resource)
+        self.commands.pop(command_id, None)
+        self.commands[command_id] = command
+        COMMANDS_IN_FLIGHT.inc()
+        command.task = asyncio.create_task(self._run(command, run))
+        # Also covers a task cancelled before it got to run at all
+        command.task.add_done_callback(lambda _: self._finished(command))
+        self._prune()
+        return command
+
+    async def _run(self, command: Command, run: Callable[[], Awaitable]):
+        await self._notify(command)
+        async with self._locks.setdefault(command.resource, asyncio.Lock()):
+            command.state = RUNNING
+            command.started_at = time.monotonic()
+            await self._notify(command)
+            try:
+                await run()
+            except CommandFailed as e:
+                command.state = FAILED
+                command.error = str(e)
+                return
+            except Exception as e:
+                command.state = FAILED
+                command.error = str(e)
+                print(f"Command {command.name} ({command.id}) failed: {type(e).__name__}: {e}")
+                return
+        command.state = DONE
+
+    def _finished(self, command: Command):
+        if command.active:
+            command.state = CANCELLED
+        command.finished_at = time.monotonic()
+        COMMANDS_IN_FLIGHT.dec()
+        COMMAND_SECONDS.observe(command.finished_at - command.accepted_at, command=command.name, state=command.state)
+        asyncio.get_running_loop().create_task(self._notify(command))
+
+    async def _notify(self, command: Command):
+        try:
+            await self.on_update(command)
+        except Exception as e:
+            # The client may be gone; the command carries on regardless
+            print(f"Warning: could not report command {command.id}: {e}")
+
+    def cancel(self, command_id: Optional[str] = None, client=None, name: Optional[str] = None) -> List[Command]:
+        """Cancel one command by id, or every active one of a client and/or name
+
+        With a client, only that client's commands are touched, by id too.
+        """
+        if command_id is not None:
+            command = self.commands.get(str(command_id))
+            targets = [command] if command is not None and (client is None or command.client is client) else []
+        else:
+            targets = [
+                command for command in self.commands.values()
+                if (client is None or command.client is client) and (name is None or command.name == name)
+            ]
+        cancelled = []
+        for command in targets:
+            if command.active and command.state != CANCELLING:
+                command.state = CANCELLING
+                command.task.cancel()
+                cancelled.append(command)
+        return cancelled
+
+    def status(self, client=None) -> List[dict]:
+        """Active and recent commands, oldest first (a client's own, if given)"""
+        return [command.to_dict() for command in self.commands.values() if client is None or command.client is client]
+
+    def _prune(self):
+        finished = [key for key, command in self.commands.items() if not command.active]
+        for key in finished[:max(len(finished) - self.keep, 0)]:
+            del self.commands[key]
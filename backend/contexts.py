@@ -0,0 +1,127 @@
+"""
+Interned event contexts
+
+The context (tab, url, calendar event) only changes on set_context, but
+an event is written every tick. Each distinct context is stored once in
+the contexts table, keyed by a hash of its content, and events reference
+it by id. Recently used hash -> id and id -> context mappings are kept in
+LRU caches so neither the write path nor event listings usually need an
+extra query.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from backend.database import SessionLocal, Context
+
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "1024"))
+
+
+def context_hash(context: dict) -> str:
+    """Hash of the canonical JSON encoding, so key order doesn't matter"""
+    canonical = json.dumps(context, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _LRU:
+    def __init__(self, size: int):
+        self.size = size
+        self.items: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+class ContextStore:
+    """Content-addressed contexts with in-memory LRU caches"""
+
+    _instance = None
+
+    def __init__(self, cache_size: int = CONTEXT_CACHE_SIZE):
+        self._ids = _LRU(cache_size)       # hash -> id
+        self._contexts = _LRU(cache_size)  # id -> context
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide context store"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def intern(self, context: Optional[dict]) -> int:
+        """
+        Id of the contexts row holding context, inserting it if new
+
+        Inserts run in their own short transaction so a unique-hash race with
+        another process (API workers, acquisition) is resolved by re-reading
+        the winner's row without disturbing the caller's transaction.
+        """
+        context = context or {}
+        digest = context_hash(context)
+        with self._lock:
+            context_id = self._ids.get(digest)
+        if context_id is not None:
+            return context_id
+
+        db = SessionLocal()
+        try:
+            context_id = db.execute(select(Context.id).where(Context.hash == digest)).scalar()
+            if context_id is None:
+                row = Context(hash=digest, data=context)
+                db.add(row)
+                try:
+                    db.commit()
+                    context_id = row.id
+                except IntegrityError:
+                    db.rollback()
+                    context_id = db.execute(select(Context.id).where(Context.hash == digest)).scalar_one()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._ids.put(digest, context_id)
+            self._contexts.put(context_id, context)
+        return context_id
+
+    def lookup(self, db, context_ids: Iterable[Optional[int]]) -> Dict[int, dict]:
+        """Contexts by id, querying only ids missing from the cache"""
+        found: Dict[int, dict] = {}
+        missing = set()
+        with self._lock:
+            for context_id in context_ids:
+                if context_id is None or context_id in found:
+                    continue
+                context = self._contexts.get(context_id)
+                if context is None:
+                    missing.add(context_id)
+                else:
+                    found[context_id] = context
+        if missing:
+            rows = db.execute(select(Context.id, Context.data).where(Context.id.in_(missing))).all()
+            with self._lock:
+                for context_id, context in rows:
+                    self._contexts.put(context_id, context)
+                    found[context_id] = context
+        return found
+
+    def resolve(self, db, context_id: Optional[int], inline: Optional[dict]) -> dict:
+        """The context of one event, whether interned or stored inline"""
+        if context_id is None:
+            return inline or {}
+        return self.lookup(db, (context_id,)).get(context_id, {})
@@ -1,7 +1,10 @@
 """
 Database models and setup for NeuroCalm events
 """
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, JSON
+from sqlalchemy import (
+    create_engine, event, inspect, text, Column, Integer, Float, String, DateTime, JSON, ForeignKey,
+    ForeignKeyConstraint, Index
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -19,17 +22,165 @@ class Event(Base):
     focus_score = Column(Float)
     load_score = Column(Float)
     anomaly_score = Column(Float)
-    context = Column(JSON)  # { tab, url, calendar_event_id }
+    # Inline { tab, url, calendar_event_id } of rows written before contexts were
+    # interned; newer rows reference a shared contexts row through context_id
+    context = Column(JSON, nullable=True)
+    context_id = Column(Integer, ForeignKey("contexts.id"), nullable=True, index=True)
     user_id = Column(String, default="default", index=True)
+    # Band powers the scores were computed from, so they can be re-scored later
+    alpha = Column(Float, nullable=True)
+    beta = Column(Float, nullable=True)
+    theta = Column(Float, nullable=True)
+    gamma = Column(Float, nullable=True)
+    score_version = Column(Integer, nullable=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=True, index=True)
+    # Seconds of samples lost (dropout or reconnect) just before this event, if any
+    gap_seconds = Column(Float, nullable=True)
+
+    __table_args__ = (
+        # Per-user time-ordered scans (re-scoring, history)
+        Index("ix_events_user_id_timestamp", "user_id", "timestamp"),
+    )
+
+class Context(Base):
+    """A distinct context blob, stored once and shared by every event recorded under it"""
+    __tablename__ = "contexts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # SHA-256 of the canonical JSON encoding, see backend.contexts.context_hash
+    hash = Column(String(64), unique=True, index=True, nullable=False)
+    data = Column(JSON)  # { tab, url, calendar_event_id }
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RecordingSession(Base):
+    """One recording, from start_recording to stop_recording"""
+    __tablename__ = "sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, default="default", index=True)
+    board_id = Column(Integer)
+    started_at = Column(DateTime, default=datetime.utcnow, index=True)
+    ended_at = Column(DateTime, nullable=True)
+    status = Column(String, default="recording")  # recording, completed, interrupted
+    mode_segments = Column(JSON)  # [{ mode, start, end }]
+    summary = Column(JSON)  # see backend.sessions.SessionSummary.to_dict
+    firestore_id = Column(String, nullable=True)
+
+class EventRollup(Base):
+    """Per-minute or per-hour aggregate of compacted events (see backend/retention.py)"""
+    __tablename__ = "event_rollups"
+
+    resolution = Column(Integer, primary_key=True)  # bucket width in seconds: 60 or 3600
+    user_id = Column(String, primary_key=True)
+    mode = Column(String, primary_key=True)  # "" for events without one
+    bucket = Column(DateTime, primary_key=True)  # bucket start, naive UTC
+    count = Column(Integer, nullable=False)
+    focus_sum = Column(Float)
+    focus_min = Column(Float)
+    focus_max = Column(Float)
+    load_sum = Column(Float)
+    load_min = Column(Float)
+    load_max = Column(Float)
+    anomaly_sum = Column(Float)
+    anomaly_min = Column(Float)
+    anomaly_max = Column(Float)
+
+    __table_args__ = (
+        # Time-range scans per tier (charts, expiring minute rollups)
+        Index("ix_event_rollups_resolution_bucket", "resolution", "bucket"),
+    )
+
+def _events_not_partitioned(ddl, target, bind, **kw) -> bool:
+    # On PostgreSQL events are partitioned by time (see backend/postgres.py), and a
+    # partitioned table can't have a unique key on id alone for others to reference
+    return kw["dialect"].name != "postgresql"
+
+class EventScore(Base):
+    """Scores recomputed for an event under a given scoring version"""
+    __tablename__ = "event_scores"
+    
+    event_id = Column(Integer, primary_key=True)
+    score_version = Column(Integer, primary_key=True, index=True)
+    focus_score = Column(Float)
+    load_score = Column(Float)
+    anomaly_score = Column(Float)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        ForeignKeyConstraint(["event_id"], ["events.id"], ondelete="CASCADE").ddl_if(
+            callable_=_events_not_partitioned),
+    )
+
+class Baseline(Base):
+    """Per-user, per-board calibration baseline (streaming feature statistics)"""
+    __tablename__ = "baselines"
+    
+    user_id = Column(String, primary_key=True)
+    board_id = Column(Integer, primary_key=True)
+    stats = Column(JSON)  # { features, count, mean, var }
+    calibrated_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./neurocalm.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+if "sqlite" in DATABASE_URL:
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+else:
+    # Server databases: size the pool for concurrent headsets and drop dead connections
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_pre_ping=True,
+    )
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # Several processes (API workers, acquisition, re-scoring) share the file:
+        # WAL lets readers run alongside the writer, and writers wait instead of failing
+        cursor = dbapi_connection.cursor()
+        # Lets retention return freed pages a few at a time; only takes effect on a new
+        # database, before WAL is set up (see backend/retention.py to convert an old one)
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
     """Initialize database tables"""
+    if engine.dialect.name == "postgresql":
+        from backend.postgres import create_events_table, setup_storage
+        # Must come first: create_all would make events an ordinary table
+        create_events_table(engine)
     Base.metadata.create_all(bind=engine)
+    migrate_db()
+    if engine.dialect.name == "postgresql":
+        setup_storage(engine)
+
+def migrate_db():
+    """Add model columns and indexes missing from existing tables
+    
+    create_all() never alters a table that already exists, so columns and
+    indexes added to a model later are added here. Only nullable columns
+    without server defaults are handled, which is all this is meant for.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                print(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 def get_db():
     """Get database session"""
@@ -0,0 +1,263 @@
+"""
+Server-side downsampling of event score series for history charts
+
+Two methods, both returning at most the requested number of points however
+long the time range is:
+- "minmax": fixed-width time buckets with min/max/mean per score, aggregated
+  in SQL so only one row per bucket leaves the database; history compacted
+  by retention is read from the minute/hour rollups
+- "lttb": Largest-Triangle-Three-Buckets over the raw scores, which keeps
+  the visual shape (peaks and dips) of a line with far fewer points; ranges
+  holding more than LTTB_MAX_RAW_ROWS events run it over the min and max of
+  LTTB_SUB_BUCKETS x points sub-buckets, aggregated in SQL; history
+  compacted by retention joins in as min/max pairs from the rollups
+"""
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, func, cast, Integer, Float
+from sqlalchemy.orm import Session
+
+from backend.database import Event, EventRollup
+from backend.retention import MINUTE, HOUR, minute_horizon
+
+SERIES_COLUMNS = ("focus_score", "load_score", "anomaly_score")
+METHODS = ("minmax", "lttb")
+MAX_POINTS = 5000
+LTTB_MAX_RAW_ROWS = int(os.getenv("LTTB_MAX_RAW_ROWS", "50000"))
+LTTB_SUB_BUCKETS = 4
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps
+
+    The first and last points are always kept; the rest are split into
+    threshold - 2 buckets and each bucket keeps the point forming the largest
+    triangle with the previously kept point and the next bucket's average.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / sizes
+    avg_y = np.add.reduceat(y[:n - 1], edges[:-1]) / sizes
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 1 < threshold - 2:
+            next_x, next_y = avg_x[i + 1], avg_y[i + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        px, py = x[previous], y[previous]
+        areas = np.abs((px - next_x) * (y[start:stop] - py) - (px - x[start:stop]) * (next_y - py))
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def _filters(user_id: Optional[str], mode: Optional[str], start: datetime, end: datetime) -> list:
+    conditions = [Event.timestamp >= start, Event.timestamp < end]
+    if user_id:
+        conditions.append(Event.user_id == user_id)
+    if mode:
+        conditions.append(Event.mode == mode)
+    return conditions
+
+
+def _bucket_index(db: Session, column, start: datetime, width: float):
+    position = (_epoch_seconds(db, column) - _naive_epoch(start)) / width
+    # Rows are filtered to >= start, so truncating equals flooring;
+    # other dialects round on cast, so floor explicitly there
+    if db.get_bind().dialect.name != "sqlite":
+        position = func.floor(position)
+    return cast(position, Integer)
+
+
+def _rollup_buckets(db: Session, user_id: Optional[str], mode: Optional[str], start: datetime, end: datetime,
+                    width: float, columns: Sequence[str]) -> list:
+    """Bucketed compacted history: minute rollups while they're kept, hourly ones before that"""
+    horizon = minute_horizon(db)
+    if horizon is None:
+        tier = EventRollup.resolution == HOUR
+    else:
+        tier = ((EventRollup.resolution == MINUTE) & (EventRollup.bucket >= horizon)) \
+            | ((EventRollup.resolution == HOUR) & (EventRollup.bucket < horizon))
+    conditions = [EventRollup.bucket >= start, EventRollup.bucket < end, tier]
+    if user_id:
+        conditions.append(EventRollup.user_id == user_id)
+    if mode:
+        conditions.append(EventRollup.mode == mode)
+    aggregates = [func.sum(EventRollup.count).label("count")]
+    for column in columns:
+        prefix = column.split("_")[0]
+        aggregates += [
+            cast(func.sum(getattr(EventRollup, f"{prefix}_sum")), Float).label(f"{column}_sum"),
+            func.min(getattr(EventRollup, f"{prefix}_min")).label(f"{column}_min"),
+            func.max(getattr(EventRollup, f"{prefix}_max")).label(f"{column}_max"),
+        ]
+    bucket = _bucket_index(db, EventRollup.bucket, start, width)
+    return db.execute(select(bucket.label("bucket"), *aggregates).where(*conditions).group_by("bucket")).all()
+
+
+def _fold_rollups(rows: list, rollups: list, columns: Sequence[str]) -> list:
+    """Fold rollup buckets into the raw ones, as dicts shaped like the raw rows"""
+    merged = {row.bucket: dict(row._mapping) for row in rows}
+    for rollup in rollups:
+        values = rollup._mapping
+        row = merged.get(rollup.bucket)
+        if row is None:
+            row = merged[rollup.bucket] = {"bucket": rollup.bucket, "count": 0}
+            for column in columns:
+                row.update({f"{column}_mean": None, f"{column}_min": None, f"{column}_max": None})
+        count = int(values["count"] or 0)
+        total = row["count"] + count
+        for column in columns:
+            extra = values[f"{column}_sum"]
+            if extra is not None and total:
+                row[f"{column}_mean"] = ((row[f"{column}_mean"] or 0) * row["count"] + extra) / total
+            for suffix, pick in (("min", min), ("max", max)):
+                found = [v for v in (row[f"{column}_{suffix}"], values[f"{column}_{suffix}"]) if v is not None]
+                row[f"{column}_{suffix}"] = pick(found) if found else None
+        row["count"] = total
+    return [merged[key] for key in sorted(merged)]
+
+
+def _epoch_seconds(db: Session, column):
+    """Dialect-specific seconds-since-epoch expression for a naive UTC timestamp"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        # julianday is a float number of days; round to the millisecond so timestamps
+        # on a bucket boundary don't land a hair before it
+        return func.round((func.julianday(column) - 2440587.5) * 86400000.0) / 1000.0
+    if dialect == "mysql":
+        return func.unix_timestamp(column)
+    return func.extract("epoch", column)
+
+
+def _isoformat(seconds: np.ndarray) -> List[str]:
+    milliseconds = np.round(np.asarray(seconds) * 1000).astype(np.int64)
+    return [str(value) for value in milliseconds.astype("datetime64[ms]")]
+
+
+def _event_buckets(db: Session, user_id: Optional[str], mode: Optional[str], start: datetime, end: datetime,
+                   width: float, columns: Sequence[str]) -> list:
+    """Raw events bucketed in SQL: count and min/max/mean per score"""
+    bucket = _bucket_index(db, Event.timestamp, start, width)
+    aggregates = [func.count().label("count")]
+    for column in columns:
+        attribute = getattr(Event, column)
+        aggregates += [
+            cast(func.avg(attribute), Float).label(f"{column}_mean"),
+            func.min(attribute).label(f"{column}_min"),
+            func.max(attribute).label(f"{column}_max"),
+        ]
+    query = (
+        select(bucket.label("bucket"), *aggregates)
+        .where(*_filters(user_id, mode, start, end))
+        .group_by("bucket")
+        .order_by("bucket")
+    )
+    return db.execute(query).all()
+
+
+def minmax_series(db: Session, user_id: Optional[str], mode: Optional[str], start: datetime, end: datetime,
+                  points: int, columns: Sequence[str] = SERIES_COLUMNS) -> dict:
+    """Min/max/mean of each score per fixed-width time bucket, grouped in SQL"""
+    width = max((end - start).total_seconds() / points, 1e-3)
+    result = _event_buckets(db, user_id, mode, start, end, width, columns)
+    rollups = _rollup_buckets(db, user_id, mode, start, end, width, columns)
+    rows = _fold_rollups(result, rollups, columns) if rollups else [row._mapping for row in result]
+    buckets = np.array([min(row["bucket"], points - 1) for row in rows], dtype=float)
+    series = {}
+    for column in columns:
+        series[column] = {
+            "mean": [row[f"{column}_mean"] for row in rows],
+            "min": [row[f"{column}_min"] for row in rows],
+            "max": [row[f"{column}_max"] for row in rows],
+        }
+    return {
+        "bucket_seconds": width,
+        "timestamps": _isoformat(_naive_epoch(start) + buckets * width),
+        "counts": [row["count"] for row in rows],
+        "total_events": int(sum(row["count"] for row in rows)),
+        "series": series,
+    }
+
+
+def _min_max_points(rows: list, start: datetime, width: float, columns: Sequence[str]):
+    """Each bucket's min and max, a quarter and three quarters of the way through it"""
+    origin = _naive_epoch(start) + np.array([row["bucket"] for row in rows], dtype=float) * width
+    seconds = np.column_stack([origin + width / 4, origin + width * 3 / 4]).ravel()
+    values = [np.array([(row[f"{column}_min"], row[f"{column}_max"]) for row in rows], dtype=float).ravel()
+              for column in columns]
+    return seconds, values
+
+
+def _lttb_input(db: Session, user_id: Optional[str], mode: Optional[str], start: datetime, end: datetime,
+                points: int, columns: Sequence[str]):
+    """
+    Timestamps, one value array per score and the event count to run LTTB on
+
+    Up to LTTB_MAX_RAW_ROWS events are read as they are; past that each
+    sub-bucket contributes its min and max, so spikes survive without every
+    row leaving SQL. History compacted by retention joins in the same way
+    from its rollups.
+    """
+    width = max((end - start).total_seconds() / (points * LTTB_SUB_BUCKETS), 1e-3)
+    total = db.execute(select(func.count()).select_from(Event).where(*_filters(user_id, mode, start, end))).scalar()
+    if total <= LTTB_MAX_RAW_ROWS:
+        query = (
+            select(_epoch_seconds(db, Event.timestamp), *(getattr(Event, column) for column in columns))
+            .where(*_filters(user_id, mode, start, end))
+            .order_by(Event.timestamp)
+        )
+        rows = db.execute(query).all()
+        values = list(zip(*rows)) or [()] * (len(columns) + 1)
+        seconds, values = np.array(values[0], dtype=float), [np.array(v, dtype=float) for v in values[1:]]
+    else:
+        rows = _event_buckets(db, user_id, mode, start, end, width, columns)
+        seconds, values = _min_max_points([row._mapping for row in rows], start, width, columns)
+    rollups = _rollup_buckets(db, user_id, mode, start, end, width, columns)
+    if rollups:
+        # Compacted events are gone from the events table, so the two never overlap
+        rollup_seconds, rollup_values = _min_max_points([row._mapping for row in rollups], start, width, columns)
+        order = np.argsort(np.concatenate([rollup_seconds, seconds]), kind="stable")
+        seconds = np.concatenate([rollup_seconds, seconds])[order]
+        values = [np.concatenate([extra, value])[order] for extra, value in zip(rollup_values, values)]
+        total += sum(int(row.count or 0) for row in rollups)
+    return seconds, values, total
+
+
+def lttb_series(db: Session, user_id: Optional[str], mode: Optional[str], start: datetime, end: datetime,
+                points: int, columns: Sequence[str] = SERIES_COLUMNS) -> dict:
+    """LTTB over the scores, reduced per score independently"""
+    seconds, values, total = _lttb_input(db, user_id, mode, start, end, points, columns)
+    series: Dict[str, dict] = {}
+    for column, y in zip(columns, values):
+        keep = ~np.isnan(y)
+        x_valid, y_valid = seconds[keep], y[keep]
+        selected = lttb(x_valid, y_valid, points)
+        series[column] = {
+            "timestamps": _isoformat(x_valid[selected]),
+            "values": y_valid[selected].tolist(),
+        }
+    return {"total_events": int(total), "series": series}
+
+
+def as_naive_utc(value: datetime) -> datetime:
+    """Events store naive UTC timestamps; convert aware datetimes to match"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _naive_epoch(value: datetime) -> float:
+    """Seconds since the epoch for a naive UTC datetime"""
+    return (value - datetime(1970, 1, 1)).total_seconds()
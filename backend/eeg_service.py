@@ -1,12 +1,42 @@
 """
 EEG Service using BrainFlow to read from OpenBCI
 """
-from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
-from brainflow.data_filter import DataFilter, FilterTypes, AggOperations
+from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds, BrainFlowError
 import numpy as np
 import asyncio
+import os
+import threading
+import time
 from typing import Optional, Callable
 
+from backend.metrics import (
+    BOARD_READ_SECONDS, PSD_SECONDS, FILTER_SECONDS, DROPPED_FRAMES, BOARD_BUFFER_SAMPLES,
+    BOARD_BUFFER_FILL, ARTIFACT_FRACTION, BOARD_CONNECTED, BOARD_RECONNECTS, DATA_GAP_SECONDS
+)
+
+from backend.tracing import Tracer, TickTrace, stage
+from backend.scheduler import TickScheduler, UPDATE_HZ, TICK_POLICY, check_policy
+from backend.anomaly import StreamingAnomalyDetector
+from backend.filters import StreamingFilterChain, FILTERS_ENABLED, filter_config
+from backend.features import (
+    FeaturePipeline, FeatureUnavailable, FeatureFrame, SpectralWindow, BAND_NAMES, CORE_FEATURES
+)
+
+# Size of the BrainFlow ring buffer allocated by start_stream()
+RING_BUFFER_SIZE = 450000
+# Fewest (artifact-free) samples a tick needs for a usable PSD
+MIN_SAMPLES = 100
+# Seconds of recent samples each tick's features are computed over. At
+# EEG_UPDATE_HZ above 1 consecutive windows overlap; a tick after a longer
+# pause still uses everything read since the previous one.
+WINDOW_SECONDS = float(os.getenv("EEG_WINDOW_SECONDS", "1"))
+# Reconnect when no samples arrive for this long, or after this many failed reads in a row
+STALL_SECONDS = float(os.getenv("BOARD_STALL_SECONDS", "5"))
+MAX_READ_ERRORS = 3
+# Exponential backoff between reconnect attempts
+RECONNECT_INITIAL_DELAY = float(os.getenv("BOARD_RECONNECT_DELAY", "1"))
+RECONNECT_MAX_DELAY = float(os.getenv("BOARD_RECONNECT_MAX_DELAY", "10"))
+
 class EEGService:
     """Service to handle EEG data collection from OpenBCI"""
     
@@ -20,6 +50,30 @@ class EEGService:
         self.board = None
         self.is_streaming = False
         self.data_callback: Optional[Callable] = None
+        self.tracer = Tracer.from_env()
+        self.anomaly_detector: Optional[StreamingAnomalyDetector] = None
+        self.filter_chain: Optional[StreamingFilterChain] = None
+        # Configured via FEATURE_PIPELINE / FEATURE_OUTPUTS; the service itself needs the core scores
+        self.features = FeaturePipeline()
+        self.features.require(CORE_FEATURES)
+        # Acquisition state: disconnected, streaming, reconnecting or stopped
+        self.state = "disconnected"
+        self.state_callback: Optional[Callable] = None
+        # Serializes session teardown/re-preparation between the reconnect thread and disconnect()
+        self._board_lock = threading.Lock()
+        self._last_sample_at = 0.0
+        self._read_errors = 0
+        # Sample counter tracking for gap detection
+        self._last_package: Optional[int] = None
+        self._package_modulus = 0
+        self._pending_gap_seconds = 0.0
+        # Filtered samples (and artifact mask) of the last WINDOW_SECONDS
+        self._window: Optional[np.ndarray] = None
+        self._window_artifacts: Optional[np.ndarray] = None
+        # Tick rate and missed-tick policy of the stream loop, set by start_streaming()
+        self.rate_hz = UPDATE_HZ
+        self.tick_policy = TICK_POLICY
+        self.timer = None
         
     def connect(self, serial_port: Optional[str] = None, mac_address: Optional[str] = None, dongle_port: Optional[str] = None):
         """Connect to the board
@@ -45,91 +99,274 @@ class EEGService:
         
         self.board = BoardShim(self.board_id, params)
         self.board.prepare_session()
+    
+    def use_board(self, board: BoardShim):
+        """Adopt a board whose session was already prepared (e.g. by auto-detection)"""
+        self.board = board
         
     def disconnect(self):
         """Disconnect from the board"""
-        if self.board:
-            self.board.release_session()
-            self.board = None
-            self.is_streaming = False
+        with self._board_lock:
+            if self.board:
+                try:
+                    self.board.release_session()
+                except BrainFlowError as e:
+                    # Already gone, e.g. after a dropout
+                    print(f"Warning: Failed to release board session: {e}")
+                self.board = None
+                self.is_streaming = False
+                self.state = "disconnected"
     
-    def start_streaming(self, callback: Callable):
-        """Start streaming EEG data"""
+    def start_streaming(self, callback: Callable, state_callback: Optional[Callable] = None,
+                        rate_hz: float = UPDATE_HZ, policy: str = TICK_POLICY):
+        """Start streaming EEG data
+        
+        state_callback, if given, is awaited with {"state", ...} whenever the
+        board drops out, is being reconnected, or streams again. Raises
+        ValueError for an unknown tick policy, before the board starts.
+        """
         if not self.board:
             raise RuntimeError("Board not connected. Call connect() first.")
+        self.tick_policy = check_policy(policy)
+        self.rate_hz = rate_hz
         
         self.data_callback = callback
-        self.board.start_stream()
+        self.state_callback = state_callback
+        # Fresh detector history for every streaming session
+        self.anomaly_detector = StreamingAnomalyDetector(BAND_NAMES)
+        if FILTERS_ENABLED:
+            self.filter_chain = StreamingFilterChain(
+                BoardShim.get_sampling_rate(self.board_id), filter_config(self.board_id)
+            )
+        self.board.start_stream(RING_BUFFER_SIZE)
         self.is_streaming = True
+        self._last_sample_at = time.monotonic()
+        self._read_errors = 0
+        self._last_package = None
+        self._package_modulus = 0
+        self._pending_gap_seconds = 0.0
+        self._window = self._window_artifacts = None
+        self.state = "streaming"
+        BOARD_CONNECTED.set(1)
     
     def stop_streaming(self):
         """Stop streaming EEG data"""
         if self.board and self.is_streaming:
-            self.board.stop_stream()
             self.is_streaming = False
+            try:
+                self.board.stop_stream()
+            except BrainFlowError as e:
+                print(f"Warning: Failed to stop board stream: {e}")
+        self.state = "stopped"
+        BOARD_CONNECTED.set(0)
     
-    def get_bandpowers(self, window_seconds: int = 1) -> dict:
+    def get_bandpowers(self, trace: Optional[TickTrace] = None) -> Optional[FeatureFrame]:
         """
         Calculate band powers from recent EEG data
-        Returns: { alpha, beta, theta, gamma, focus_score, load_score, anomaly_score }
+        Returns a FeatureFrame of alpha, beta, theta, gamma, focus_score, load_score, anomaly_score
+        
+        When a trace is given, the acquire and feature extraction stages are
+        recorded on it along with the BrainFlow timestamp of the newest sample.
         """
         if not self.board or not self.is_streaming:
             return None
         
         # Get board data
-        board_data = self.board.get_board_data()
-        if board_data.shape[1] < 100:  # Need enough samples
-            return None
+        with stage(trace, "acquire"), BOARD_READ_SECONDS.time():
+            pending = self.board.get_board_data_count()
+            board_data = self.board.get_board_data()
+        if trace is not None and board_data.shape[1] > 0:
+            trace.sample_timestamp = float(board_data[BoardShim.get_timestamp_channel(self.board_id), -1])
+        BOARD_BUFFER_SAMPLES.set(pending)
+        BOARD_BUFFER_FILL.set(pending / RING_BUFFER_SIZE)
         
         # Get EEG channels (adjust based on your board)
         eeg_channels = BoardShim.get_eeg_channels(self.board_id)
         sampling_rate = BoardShim.get_sampling_rate(self.board_id)
         
+        if board_data.shape[1] > 0:
+            self._last_sample_at = time.monotonic()
+            self._track_gaps(board_data, sampling_rate)
+        
         if len(eeg_channels) == 0:
+            DROPPED_FRAMES.inc(reason="no_eeg_channels")
             return None
         
-        # Use first EEG channel for simplicity
-        eeg_data = board_data[eeg_channels[0]]
-        
-        # Calculate band powers
-        alpha = DataFilter.get_band_power(eeg_data, 8.0, 13.0, sampling_rate)
-        beta = DataFilter.get_band_power(eeg_data, 13.0, 30.0, sampling_rate)
-        theta = DataFilter.get_band_power(eeg_data, 4.0, 8.0, sampling_rate)
-        gamma = DataFilter.get_band_power(eeg_data, 30.0, 100.0, sampling_rate)
+        # Filter every chunk, even short ones, so the carried filter state stays continuous
+        eeg_data, artifacts = board_data[eeg_channels], None
+        if self.filter_chain is not None:
+            with stage(trace, "filter"), FILTER_SECONDS.time():
+                eeg_data, artifacts = self.filter_chain.process(eeg_data)
+            if artifacts.shape[1] > 0:
+                ARTIFACT_FRACTION.set(float(artifacts[0].mean()))
         
-        # Calculate scores (simplified - you'll want to refine these)
-        total_power = alpha + beta + theta + gamma
-        if total_power == 0:
+        if board_data.shape[1] == 0:
+            DROPPED_FRAMES.inc(reason="no_new_samples")
+            return None
+        eeg_data, artifacts = self._slide_window(eeg_data, artifacts, sampling_rate)
+        if eeg_data.shape[1] < MIN_SAMPLES:  # Need enough samples
+            DROPPED_FRAMES.inc(reason="insufficient_samples")
+            return None
+        window = SpectralWindow(eeg_data, sampling_rate, artifacts)
+        if len(window.samples(0)) < MIN_SAMPLES:
+            DROPPED_FRAMES.inc(reason="artifact")
             return None
         
-        # Focus score: higher alpha/theta ratio suggests better focus
-        focus_score = (alpha / (theta + 1e-6)) * 50  # Normalize to 0-100
-        
-        # Load score: higher beta suggests cognitive load
-        load_score = (beta / (total_power + 1e-6)) * 100
+        with stage(trace, "feature_extraction"), PSD_SECONDS.time():
+            bandpowers = self._extract_features(window)
         
-        # Anomaly score: detect unusual patterns (simplified)
-        anomaly_score = abs(beta - alpha) / (total_power + 1e-6) * 100
+        if bandpowers and self.anomaly_detector:
+            with stage(trace, "anomaly_detection"):
+                detection = self.anomaly_detector.update(bandpowers)
+            bandpowers.anomaly_score = detection["score"]
+            bandpowers.anomaly_event = detection["event"]
+        if bandpowers and self._pending_gap_seconds:
+            # Samples lost since the previous emitted tick
+            bandpowers.gap_seconds = round(self._pending_gap_seconds, 3)
+            self._pending_gap_seconds = 0.0
+        return bandpowers
+    
+    def _slide_window(self, eeg_data: np.ndarray, artifacts: Optional[np.ndarray], sampling_rate: int):
+        """Append a tick's new samples to the rolling window; returns the window's (data, artifacts)"""
+        keep = max(int(WINDOW_SECONDS * sampling_rate), eeg_data.shape[1])
+        if self._window is not None and self._window.shape[0] == eeg_data.shape[0]:
+            eeg_data = np.concatenate((self._window, eeg_data), axis=1)
+            if artifacts is not None and self._window_artifacts is not None:
+                artifacts = np.concatenate((self._window_artifacts, artifacts), axis=1)
+        self._window = eeg_data[:, -keep:]
+        self._window_artifacts = artifacts[:, -keep:] if artifacts is not None else None
+        return self._window, self._window_artifacts
+    
+    def _track_gaps(self, board_data: np.ndarray, sampling_rate: int):
+        """Count samples the board's package counter says were lost since the last read
         
-        return {
-            "alpha": float(alpha),
-            "beta": float(beta),
-            "theta": float(theta),
-            "gamma": float(gamma),
-            "focus_score": float(np.clip(focus_score, 0, 100)),
-            "load_score": float(np.clip(load_score, 0, 100)),
-            "anomaly_score": float(np.clip(anomaly_score, 0, 100))
-        }
+        The counter wraps at a board-specific value, learned as the largest
+        one seen so far.
+        """
+        packages = board_data[BoardShim.get_package_num_channel(self.board_id)].astype(np.int64)
+        if self._last_package is not None:
+            packages = np.concatenate(([self._last_package], packages))
+        self._last_package = int(packages[-1])
+        self._package_modulus = max(self._package_modulus, int(packages.max()) + 1)
+        steps = np.diff(packages) % self._package_modulus
+        missing = int(np.maximum(steps - 1, 0).sum())
+        if missing:
+            gap = missing / sampling_rate
+            self._pending_gap_seconds += gap
+            DATA_GAP_SECONDS.inc(gap)
+    
+    def _extract_features(self, window: SpectralWindow) -> Optional[FeatureFrame]:
+        """Run the feature pipeline on one tick, counting ticks it rejects"""
+        try:
+            return self.features.run(window)
+        except FeatureUnavailable as e:
+            DROPPED_FRAMES.inc(reason=e.reason)
+            return None
     
     async def stream_loop(self):
-        """Async loop to continuously stream and process EEG data"""
+        """Async loop to continuously stream and process EEG data
+        
+        Ticks rate_hz times a second on the shared TickScheduler's deadlines.
+        Reconnects the board when it stops delivering samples or reads keep
+        failing, and carries on streaming once it's back.
+        """
+        self.timer = TickScheduler.get_instance().add(self.rate_hz, self.tick_policy, name=f"board-{self.board_id}")
+        try:
+            while self.is_streaming:
+                await self.timer.wait()
+                if not self.is_streaming:
+                    break
+                try:
+                    trace = self.tracer.start_tick()
+                    bandpowers = self.get_bandpowers(trace=trace)
+                    self._read_errors = 0
+                    if bandpowers and self.data_callback:
+                        await self.data_callback(bandpowers, trace)
+                    if trace is not None:
+                        trace.finish()
+                    if time.monotonic() - self._last_sample_at > STALL_SECONDS:
+                        await self.reconnect("stalled")
+                except BrainFlowError as e:
+                    DROPPED_FRAMES.inc(reason="board_error")
+                    print(f"Board read failed: {e}")
+                    self._read_errors += 1
+                    if self._read_errors >= MAX_READ_ERRORS:
+                        await self.reconnect("read_error", error=str(e))
+                except Exception as e:
+                    DROPPED_FRAMES.inc(reason="error")
+                    print(f"Error in stream loop: {e}")
+        finally:
+            self.timer.cancel()
+    
+    async def reconnect(self, reason: str, **info) -> bool:
+        """Re-prepare the board session with backoff until it streams again
+        
+        Returns False if streaming was stopped before the board came back.
+        """
+        if self.timer is not None:
+            # Ticks that pass meanwhile aren't missed ones
+            self.timer.pause()
+        try:
+            return await self._reconnect(reason, **info)
+        finally:
+            if self.timer is not None:
+                self.timer.resume()
+    
+    async def _reconnect(self, reason: str, **info) -> bool:
+        lost_at = self._last_sample_at
+        delay = RECONNECT_INITIAL_DELAY
+        attempt = 0
+        print(f"Board {reason}; reconnecting...")
+        BOARD_CONNECTED.set(0)
+        await self._enter_state("reconnecting", reason=reason, attempt=attempt, **info)
         while self.is_streaming:
+            attempt += 1
+            try:
+                await asyncio.to_thread(self._restart_session)
+            except Exception as e:
+                BOARD_RECONNECTS.inc(result="failed")
+                print(f"Reconnect attempt {attempt} failed: {e}; retrying in {delay:.1f}s")
+                await self._enter_state("reconnecting", reason=reason, attempt=attempt, error=str(e), retry_in=delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            if not self.is_streaming:
+                break
+            BOARD_RECONNECTS.inc(result="success")
+            gap = time.monotonic() - lost_at
+            self._pending_gap_seconds += gap
+            DATA_GAP_SECONDS.inc(gap)
+            self._last_sample_at = time.monotonic()
+            self._read_errors = 0
+            # Counters restart and the filter state no longer matches the signal
+            self._last_package = None
+            self._window = self._window_artifacts = None
+            if self.filter_chain is not None:
+                self.filter_chain.reset()
+            print(f"Board reconnected after {attempt} attempt(s), {gap:.1f}s gap")
+            BOARD_CONNECTED.set(1)
+            await self._enter_state("streaming", reconnected=True, attempts=attempt, gap_seconds=round(gap, 3))
+            return True
+        return False
+    
+    def _restart_session(self):
+        """Tear down and re-prepare the board session with its original connection parameters"""
+        with self._board_lock:
+            if not self.board or not self.is_streaming:
+                raise RuntimeError("Board was disconnected")
+            for step in (self.board.stop_stream, self.board.release_session):
+                try:
+                    step()
+                except BrainFlowError:
+                    pass
+            self.board.prepare_session()
+            self.board.start_stream(RING_BUFFER_SIZE)
+    
+    async def _enter_state(self, state: str, **info):
+        self.state = state
+        if self.state_callback:
             try:
-                bandpowers = self.get_bandpowers()
-                if bandpowers and self.data_callback:
-                    await self.data_callback(bandpowers)
-                await asyncio.sleep(1)  # Update every second
+                await self.state_callback({"state": state, **info})
             except Exception as e:
-                print(f"Error in stream loop: {e}")
-                await asyncio.sleep(1)
+                print(f"Error in board state callback: {e}")
 
@@ -0,0 +1,117 @@
+"""
+Batched event ingestion
+
+Streamed events are buffered and written EVENT_BATCH_SIZE rows or
+EVENT_FLUSH_SECONDS at a time instead of one commit per tick: with COPY on
+PostgreSQL, and an executemany INSERT elsewhere. A failed flush keeps its
+rows for the next attempt, up to MAX_PENDING_EVENTS. Rows are queued as
+tuples in ROW_COLUMNS order; column defaults don't apply, and missing
+columns are NULL.
+"""
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from backend.database import engine, Event
+from backend.features import FeatureFrame
+from backend.metrics import DB_COMMIT_SECONDS, FAILED_SYNCS
+
+BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "50"))
+FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "1.0"))
+MAX_PENDING = int(os.getenv("MAX_PENDING_EVENTS", "100000"))
+# Partition and stats-rollup upkeep runs at most this often (PostgreSQL)
+MAINTENANCE_SECONDS = float(os.getenv("PG_MAINTENANCE_SECONDS", "300"))
+
+# Every column but the generated id, in table order
+EVENT_COLUMNS = [column.name for column in Event.__table__.columns if column.name != "id"]
+# Columns streamed rows fill (not the legacy inline context), in queued tuple order
+ROW_COLUMNS = (
+    "timestamp", "mode", "focus_score", "load_score", "anomaly_score", "context_id", "user_id",
+    "alpha", "beta", "theta", "gamma", "score_version", "session_id", "gap_seconds",
+)
+
+
+class EventWriter:
+    """Buffers event rows and writes them in batches"""
+
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_seconds: float = FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.postgres = engine.dialect.name == "postgresql"
+        self._pending: List[tuple] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        # One flush at a time, so batches land in order
+        self._flush_lock = threading.Lock()
+        self._last_maintenance = time.monotonic()
+
+    def add(self, row: dict) -> bool:
+        """Queue one row of Event columns; returns True when a flush is due"""
+        return self.add_values(tuple(row.get(column) for column in ROW_COLUMNS))
+
+    def add_frame(self, frame: FeatureFrame, timestamp: datetime, mode: str, context_id: Optional[int],
+                  user_id: str, score_version: int, session_id: Optional[int]) -> bool:
+        """Queue the row of a streamed tick, read straight from its FeatureFrame"""
+        return self.add_values((
+            timestamp, mode, frame.focus_score, frame.load_score, frame.anomaly_score, context_id, user_id,
+            frame.alpha, frame.beta, frame.theta, frame.gamma, score_version, session_id, frame.gap_seconds,
+        ))
+
+    def add_values(self, values: tuple) -> bool:
+        """Queue one row given in ROW_COLUMNS order; returns True when a flush is due"""
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(values)
+            return self._due()
+
+    def _due(self) -> bool:
+        return bool(self._pending) and (
+            len(self._pending) >= self.batch_size or time.monotonic() - self._oldest >= self.flush_seconds
+        )
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """Write everything queued; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending, self._oldest = self._pending, [], None
+            if not rows:
+                return 0
+            try:
+                with DB_COMMIT_SECONDS.time():
+                    with engine.begin() as conn:
+                        if self.postgres:
+                            from backend.postgres import copy_rows
+                            copy_rows(conn, Event.__tablename__, ROW_COLUMNS, rows)
+                        else:
+                            conn.execute(Event.__table__.insert(), [dict(zip(ROW_COLUMNS, row)) for row in rows])
+            except Exception as e:
+                FAILED_SYNCS.inc(target="database")
+                print(f"Error saving {len(rows)} events: {e}")
+                with self._lock:
+                    self._pending = (rows + self._pending)[-MAX_PENDING:]
+                    self._oldest = time.monotonic()
+                return 0
+            if self.postgres and time.monotonic() - self._last_maintenance >= MAINTENANCE_SECONDS:
+                self._maintain()
+            return len(rows)
+
+    async def flush_async(self) -> int:
+        """flush() off the event loop"""
+        return await asyncio.to_thread(self.flush)
+
+    def _maintain(self):
+        from backend.postgres import ensure_partitions, refresh_stats
+        self._last_maintenance = time.monotonic()
+        try:
+            ensure_partitions(engine)
+            refresh_stats(engine)
+        except Exception as e:
+            print(f"Warning: PostgreSQL maintenance failed: {e}")
@@ -0,0 +1,426 @@
+"""
+Feature extraction pipeline for EEG ticks
+
+Extractors register themselves by name and all read from one SpectralWindow
+per tick, which computes each channel's Welch PSD at most once and only for
+channels that are actually used. The pipeline is declared with
+FEATURE_PIPELINE (extractor names) and FEATURE_OUTPUTS (features consumers
+need); extractors whose outputs nobody needs are skipped, and the providers
+of required features or inputs are added if the config leaves them out. A
+run's result
+is a FeatureFrame, which the rest of the tick passes along as is.
+"""
+import inspect
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Type
+
+import numpy as np
+from brainflow.data_filter import DataFilter, WindowOperations
+
+from backend.metrics import FEATURE_SECONDS
+from backend.serialization import json_number
+
+# Bump when the focus/load/anomaly formulas change, so stored scores can be re-derived
+SCORE_VERSION = 1
+
+BANDS = {
+    "alpha": (8.0, 13.0),
+    "beta": (13.0, 30.0),
+    "theta": (4.0, 8.0),
+    "gamma": (30.0, 100.0),
+}
+BAND_NAMES = tuple(BANDS)
+# Features the service itself depends on (database, calibration, anomaly detection)
+CORE_FEATURES = BAND_NAMES + ("focus_score", "load_score", "anomaly_score")
+
+DEFAULT_PIPELINE = "band_powers,scores"
+# EEG channel indices (left, right) used for frontal alpha asymmetry
+FRONTAL_CHANNELS = tuple(int(index) for index in os.getenv("FRONTAL_CHANNELS", "0,1").split(","))
+ENTROPY_RANGE = (1.0, 45.0)
+_EPS = 1e-6
+
+
+class FeatureUnavailable(Exception):
+    """Raised by an extractor when the tick can't produce usable features"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# Slots of a FeatureFrame that go out on the wire, in order
+FRAME_FIELDS = CORE_FEATURES + ("gap_seconds",)
+_FRAME_SLOTS = frozenset(FRAME_FIELDS + ("anomaly_event",))
+# The core features of a frame as JSON, when all are finite numbers
+_CORE_JSON = ", ".join(f'"{name}": %s' for name in CORE_FEATURES)
+
+
+class FeatureFrame:
+    """
+    One tick's features, in fixed slots
+
+    Every consumer of a tick (calibration, anomaly detection, the session
+    summary, the event writer and the broadcast) reads and updates the same
+    frame instead of building its own dict. The core features, gap_seconds
+    and the anomaly event live in slots. Anything else, like optional
+    extractor outputs, z-scores or raw_* scores, goes in `extra`, which is
+    only created when needed. A slot holding None counts as absent.
+
+    Frames also take the mapping reads and writes (frame["alpha"],
+    frame.get("gap_seconds"), frame["z"] = ...) that extractors and other
+    consumers use.
+    """
+
+    __slots__ = FRAME_FIELDS + ("anomaly_event", "extra")
+
+    def __init__(self):
+        self.alpha = self.beta = self.theta = self.gamma = None
+        self.focus_score = self.load_score = self.anomaly_score = None
+        self.gap_seconds = None
+        self.anomaly_event: Optional[dict] = None
+        self.extra: Optional[dict] = None
+
+    def __getitem__(self, key: str):
+        if key in _FRAME_SLOTS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key in _FRAME_SLOTS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        if key in _FRAME_SLOTS:
+            return getattr(self, key) is not None
+        return self.extra is not None and key in self.extra
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, values: dict):
+        for key, value in values.items():
+            if key in _FRAME_SLOTS:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def to_dict(self) -> dict:
+        """The features as a plain dict, without the anomaly event"""
+        features = {name: getattr(self, name) for name in FRAME_FIELDS if getattr(self, name) is not None}
+        if self.extra:
+            features.update(self.extra)
+        return features
+
+    def to_json(self) -> str:
+        """The features as a JSON object, without building the dict to_dict() returns"""
+        core = (self.alpha, self.beta, self.theta, self.gamma, self.focus_score, self.load_score, self.anomaly_score)
+        if None not in core and math.isfinite(sum(core)):
+            # str() of a float (or NumPy float) is what json.dumps writes
+            text = _CORE_JSON % core
+            if self.gap_seconds is not None:
+                text = f'{text}, "gap_seconds": {json_number(self.gap_seconds)}'
+        else:
+            text = ", ".join(
+                f'"{name}": {json_number(getattr(self, name))}'
+                for name in FRAME_FIELDS if getattr(self, name) is not None
+            )
+        if self.extra:
+            extra = json.dumps(self.extra)
+            text = f"{text}, {extra[1:-1]}" if text else extra[1:-1]
+        return f"{{{text}}}"
+
+
+class SpectralWindow:
+    """One tick of clean EEG samples with lazily computed, shared spectra"""
+
+    def __init__(self, data: np.ndarray, sampling_rate: int, artifacts: Optional[np.ndarray] = None):
+        self.data = np.atleast_2d(data)
+        self.sampling_rate = sampling_rate
+        self.artifacts = artifacts
+        self._samples: Dict[int, np.ndarray] = {}
+        self._spectra: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    @property
+    def num_channels(self) -> int:
+        return self.data.shape[0]
+
+    def samples(self, channel: int = 0) -> np.ndarray:
+        """Samples of one channel with artifacts removed"""
+        samples = self._samples.get(channel)
+        if samples is None:
+            row = self.data[channel]
+            if self.artifacts is not None:
+                row = row[~self.artifacts[channel]]
+            samples = np.ascontiguousarray(row, dtype=float)
+            self._samples[channel] = samples
+        return samples
+
+    def psd(self, channel: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """(power, freqs) Welch PSD of one channel, computed once per tick"""
+        power, freqs, _ = self._spectrum(channel)
+        return power, freqs
+
+    def band_powers(self, bands: Sequence[Tuple[float, float]], channel: int = 0) -> np.ndarray:
+        """
+        Power in each (low, high) band, all bands in one pass
+
+        Matches DataFilter.get_band_power: trapezoidal integration from the
+        first bin >= low to the first bin >= high.
+        """
+        _, freqs, cumulative = self._spectrum(channel)
+        edges = np.asarray(bands, dtype=float)
+        start = np.searchsorted(freqs, edges[:, 0])
+        stop = np.minimum(np.searchsorted(freqs, edges[:, 1]), len(freqs) - 1)
+        return np.maximum(cumulative[stop] - cumulative[np.minimum(start, stop)], 0.0)
+
+    def _spectrum(self, channel: int):
+        spectrum = self._spectra.get(channel)
+        if spectrum is None:
+            samples = self.samples(channel)
+            # nfft is the largest power of two that fits the window
+            nfft = min(DataFilter.get_nearest_power_of_two(self.sampling_rate),
+                       1 << (len(samples).bit_length() - 1))
+            power, freqs = DataFilter.get_psd_welch(samples, nfft, nfft // 2, self.sampling_rate,
+                                                    WindowOperations.HANNING.value)
+            cumulative = np.concatenate(([0.0], np.cumsum(0.5 * np.diff(freqs) * (power[1:] + power[:-1]))))
+            spectrum = (power, freqs, cumulative)
+            self._spectra[channel] = spectrum
+        return spectrum
+
+
+class FeatureExtractor(ABC):
+    """Base class: produce `outputs` from a SpectralWindow and earlier features"""
+
+    name = ""
+    outputs: Tuple[str, ...] = ()
+    requires: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def compute(self, window: SpectralWindow, features: FeatureFrame) -> dict:
+        """Values for this extractor's outputs; may raise FeatureUnavailable"""
+
+
+EXTRACTORS: Dict[str, Type[FeatureExtractor]] = {}
+
+
+def register(cls: Type[FeatureExtractor]) -> Type[FeatureExtractor]:
+    """Class decorator adding an extractor to the registry under its name"""
+    if inspect.isabstract(cls) or not cls.name:
+        raise TypeError(f"{cls.__name__} must set a name and implement compute() to be registered")
+    EXTRACTORS[cls.name] = cls
+    return cls
+
+
+def compute_scores(alpha, beta, theta, gamma) -> dict:
+    """
+    Focus, load and instantaneous anomaly scores (SCORE_VERSION 1)
+
+    Works on floats or NumPy arrays of band powers alike, so stored events
+    can be re-scored in bulk.
+    """
+    total_power = alpha + beta + theta + gamma
+    # Focus score: higher alpha/theta ratio suggests better focus
+    focus_score = (alpha / (theta + _EPS)) * 50  # Normalize to 0-100
+    # Load score: higher beta suggests cognitive load
+    load_score = (beta / (total_power + _EPS)) * 100
+    # Instantaneous anomaly heuristic; replaced by the streaming detector in EEGService
+    anomaly_score = np.abs(beta - alpha) / (total_power + _EPS) * 100
+    return {
+        "focus_score": np.clip(focus_score, 0, 100),
+        "load_score": np.clip(load_score, 0, 100),
+        "anomaly_score": np.clip(anomaly_score, 0, 100),
+    }
+
+
+@register
+class BandPowers(FeatureExtractor):
+    name = "band_powers"
+    outputs = BAND_NAMES
+
+    def compute(self, window, features):
+        powers = window.band_powers(list(BANDS.values()))
+        return {band: float(power) for band, power in zip(BAND_NAMES, powers)}
+
+
+@register
+class Scores(FeatureExtractor):
+    name = "scores"
+    outputs = ("focus_score", "load_score", "anomaly_score")
+    requires = BAND_NAMES
+
+    def compute(self, window, features):
+        if features["alpha"] + features["beta"] + features["theta"] + features["gamma"] == 0:
+            raise FeatureUnavailable("zero_power")
+        scores = compute_scores(*(features[band] for band in ("alpha", "beta", "theta", "gamma")))
+        return {name: float(value) for name, value in scores.items()}
+
+
+@register
+class Ratios(FeatureExtractor):
+    name = "ratios"
+    outputs = ("theta_beta_ratio", "alpha_theta_ratio", "beta_alpha_ratio")
+    requires = ("alpha", "beta", "theta")
+
+    def compute(self, window, features):
+        alpha, beta, theta = features["alpha"], features["beta"], features["theta"]
+        return {
+            "theta_beta_ratio": theta / (beta + _EPS),
+            "alpha_theta_ratio": alpha / (theta + _EPS),
+            "beta_alpha_ratio": beta / (alpha + _EPS),
+        }
+
+
+@register
+class SpectralEntropy(FeatureExtractor):
+    name = "spectral_entropy"
+    outputs = ("spectral_entropy",)
+
+    def compute(self, window, features):
+        power, freqs = window.psd()
+        in_range = power[(freqs >= ENTROPY_RANGE[0]) & (freqs <= ENTROPY_RANGE[1])]
+        total = in_range.sum()
+        if len(in_range) < 2 or total <= 0:
+            return {"spectral_entropy": None}
+        p = in_range / total
+        p = p[p > 0]
+        # Normalized to 0-1 by the entropy of a flat spectrum
+        return {"spectral_entropy": float(-(p * np.log2(p)).sum() / math.log2(len(in_range)))}
+
+
+@register
+class Hjorth(FeatureExtractor):
+    name = "hjorth"
+    outputs = ("hjorth_activity", "hjorth_mobility", "hjorth_complexity")
+
+    def compute(self, window, features):
+        samples = window.samples()
+        first = np.diff(samples)
+        second = np.diff(first)
+        activity = float(np.var(samples))
+        mobility = math.sqrt(np.var(first) / activity) if activity > 0 else 0.0
+        first_mobility = math.sqrt(np.var(second) / np.var(first)) if np.var(first) > 0 else 0.0
+        return {
+            "hjorth_activity": activity,
+            "hjorth_mobility": mobility,
+            "hjorth_complexity": first_mobility / mobility if mobility > 0 else 0.0,
+        }
+
+
+@register
+class FrontalAsymmetry(FeatureExtractor):
+    name = "frontal_asymmetry"
+    outputs = ("frontal_alpha_asymmetry",)
+
+    def compute(self, window, features):
+        left, right = FRONTAL_CHANNELS
+        if max(left, right) >= window.num_channels:
+            return {"frontal_alpha_asymmetry": None}
+        alpha_band = [BANDS["alpha"]]
+        left_alpha = window.band_powers(alpha_band, left)[0]
+        right_alpha = window.band_powers(alpha_band, right)[0]
+        # ln(right) - ln(left); positive means relatively more left-hemisphere activity
+        return {"frontal_alpha_asymmetry": float(np.log(right_alpha + _EPS) - np.log(left_alpha + _EPS))}
+
+
+def _providers() -> Dict[str, Type[FeatureExtractor]]:
+    """Registered extractor class producing each feature"""
+    return {feature: cls for cls in EXTRACTORS.values() for feature in cls.outputs}
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+class FeaturePipeline:
+    """Runs the configured extractors needed for the requested features"""
+
+    def __init__(self, extractors: Optional[Sequence[str]] = None, outputs: Optional[Iterable[str]] = None):
+        names = list(extractors) if extractors is not None else _split(os.getenv("FEATURE_PIPELINE", DEFAULT_PIPELINE))
+        unknown = [name for name in names if name not in EXTRACTORS]
+        if unknown:
+            raise ValueError(f"Unknown feature extractor(s): {', '.join(unknown)}")
+        self.extractors = self._with_dependencies([EXTRACTORS[name]() for name in names])
+        self.producers = {feature: ex for ex in self.extractors for feature in ex.outputs}
+        if outputs is None:
+            outputs = _split(os.getenv("FEATURE_OUTPUTS")) or list(self.producers)
+        self.required: Set[str] = set()
+        self._plan: Optional[List[FeatureExtractor]] = None
+        self.require(outputs)
+
+    @staticmethod
+    def _with_dependencies(extractors: List[FeatureExtractor]) -> List[FeatureExtractor]:
+        """Add providers for missing inputs and order extractors after their inputs"""
+        providers = _providers()
+        ordered: List[FeatureExtractor] = []
+        placed: Dict[str, FeatureExtractor] = {}
+
+        def place(extractor: FeatureExtractor):
+            if extractor.name in placed:
+                return
+            for feature in extractor.requires:
+                provider = next((ex for ex in extractors if feature in ex.outputs), None)
+                place(provider or placed.get(providers[feature].name) or providers[feature]())
+            placed[extractor.name] = extractor
+            ordered.append(extractor)
+
+        for extractor in extractors:
+            place(extractor)
+        return ordered
+
+    def require(self, features: Iterable[str]):
+        """
+        Declare features a consumer needs; the run plan is rebuilt lazily
+
+        Features no configured extractor produces bring in their registered
+        provider (and its inputs); raises ValueError if none is registered.
+        """
+        features = set(features)
+        missing = features - set(self.producers)
+        if missing:
+            providers = _providers()
+            unknown = missing - set(providers)
+            if unknown:
+                raise ValueError(f"No registered extractor produces: {', '.join(sorted(unknown))}")
+            added = [providers[feature]() for feature in sorted(missing)]
+            self.extractors = self._with_dependencies(self.extractors + added)
+            self.producers = {feature: ex for ex in self.extractors for feature in ex.outputs}
+        if not features <= self.required:
+            self.required |= features
+            self._plan = None
+
+    @property
+    def plan(self) -> List[FeatureExtractor]:
+        """Extractors to run, in order, to produce the required features"""
+        if self._plan is None:
+            needed = set(self.required)
+            plan = []
+            for extractor in reversed(self.extractors):
+                if needed.intersection(extractor.outputs):
+                    plan.append(extractor)
+                    needed.update(extractor.requires)
+            self._plan = plan[::-1]
+        return self._plan
+
+    def run(self, window: SpectralWindow) -> FeatureFrame:
+        """Compute the required features; raises FeatureUnavailable to drop the tick"""
+        features = FeatureFrame()
+        for extractor in self.plan:
+            with FEATURE_SECONDS.time(extractor=extractor.name):
+                features.update(extractor.compute(window, features))
+        return features
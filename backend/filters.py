@@ -0,0 +1,90 @@
+"""
+Streaming filter chain and artifact masking for raw EEG chunks
+
+Each tick only the newly drained samples are filtered: a power-line notch
+and a band-pass run as one cascade of second-order sections whose state is
+carried from chunk to chunk per channel, so windows never restart the
+filters or recompute edges. Blinks and motion are masked afterwards by
+amplitude and sample-to-sample derivative thresholds.
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from brainflow.board_shim import BoardIds
+from scipy import signal
+from scipy.ndimage import maximum_filter1d
+
+FILTERS_ENABLED = os.getenv("EEG_FILTERS", "1").lower() in ("1", "true", "yes")
+# Mains frequency for the notch: 60 Hz in the Americas, 50 Hz almost everywhere else
+POWERLINE_FREQ = float(os.getenv("POWERLINE_FREQ", "60"))
+
+DEFAULT_FILTER_CONFIG = {
+    "bandpass": (1.0, 45.0),   # Hz; the high-pass also removes DC drift
+    "order": 4,
+    "notch_q": 30.0,
+    "amplitude_uv": 150.0,     # |x| above this after filtering is an artifact
+    "derivative_uv": 50.0,     # |x[n] - x[n-1]| above this is an artifact
+    "mask_margin_s": 0.1,      # Also mask this much either side of an artifact
+}
+
+# Per-board overrides, keyed by BrainFlow board id
+BOARD_FILTER_CONFIGS: Dict[int, dict] = {
+    BoardIds.GANGLION_BOARD.value: {},
+    # Synthetic channels are scaled up to several hundred uV by design
+    BoardIds.SYNTHETIC_BOARD.value: {"amplitude_uv": 1500.0, "derivative_uv": 600.0},
+}
+
+
+def filter_config(board_id: int) -> dict:
+    """Filter settings for a board: defaults updated with its overrides"""
+    config = dict(DEFAULT_FILTER_CONFIG)
+    config.update(BOARD_FILTER_CONFIGS.get(int(board_id), {}))
+    return config
+
+
+class StreamingFilterChain:
+    """Stateful notch + band-pass over (channels, samples) chunks"""
+
+    def __init__(self, sampling_rate: int, config: dict, powerline_freq: float = POWERLINE_FREQ):
+        self.sampling_rate = sampling_rate
+        self.config = config
+        nyquist = sampling_rate / 2
+        low, high = config["bandpass"]
+        sections = [signal.butter(config["order"], [low, min(high, 0.95 * nyquist)],
+                                  btype="bandpass", fs=sampling_rate, output="sos")]
+        if powerline_freq and powerline_freq < nyquist:
+            b, a = signal.iirnotch(powerline_freq, config["notch_q"], fs=sampling_rate)
+            sections.insert(0, signal.tf2sos(b, a))
+        self.sos = np.vstack(sections)
+        self._zi_unit = signal.sosfilt_zi(self.sos)
+        # Filter state, shape (sections, channels, 2); created from the first chunk
+        self.zi: Optional[np.ndarray] = None
+        self.margin = max(int(config["mask_margin_s"] * sampling_rate), 0)
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, chunk: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filter one chunk of new samples and find artifacts in it
+
+        Returns (filtered, artifact_mask), both shaped like chunk, where the
+        mask is True for samples that should be left out of feature extraction.
+        """
+        chunk = np.atleast_2d(np.asarray(chunk, dtype=float))
+        if chunk.shape[1] == 0:
+            return chunk, np.zeros(chunk.shape, dtype=bool)
+        if self.zi is None or self.zi.shape[1] != chunk.shape[0]:
+            # Start each channel in steady state at its first sample to avoid a step transient
+            self.zi = self._zi_unit[:, None, :] * chunk[:, 0][None, :, None]
+        filtered, self.zi = signal.sosfilt(self.sos, chunk, axis=-1, zi=self.zi)
+        return filtered, self.artifact_mask(filtered)
+
+    def artifact_mask(self, filtered: np.ndarray) -> np.ndarray:
+        mask = np.abs(filtered) > self.config["amplitude_uv"]
+        jumps = np.abs(np.diff(filtered, axis=-1)) > self.config["derivative_uv"]
+        mask[:, 1:] |= jumps
+        if self.margin and mask.any():
+            mask = maximum_filter1d(mask, size=2 * self.margin + 1, axis=-1)
+        return mask
@@ -0,0 +1,160 @@
+"""
+In-memory recent history of streamed frames
+
+Each recording session keeps its last HISTORY_MAX_FRAMES scores and band
+powers in a NumPy ring buffer, so a client that connects or reloads
+mid-session gets a chart straight away (a "history" snapshot) without
+querying the database. Only the last HISTORY_SESSIONS sessions are kept.
+
+Streamed eeg_data frames also carry a per-session sequence number, and the
+last REPLAY_WINDOW_SECONDS of serialized frames are kept as sent, so a client
+that lost its connection (or saw a gap) can "resume" from the last one it
+got and receive just the missed frames.
+"""
+import json
+import math
+import os
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+import numpy as np
+
+from backend.scheduler import UPDATE_HZ
+
+HISTORY_MAX_FRAMES = int(os.getenv("HISTORY_MAX_FRAMES", "3600"))
+HISTORY_SESSIONS = int(os.getenv("HISTORY_SESSIONS", "2"))
+# Default length of the snapshot sent on subscribe
+HISTORY_SNAPSHOT_SECONDS = float(os.getenv("HISTORY_SNAPSHOT_SECONDS", "300"))
+
+# Seconds of frames a resuming client can catch up on, whatever the update rate
+REPLAY_WINDOW_SECONDS = float(os.getenv("REPLAY_WINDOW_SECONDS", "600"))
+
+HISTORY_FIELDS = ("focus_score", "load_score", "anomaly_score", "alpha", "beta", "theta", "gamma")
+
+
+class FrameHistory:
+    """Fixed-capacity ring buffer of one session's frames"""
+
+    def __init__(self, capacity: int = HISTORY_MAX_FRAMES):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity)  # unix seconds
+        self.values = np.full((capacity, len(HISTORY_FIELDS)), np.nan)
+        self.modes = np.zeros(capacity, dtype=np.int16)  # index into mode_names
+        self.mode_names: List[str] = []
+        self.count = 0  # frames ever appended; the newest is at (count - 1) % capacity
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp: float, mode: str, data: dict):
+        slot = self.count % self.capacity
+        self.timestamps[slot] = timestamp
+        for i, field in enumerate(HISTORY_FIELDS):
+            value = data.get(field)
+            self.values[slot, i] = np.nan if value is None else value
+        if mode not in self.mode_names:
+            self.mode_names.append(mode)
+        self.modes[slot] = self.mode_names.index(mode)
+        self.count += 1
+
+    def _ordered(self, array: np.ndarray) -> np.ndarray:
+        """Oldest-first view of a buffer column"""
+        if self.count <= self.capacity:
+            return array[:self.count]
+        start = self.count % self.capacity
+        return np.concatenate((array[start:], array[:start]))
+
+    def snapshot(self, seconds: float) -> dict:
+        """Columns of the frames in the last `seconds`, oldest first"""
+        timestamps = self._ordered(self.timestamps)
+        first = 0
+        if len(timestamps):
+            first = int(np.searchsorted(timestamps, timestamps[-1] - seconds, side="left"))
+        timestamps = timestamps[first:]
+        values = self._ordered(self.values)[first:]
+        modes = self._ordered(self.modes)[first:]
+
+        # Missing values (NaN) become null; modes are sent as runs, not per frame
+        columns = {}
+        for i, field in enumerate(HISTORY_FIELDS):
+            column = values[:, i]
+            columns[field] = np.where(np.isnan(column), None, column).tolist()
+        starts = [0] + (np.flatnonzero(np.diff(modes)) + 1).tolist() if len(modes) else []
+        return {
+            "timestamps": np.round(timestamps * 1000).astype(np.int64).tolist(),
+            "mode_runs": [[start, self.mode_names[modes[start]]] for start in starts],
+            **columns,
+        }
+
+
+class HistoryStore:
+    """Frame histories of the most recent sessions"""
+
+    def __init__(self, capacity: int = HISTORY_MAX_FRAMES, sessions: int = HISTORY_SESSIONS):
+        self.capacity = capacity
+        self.max_sessions = sessions
+        self._sessions: OrderedDict = OrderedDict()
+        self.latest: Optional[int] = None
+
+    def append(self, session_id: Optional[int], timestamp: float, mode: str, data: dict):
+        history = self._sessions.get(session_id)
+        if history is None:
+            history = self._sessions[session_id] = FrameHistory(self.capacity)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self.latest = session_id
+        history.append(timestamp, mode, data)
+
+    def snapshot(self, session_id: Optional[int] = None, seconds: float = HISTORY_SNAPSHOT_SECONDS) -> dict:
+        """A "history" message for a session (default: the latest one)"""
+        if session_id is None:
+            session_id = self.latest
+        history = self._sessions.get(session_id)
+        columns = history.snapshot(seconds) if history is not None else FrameHistory(0).snapshot(seconds)
+        return {"type": "history", "session_id": session_id, "seconds": seconds, **columns}
+
+
+class ReplayWindow:
+    """Sequence numbers and the last serialized frames of the current session"""
+
+    def __init__(self, seconds: float = REPLAY_WINDOW_SECONDS, rate_hz: float = UPDATE_HZ):
+        self.session_id: Optional[int] = None
+        self.seq = 0
+        # One frame per tick
+        self.frames: deque = deque(maxlen=max(math.ceil(seconds * rate_hz), 1))  # (seq, serialized frame)
+
+    def next_seq(self, session_id: Optional[int]) -> int:
+        """Sequence number for the session's next frame; numbering restarts at 1 per session"""
+        if session_id != self.session_id:
+            self.session_id = session_id
+            self.seq = 0
+            self.frames.clear()
+        self.seq += 1
+        return self.seq
+
+    def add(self, seq: int, message_str: str):
+        self.frames.append((seq, message_str))
+
+    def replay(self, session_id: Optional[int], last_seq: int) -> str:
+        """
+        A "replay" message with the frames after last_seq, serialized
+
+        lost counts frames that already left the window. For another
+        session (say one that has since ended) everything in the window is
+        sent with reset set, and the client should drop what it had.
+        """
+        reset = session_id != self.session_id
+        if reset:
+            last_seq = 0
+        frames = [message for seq, message in self.frames if seq > last_seq]
+        first = self.frames[0][0] if self.frames else self.seq + 1
+        header = json.dumps({
+            "type": "replay",
+            "session_id": self.session_id,
+            "from_seq": last_seq + 1,
+            "to_seq": self.seq,
+            "lost": max(first - last_seq - 1, 0),
+            "reset": reset,
+        })
+        # Frames are spliced in as already serialized
+        return f'{header[:-1]}, "frames": [{", ".join(frames)}]}}'
@@ -0,0 +1,192 @@
+"""
+Local IPC bus between the board-owning acquisition process and WebSocket relays
+
+Frames go over a Unix socket, each a fixed header (body length, kind,
+client id) followed by the body. The acquisition process publishes every
+serialized message once per relay, not once per client; relays fan it out
+to their own clients by topic. Client messages travel the other way, and
+replies addressed to one client come back as DIRECT frames.
+"""
+import asyncio
+import os
+import struct
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from backend.metrics import DROPPED_FRAMES
+
+BUS_SOCKET = os.getenv("BUS_SOCKET", "/tmp/neurocalm-bus.sock")
+# A relay further behind than this has its frames dropped instead of buffered
+MAX_RELAY_BUFFER_BYTES = int(os.getenv("BUS_MAX_RELAY_BUFFER_BYTES", str(8 * 1024 * 1024)))
+
+# Frame kinds
+PUBLISH = 1         # acquisition -> relays: message for every subscriber of a topic
+DIRECT = 2          # acquisition -> relay: reply for one client
+CLIENT_OPEN = 3     # relay -> acquisition: a client connected
+CLIENT_MESSAGE = 4  # relay -> acquisition: message from a client
+CLIENT_CLOSED = 5   # relay -> acquisition: a client disconnected
+
+# Body length, kind, client id
+_HEADER = struct.Struct("!IBQ")
+
+
+def encode_frame(kind: int, client_id: int = 0, payload: str = "", topic: Optional[str] = None) -> bytes:
+    body = payload.encode()
+    if kind == PUBLISH:
+        # One length-prefixed topic ("" for everyone) ahead of the message
+        topic_bytes = (topic or "").encode()
+        body = bytes((len(topic_bytes),)) + topic_bytes + body
+    return _HEADER.pack(len(body), kind, client_id) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, int, Optional[str], str]:
+    """Next (kind, client_id, topic, payload); raises IncompleteReadError at EOF"""
+    length, kind, client_id = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    body = await reader.readexactly(length)
+    topic = None
+    if kind == PUBLISH:
+        topic_length = body[0]
+        topic = body[1:1 + topic_length].decode() or None
+        body = body[1 + topic_length:]
+    return kind, client_id, topic, body.decode()
+
+
+class RemoteClient:
+    """Stands in for a relay's WebSocket client inside the acquisition process"""
+
+    def __init__(self, bus: "BusServer", relay_id: int, client_id: int):
+        self.bus = bus
+        self.relay_id = relay_id
+        self.client_id = client_id
+        self.id = f"{relay_id}:{client_id}"
+        # Messages are handled in order per client, like a local connection's receive loop
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    async def send(self, message: str):
+        self.bus.send_direct(self.relay_id, self.client_id, message)
+
+
+class BusServer:
+    """Acquisition side of the bus: accepts relays and routes frames"""
+
+    def __init__(self, path: str,
+                 on_open: Callable[[RemoteClient], Awaitable[None]],
+                 on_message: Callable[[RemoteClient, str], Awaitable[None]],
+                 on_close: Callable[[RemoteClient], Awaitable[None]]):
+        self.path = path
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_close = on_close
+        self.relays: Dict[int, asyncio.StreamWriter] = {}
+        self.clients: Dict[Tuple[int, int], RemoteClient] = {}
+        self._next_relay_id = 1
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            # Left behind by a previous run; only one acquisition process owns the bus
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle_relay, self.path)
+        print(f"IPC bus listening on {self.path}")
+
+    def publish(self, message: str, topic: Optional[str] = None):
+        """Send a serialized message to every relay, encoded once"""
+        frame = encode_frame(PUBLISH, payload=message, topic=topic)
+        for writer in list(self.relays.values()):
+            self._write(writer, frame)
+
+    def send_direct(self, relay_id: int, client_id: int, message: str):
+        writer = self.relays.get(relay_id)
+        if writer is not None:
+            self._write(writer, encode_frame(DIRECT, client_id, message))
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, frame: bytes):
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > MAX_RELAY_BUFFER_BYTES:
+            DROPPED_FRAMES.inc(reason="relay_backpressure")
+            return
+        writer.write(frame)
+
+    async def _handle_relay(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        relay_id = self._next_relay_id
+        self._next_relay_id += 1
+        self.relays[relay_id] = writer
+        print(f"Relay {relay_id} connected to the bus")
+        try:
+            while True:
+                kind, client_id, _, payload = await read_frame(reader)
+                key = (relay_id, client_id)
+                if kind == CLIENT_OPEN:
+                    client = RemoteClient(self, relay_id, client_id)
+                    client.task = asyncio.create_task(self._client_loop(client))
+                    self.clients[key] = client
+                    await self.on_open(client)
+                elif kind == CLIENT_MESSAGE and key in self.clients:
+                    self.clients[key].inbox.put_nowait(payload)
+                elif kind == CLIENT_CLOSED and key in self.clients:
+                    await self._close_client(self.clients.pop(key))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.relays.pop(relay_id, None)
+            for key in [key for key in self.clients if key[0] == relay_id]:
+                await self._close_client(self.clients.pop(key))
+            writer.close()
+            print(f"Relay {relay_id} disconnected from the bus")
+
+    async def _client_loop(self, client: RemoteClient):
+        while True:
+            message = await client.inbox.get()
+            await self.on_message(client, message)
+            # A full inbox doesn't suspend; yield so other clients get a turn
+            await asyncio.sleep(0)
+
+    async def _close_client(self, client: RemoteClient):
+        if client.task:
+            client.task.cancel()
+        await self.on_close(client)
+
+
+class BusClient:
+    """Relay side of the bus: one connection to the acquisition process, reconnected on loss"""
+
+    def __init__(self, path: str, on_frame: Callable[[int, int, Optional[str], str], Awaitable[None]],
+                 on_connect: Optional[Callable[[], Awaitable[None]]] = None):
+        self.path = path
+        self.on_frame = on_frame
+        self.on_connect = on_connect
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    def send(self, kind: int, client_id: int, payload: str = "") -> bool:
+        if not self.connected:
+            return False
+        self.writer.write(encode_frame(kind, client_id, payload))
+        return True
+
+    async def run(self):
+        delay = 0.5
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionError):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+            print(f"Connected to the IPC bus at {self.path}")
+            delay = 0.5
+            try:
+                if self.on_connect:
+                    await self.on_connect()
+                while True:
+                    await self.on_frame(*await read_frame(reader))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                print("Lost the IPC bus; reconnecting")
+            finally:
+                self.writer.close()
+                self.writer = None
@@ -1,24 +1,151 @@
 """
 Main entry point for backend services
 Starts both the FastAPI server and WebSocket server
+
+With API_WORKERS > 1 or WS_RELAYS > 0 it runs as a supervisor instead: N
+uvicorn API workers, one acquisition process that owns the board, and M
+WebSocket relays sharing the public port, restarting any that exit.
 """
+import argparse
 import asyncio
+import os
+import signal
+import socket
+import time
 import uvicorn
 from multiprocessing import Process
 from datetime import datetime
-from backend.api import app
+from typing import Callable, Dict, Optional, Tuple
 from backend.websocket_server import WebSocketServer
 from backend.firebase_service import FirebaseService
+from backend.ipc import BUS_SOCKET
+from backend.database import init_db
+
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+WS_RELAYS = int(os.getenv("WS_RELAYS", "0"))
+WS_PORT = int(os.getenv("WS_PORT", "8765"))
+# The acquisition process still serves /metrics (and direct clients) on this port
+ACQUISITION_PORT = int(os.getenv("ACQUISITION_PORT", "8766"))
+# Restart delays double per rapid exit, from RESTART_BACKOFF_SECONDS up to the max;
+# a service exiting RESTART_MAX_FAILURES times in a row within RESTART_RAPID_SECONDS
+# of starting is given up on
+RESTART_BACKOFF_SECONDS = float(os.getenv("RESTART_BACKOFF_SECONDS", "1"))
+RESTART_MAX_BACKOFF_SECONDS = float(os.getenv("RESTART_MAX_BACKOFF_SECONDS", "60"))
+RESTART_MAX_FAILURES = int(os.getenv("RESTART_MAX_FAILURES", "5"))
+RESTART_RAPID_SECONDS = float(os.getenv("RESTART_RAPID_SECONDS", "30"))
 
 def run_api():
     """Run FastAPI server"""
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run("backend.api:app", host="0.0.0.0", port=8000)
+
+def run_api_worker(sock: socket.socket):
+    """Run one FastAPI worker on a listening socket shared with the other workers"""
+    uvicorn.Server(uvicorn.Config("backend.api:app")).run(sockets=[sock])
 
 def run_websocket():
     """Run WebSocket server"""
     server = WebSocketServer()
     asyncio.run(server.start())
 
+def run_acquisition(bus_path: str = BUS_SOCKET):
+    """Run the board-owning WebSocket server behind relays"""
+    server = WebSocketServer(port=ACQUISITION_PORT)
+    asyncio.run(server.start_acquisition(bus_path))
+
+def run_relay(bus_path: str = BUS_SOCKET):
+    """Run one WebSocket relay on the public port"""
+    from backend.relay import RelayServer
+    relay = RelayServer(port=WS_PORT, bus_path=bus_path)
+    asyncio.run(relay.start())
+
+class RestartBackoff:
+    """Per-service restart delays: exponential while a service keeps exiting soon after starting"""
+    
+    def __init__(self, base: float = RESTART_BACKOFF_SECONDS, cap: float = RESTART_MAX_BACKOFF_SECONDS,
+                 max_failures: int = RESTART_MAX_FAILURES, rapid: float = RESTART_RAPID_SECONDS):
+        self.base = base
+        self.cap = cap
+        self.max_failures = max_failures
+        self.rapid = rapid
+        self.started_at: Dict[str, float] = {}
+        self.failures: Dict[str, int] = {}
+    
+    def started(self, name: str, now: float):
+        self.started_at[name] = now
+    
+    def exited(self, name: str, now: float) -> Optional[float]:
+        """Seconds to wait before restarting name, or None to give up on it"""
+        if now - self.started_at.get(name, now) >= self.rapid:
+            # It ran for a while, so this isn't a crash loop
+            self.failures[name] = 0
+        failures = self.failures[name] = self.failures.get(name, 0) + 1
+        if failures > self.max_failures:
+            return None
+        return min(self.base * 2 ** (failures - 1), self.cap)
+
+def supervise(api_workers: int, relays: int, bus_path: str = BUS_SOCKET):
+    """Run every service in its own process and restart any that exit"""
+    # Create tables once up front; workers creating them concurrently would race
+    init_db()
+    
+    # Bound once here so restarted workers rejoin the same listening socket
+    api_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    api_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    api_socket.bind(("0.0.0.0", 8000))
+    api_socket.listen(2048)
+    
+    services: Dict[str, Tuple[Callable, tuple]] = {"acquisition": (run_acquisition, (bus_path,))}
+    for index in range(api_workers):
+        services[f"api-{index}"] = (run_api_worker, (api_socket,))
+    for index in range(relays):
+        services[f"relay-{index}"] = (run_relay, (bus_path,))
+    
+    processes: Dict[str, Process] = {}
+    backoff = RestartBackoff()
+    restarts: Dict[str, float] = {}  # name -> monotonic time it's due to restart
+    def spawn(name: str):
+        target, args = services[name]
+        process = Process(target=target, args=args, name=name)
+        process.start()
+        processes[name] = process
+        backoff.started(name, time.monotonic())
+        print(f"Started {name} (pid {process.pid})")
+    
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, stop)
+    
+    for name in services:
+        spawn(name)
+    try:
+        while not stopping and (processes or restarts):
+            time.sleep(1)
+            now = time.monotonic()
+            for name, process in list(processes.items()):
+                if not process.is_alive():
+                    del processes[name]
+                    delay = backoff.exited(name, now)
+                    if delay is None:
+                        print(f"{name} exited with code {process.exitcode}; "
+                              f"giving up after {backoff.max_failures} rapid restarts")
+                        continue
+                    print(f"{name} exited with code {process.exitcode}; restarting in {delay:g}s")
+                    restarts[name] = now + delay
+            for name, due in list(restarts.items()):
+                if now >= due:
+                    del restarts[name]
+                    spawn(name)
+    except KeyboardInterrupt:
+        pass
+    print("Shutting down...")
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join(timeout=10)
+    api_socket.close()
+
 def test_firebase_insert():
     """Test function to insert sample data into Firestore"""
     print("\n" + "="*50)
@@ -113,8 +240,20 @@ def test_firebase_insert():
         return False
 
 if __name__ == "__main__":
-    # Run Firebase test before starting servers
-    test_firebase_insert()
+    parser = argparse.ArgumentParser(description="Run the NeuroCalm backend")
+    parser.add_argument("--api-workers", type=int, default=API_WORKERS, help="uvicorn worker processes")
+    parser.add_argument("--relays", type=int, default=WS_RELAYS,
+                        help="WebSocket relay processes; 0 serves clients from the board-owning process")
+    parser.add_argument("--test-firebase", action="store_true",
+                        help="insert and read back sample Firestore documents before starting")
+    args = parser.parse_args()
+    
+    if args.test_firebase:
+        test_firebase_insert()
+    
+    if args.api_workers > 1 or args.relays > 0:
+        supervise(max(args.api_workers, 1), max(args.relays, 1))
+        raise SystemExit(0)
     
     # Start API server in a separate process
     api_process = Process(target=run_api)
@@ -0,0 +1,256 @@
+"""
+Prometheus-style metrics registry for the EEG pipeline
+Exposes counters, gauges and histograms in the text exposition format
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from sub-millisecond DSP up to slow Firestore writes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric(ABC):
+    """Base class for a metric family keyed by label values"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Exposition lines for every label set of this family"""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0.0)]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0.0)]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed upper bounds"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = [[0] * (len(self.buckets) + 1), 0.0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time of its block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1])) for key, state in self._values.items()]
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# ==================== Pipeline metrics ====================
+
+BOARD_READ_SECONDS = REGISTRY.histogram(
+    "neurocalm_board_read_seconds", "Time spent draining samples from the BrainFlow ring buffer")
+PSD_SECONDS = REGISTRY.histogram(
+    "neurocalm_psd_seconds", "Time spent computing band powers and scores for one tick")
+DB_COMMIT_SECONDS = REGISTRY.histogram(
+    "neurocalm_db_commit_seconds", "Time spent committing events to the database")
+FIRESTORE_WRITE_SECONDS = REGISTRY.histogram(
+    "neurocalm_firestore_write_seconds", "Time spent writing events to Firestore")
+FEATURE_SECONDS = REGISTRY.histogram(
+    "neurocalm_feature_seconds", "Time spent in each feature extractor per tick", ("extractor",))
+FILTER_SECONDS = REGISTRY.histogram(
+    "neurocalm_filter_seconds", "Time spent in the notch/band-pass chain and artifact masking")
+BROADCAST_SECONDS = REGISTRY.histogram(
+    "neurocalm_broadcast_seconds", "Time spent fanning a message out to WebSocket clients")
+COMPACTION_SECONDS = REGISTRY.histogram(
+    "neurocalm_compaction_seconds", "Time spent in one retention compaction transaction", ("step",))
+TICK_LATENESS_SECONDS = REGISTRY.histogram(
+    "neurocalm_tick_lateness_seconds", "How long after its deadline the scheduler released a stream tick",
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 1.0))
+COMMAND_SECONDS = REGISTRY.histogram(
+    "neurocalm_command_seconds", "Time from accepting a long-running client command to its end",
+    ("command", "state"), buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+DROPPED_FRAMES = REGISTRY.counter(
+    "neurocalm_dropped_frames_total", "Ticks or client sends that produced no delivered frame", ("reason",))
+FAILED_SYNCS = REGISTRY.counter(
+    "neurocalm_failed_syncs_total", "Failed writes to a storage backend", ("target",))
+CLIENT_CONNECTIONS = REGISTRY.counter(
+    "neurocalm_client_connections_total", "WebSocket client connections accepted")
+BOARD_RECONNECTS = REGISTRY.counter(
+    "neurocalm_board_reconnects_total", "Board reconnect attempts", ("result",))
+COMPACTED_ROWS = REGISTRY.counter(
+    "neurocalm_compacted_rows_total", "Rows removed by retention after being rolled up or expiring", ("table",))
+MISSED_TICKS = REGISTRY.counter(
+    "neurocalm_missed_ticks_total", "Stream ticks dropped because their deadline passed while busy", ("policy",))
+DATA_GAP_SECONDS = REGISTRY.counter(
+    "neurocalm_data_gap_seconds_total", "Estimated seconds of samples lost to dropouts and reconnects")
+
+COMMANDS_IN_FLIGHT = REGISTRY.gauge(
+    "neurocalm_commands_in_flight", "Long-running client commands queued or running")
+CONNECTED_CLIENTS = REGISTRY.gauge(
+    "neurocalm_connected_clients", "WebSocket clients currently connected")
+SEND_QUEUE_BYTES = REGISTRY.gauge(
+    "neurocalm_send_queue_bytes", "Bytes buffered in WebSocket transports waiting to be sent")
+BOARD_BUFFER_SAMPLES = REGISTRY.gauge(
+    "neurocalm_board_buffer_samples", "Samples waiting in the BrainFlow ring buffer before a read")
+BOARD_BUFFER_FILL = REGISTRY.gauge(
+    "neurocalm_board_buffer_fill_ratio", "Fraction of the BrainFlow ring buffer in use before a read")
+BOARD_CONNECTED = REGISTRY.gauge(
+    "neurocalm_board_connected", "1 while the board is streaming, 0 while it is stalled or reconnecting")
+ARTIFACT_FRACTION = REGISTRY.gauge(
+    "neurocalm_artifact_fraction", "Fraction of the last tick's samples masked as artifacts")
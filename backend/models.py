@@ -57,3 +57,11 @@ class FirebaseResponse(BaseModel):
 
 
 
+
+class ProfileRequest(BaseModel):
+    """Time-boxed profiling run of the API process (see backend/profiler.py)"""
+    mode: str = "sample"  # sample or memory (cprofile: WebSocket server only)
+    seconds: float = 10.0
+    interval: float = 0.005  # between stack samples
+    memory: bool = False  # add tracemalloc growth to a sample run
+    top: int = 30
@@ -0,0 +1,367 @@
+"""
+PostgreSQL storage profile
+
+With DATABASE_URL pointing at PostgreSQL, init_db() creates events as a
+time-partitioned table: a TimescaleDB hypertable when the extension is
+available, otherwise native range partitions of PG_PARTITION_DAYS days
+(created ahead of time, with a default partition as a safety net).
+
+/stats reads the event_stats_hourly aggregate: a real-time continuous
+aggregate under TimescaleDB, otherwise a rollup table refreshed up to a
+watermark, with events since the watermark aggregated on the fly. The
+batch writer (backend/event_writer.py) ingests with COPY and keeps
+partitions and the rollup up to date.
+
+Usage:
+    python -m backend.postgres status
+    python -m backend.postgres refresh-stats --full   # after backfilling old events
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.database import Event
+
+PARTITION_DAYS = int(os.getenv("PG_PARTITION_DAYS", "7"))
+# Partitions kept created beyond the current one
+PARTITIONS_AHEAD = int(os.getenv("PG_PARTITIONS_AHEAD", "2"))
+# "auto" uses TimescaleDB when the server has it, "off" always uses native partitioning
+TIMESCALE = os.getenv("PG_TIMESCALE", "auto")
+# Hours before the watermark re-aggregated on each refresh, to pick up late rows
+STATS_LATE_HOURS = int(os.getenv("PG_STATS_LATE_HOURS", "1"))
+
+STATS_VIEW = "event_stats_hourly"
+DEFAULT_PARTITION = "events_default"
+# Monday, so 7-day partitions run Monday to Monday
+PARTITION_EPOCH = datetime(2024, 1, 1)
+
+
+def timescale_available(conn: Connection) -> bool:
+    """Whether TimescaleDB is (or can be) installed in this database"""
+    if TIMESCALE == "off":
+        return False
+    if conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")).scalar():
+        return True
+    if not conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'timescaledb'")).scalar():
+        return False
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+        return True
+    except Exception as e:
+        # Typically not in shared_preload_libraries
+        print(f"TimescaleDB is available but couldn't be enabled ({e}); using native partitioning")
+        return False
+
+
+def is_hypertable(conn: Connection) -> bool:
+    if not conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")).scalar():
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM timescaledb_information.hypertables WHERE hypertable_name = 'events'"
+    )).scalar())
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('events')"
+    )).scalar())
+
+
+def create_events_table(engine: Engine):
+    """Create events partitioned by timestamp, if it doesn't exist yet
+
+    Unique keys on a partitioned table must include the partition column, so
+    the primary key is (id, timestamp); id is still unique (a sequence) and
+    the ORM keeps treating it as the key. Tables referenced by events'
+    foreign keys are created first.
+    """
+    from backend.database import Base
+
+    table = Event.__table__
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT to_regclass('events')")).scalar():
+            if not is_partitioned(conn) and not is_hypertable(conn):
+                print("⚠️  events is an ordinary table; it stays unpartitioned (recreate it to partition)")
+            return
+        referenced = {fk.column.table for fk in table.foreign_keys}
+        Base.metadata.create_all(conn, tables=list(referenced))
+
+        columns = [str(CreateColumn(column).compile(dialect=conn.dialect)) for column in table.columns]
+        constraints = ["PRIMARY KEY (id, timestamp)"] + [
+            f"FOREIGN KEY ({fk.parent.name}) REFERENCES {fk.column.table.name} ({fk.column.name})"
+            for fk in table.foreign_keys
+        ]
+        timescale = timescale_available(conn)
+        ddl = f"CREATE TABLE events ({', '.join(columns + constraints)})"
+        if timescale:
+            conn.execute(text(ddl))
+            conn.execute(text(
+                "SELECT create_hypertable('events', 'timestamp', "
+                f"chunk_time_interval => INTERVAL '{PARTITION_DAYS} days')"
+            ))
+            print(f"Created events as a TimescaleDB hypertable ({PARTITION_DAYS}-day chunks)")
+        else:
+            conn.execute(text(ddl + " PARTITION BY RANGE (timestamp)"))
+            conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF events DEFAULT"))
+            print(f"Created events with native {PARTITION_DAYS}-day range partitions")
+
+
+def setup_storage(engine: Engine):
+    """Create upcoming partitions and the stats aggregate"""
+    ensure_partitions(engine)
+    create_stats_aggregate(engine)
+    refresh_stats(engine)
+
+
+# ==================== Partitions ====================
+
+def partition_start(moment: datetime) -> datetime:
+    periods = (moment - PARTITION_EPOCH) // timedelta(days=PARTITION_DAYS)
+    return PARTITION_EPOCH + periods * timedelta(days=PARTITION_DAYS)
+
+
+def partition_name(start: datetime) -> str:
+    return f"events_p{start:%Y%m%d}"
+
+
+def ensure_partitions(engine: Engine, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[str]:
+    """Create the partitions covering [start, end]; by default now through PARTITIONS_AHEAD more
+
+    Rows already in the default partition for a new range are moved into it,
+    which is only the case after writing far outside the precreated range.
+    """
+    now = datetime.utcnow()
+    start = partition_start(start or now)
+    end = end or now + timedelta(days=PARTITION_DAYS * PARTITIONS_AHEAD)
+    created = []
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return created
+        existing = set(conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass('events')"
+        )).scalars())
+        while start <= end:
+            upper = start + timedelta(days=PARTITION_DAYS)
+            name = partition_name(start)
+            if name not in existing:
+                _create_partition(conn, name, start, upper)
+                created.append(name)
+            start = upper
+    if created:
+        print(f"Created event partitions: {', '.join(created)}")
+    return created
+
+
+def _create_partition(conn: Connection, name: str, lower: datetime, upper: datetime):
+    bounds = {"lower": lower, "upper": upper}
+    bounds_sql = f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    has_default = conn.execute(text(f"SELECT to_regclass('{DEFAULT_PARTITION}')")).scalar()
+    stray = has_default and conn.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper LIMIT 1"
+    ), bounds).scalar()
+    if not stray:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF events {bounds_sql}"))
+        return
+    # A partition can't be added while the default holds rows in its range
+    conn.execute(text(f"ALTER TABLE events DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(f"CREATE TABLE {name} PARTITION OF events {bounds_sql}"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    conn.execute(text(f"ALTER TABLE events ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+# ==================== COPY ingestion ====================
+
+def _copy_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def copy_rows(conn: Connection, table: str, columns: Sequence[str], rows: Iterable) -> int:
+    """
+    Bulk-insert rows with COPY FROM STDIN; missing keys and None become NULL
+
+    Rows are dicts, or tuples with a value per column in `columns` order.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    count = 0
+    for row in rows:
+        # NULL is written as \N so that empty strings stay empty strings
+        values = [row.get(c) for c in columns] if isinstance(row, dict) else row
+        writer.writerow(["\\N" if value is None else _copy_value(value) for value in values])
+        count += 1
+    buffer.seek(0)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+    return count
+
+
+# ==================== Stats aggregate ====================
+
+_AGGREGATES = (
+    "count(*) AS events, sum(focus_score) AS focus_sum, "
+    "sum(load_score) AS load_sum, sum(anomaly_score) AS anomaly_sum"
+)
+
+
+def create_stats_aggregate(engine: Engine):
+    """Per user, mode and hour event counts and score sums"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS event_stats_refresh (name VARCHAR PRIMARY KEY, refreshed_to TIMESTAMP)"
+        ))
+        if conn.execute(text(f"SELECT to_regclass('{STATS_VIEW}')")).scalar():
+            return
+        hypertable = is_hypertable(conn)
+        if not hypertable:
+            conn.execute(text(
+                f"CREATE TABLE {STATS_VIEW} (user_id VARCHAR NOT NULL, mode VARCHAR NOT NULL, "
+                "bucket TIMESTAMP NOT NULL, events BIGINT NOT NULL, focus_sum DOUBLE PRECISION, "
+                "load_sum DOUBLE PRECISION, anomaly_sum DOUBLE PRECISION, PRIMARY KEY (user_id, mode, bucket))"
+            ))
+            conn.execute(text(
+                "INSERT INTO event_stats_refresh (name, refreshed_to) VALUES (:name, :epoch)"
+            ), {"name": STATS_VIEW, "epoch": datetime(1970, 1, 1)})
+            return
+    # Continuous aggregates can't be created inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(
+            f"CREATE MATERIALIZED VIEW {STATS_VIEW} "
+            "WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS "
+            f"SELECT user_id, coalesce(mode, '') AS mode, time_bucket(INTERVAL '1 hour', timestamp) AS bucket, "
+            f"{_AGGREGATES} FROM events GROUP BY 1, 2, 3 WITH NO DATA"
+        ))
+        conn.execute(text(
+            f"SELECT add_continuous_aggregate_policy('{STATS_VIEW}', start_offset => INTERVAL '3 days', "
+            "end_offset => INTERVAL '1 hour', schedule_interval => INTERVAL '15 minutes')"
+        ))
+    print(f"Created continuous aggregate {STATS_VIEW}")
+
+
+def stats_watermark(conn: Connection) -> Optional[datetime]:
+    """End of the materialized rollup, or None when the aggregate is always complete (TimescaleDB)"""
+    return conn.execute(text(
+        "SELECT refreshed_to FROM event_stats_refresh WHERE name = :name"
+    ), {"name": STATS_VIEW}).scalar()
+
+
+def refresh_stats(engine: Engine, full: bool = False) -> Optional[datetime]:
+    """Roll events up to the last whole hour; cheap when that hour is already done"""
+    with engine.begin() as conn:
+        if not conn.execute(text(f"SELECT to_regclass('{STATS_VIEW}')")).scalar():
+            return None
+        mark = stats_watermark(conn)
+        oldest = None
+        if full:
+            # Buckets before the oldest event are kept: their events may have been compacted
+            oldest = conn.execute(text("SELECT date_trunc('hour', min(timestamp)) FROM events")).scalar()
+        if mark is None:
+            if full and oldest is not None:
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as auto:
+                    auto.execute(text(f"CALL refresh_continuous_aggregate('{STATS_VIEW}', :oldest, NULL)"),
+                                 {"oldest": oldest})
+            return None
+        target = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        if target <= mark and not full:
+            return mark
+        if full and oldest is None:
+            return mark
+        since = oldest if full else mark - timedelta(hours=STATS_LATE_HOURS)
+        bounds = {"since": since, "until": target}
+        conn.execute(text(
+            f"DELETE FROM {STATS_VIEW} WHERE bucket >= :since AND bucket < :until"
+        ), bounds)
+        conn.execute(text(
+            f"INSERT INTO {STATS_VIEW} (user_id, mode, bucket, events, focus_sum, load_sum, anomaly_sum) "
+            f"SELECT user_id, coalesce(mode, ''), date_trunc('hour', timestamp), {_AGGREGATES} FROM events "
+            "WHERE timestamp >= :since AND timestamp < :until GROUP BY 1, 2, 3"
+        ), bounds)
+        conn.execute(text(
+            "UPDATE event_stats_refresh SET refreshed_to = :until WHERE name = :name"
+        ), {"until": target, "name": STATS_VIEW})
+        return target
+
+
+def stats_by_mode(conn: Connection, user_id: str) -> List[tuple]:
+    """(mode, events, focus_sum, load_sum, anomaly_sum) for a user, from the aggregate"""
+    mark = stats_watermark(conn)
+    if mark is None:
+        query = (
+            "SELECT mode, sum(events)::bigint, sum(focus_sum), sum(load_sum), sum(anomaly_sum) "
+            f"FROM {STATS_VIEW} WHERE user_id = :user_id GROUP BY mode"
+        )
+    else:
+        # Materialized buckets before the watermark, raw events after it
+        query = (
+            "SELECT mode, sum(events)::bigint, sum(focus_sum), sum(load_sum), sum(anomaly_sum) FROM ("
+            f"SELECT mode, events, focus_sum, load_sum, anomaly_sum FROM {STATS_VIEW} "
+            "WHERE user_id = :user_id AND bucket < :mark "
+            f"UNION ALL SELECT coalesce(mode, '') AS mode, {_AGGREGATES} FROM events "
+            "WHERE user_id = :user_id AND timestamp >= :mark GROUP BY 1"
+            ") combined GROUP BY mode"
+        )
+    return [tuple(row) for row in conn.execute(text(query), {"user_id": user_id, "mark": mark})]
+
+
+def has_stats_aggregate(conn: Connection) -> bool:
+    return bool(conn.execute(text(f"SELECT to_regclass('{STATS_VIEW}')")).scalar())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PostgreSQL storage maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="Show how events are stored")
+    refresh = sub.add_parser("refresh-stats", help="Refresh the hourly stats aggregate")
+    refresh.add_argument("--full", action="store_true", help="Re-aggregate all events, e.g. after a backfill")
+    partitions = sub.add_parser("partitions", help="Create partitions for a date range")
+    partitions.add_argument("--start", type=datetime.fromisoformat, required=True)
+    partitions.add_argument("--end", type=datetime.fromisoformat, required=True)
+    args = parser.parse_args()
+
+    from backend.database import engine, init_db
+    if engine.dialect.name != "postgresql":
+        parser.error("DATABASE_URL is not a PostgreSQL database")
+    init_db()
+    if args.command == "refresh-stats":
+        print(f"Stats refreshed to {refresh_stats(engine, full=args.full) or 'now (continuous aggregate)'}")
+    elif args.command == "partitions":
+        ensure_partitions(engine, args.start, args.end)
+    with engine.connect() as conn:
+        layout = "hypertable" if is_hypertable(conn) else "partitioned" if is_partitioned(conn) else "unpartitioned"
+        partitions_count = conn.execute(text(
+            "SELECT count(*) FROM pg_inherits WHERE inhparent = to_regclass('events')"
+        )).scalar()
+        print(f"events: {layout}, {partitions_count} partitions/chunks")
+        print(f"{STATS_VIEW}: {'materialized to ' + str(stats_watermark(conn)) if stats_watermark(conn) else 'continuous'}")
+
+
+if __name__ == "__main__":
+    main()
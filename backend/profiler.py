@@ -0,0 +1,218 @@
+"""
+On-demand profiling of a live process
+
+An admin can run a time-boxed profile inside the running API or WebSocket
+server, without restarting it under a profiler:
+- "sample": a background thread records every thread's Python stack each
+  `interval` seconds; stacks come back collapsed ("a;b;c count" per line),
+  ready for flamegraph.pl or speedscope
+- "cprofile": deterministic cProfile of the event loop thread, returned as
+  the top functions by cumulative time. Work handed to other threads
+  (asyncio.to_thread, the API's sync routes) isn't seen, so the API
+  rejects this mode
+- "memory": tracemalloc snapshots at the start and end, returned as the
+  source lines whose allocations grew the most
+
+memory=True adds the tracemalloc comparison to a sample or cprofile run.
+Nothing is installed until a run starts and all of it is removed when it
+ends, so there is no overhead while idle. Only one run at a time per
+process. Profiling needs ADMIN_TOKEN to be set; it is off otherwise.
+"""
+import asyncio
+import cProfile
+import hmac
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_MODES = ("sample", "cprofile", "memory")
+# Frames kept per tracemalloc allocation trace
+TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running in this process"""
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Whether token matches ADMIN_TOKEN (always False when it isn't set)"""
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(str(token), ADMIN_TOKEN)
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_PROJECT_ROOT):
+        return os.path.relpath(filename, _PROJECT_ROOT)
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            return filename[len(path) + 1:]
+    return filename
+
+
+class StackSampler:
+    """Samples the Python stacks of all other threads from a daemon thread"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._labels = {}  # code object -> frame label
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """One "frame;frame;... count" line per distinct stack, root first"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """Time-boxed profiling runs of the current process, one at a time"""
+
+    _instance = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide profiler"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, mode: str = "sample", seconds: float = 10.0, interval: float = 0.005,
+                  memory: bool = False, top: int = 30) -> dict:
+        """
+        Profile for `seconds` (at most PROFILE_MAX_SECONDS) and return the results
+
+        Must be awaited on the event loop being profiled; raises ValueError
+        for an unknown mode and ProfilerBusy while another run is active.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; expected one of {', '.join(PROFILE_MODES)}")
+        seconds = min(max(float(seconds), 0.1), PROFILE_MAX_SECONDS)
+        interval = min(max(float(interval), 0.001), 1.0)
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return await self._run(mode, seconds, interval, memory or mode == "memory", int(top))
+        finally:
+            self._lock.release()
+
+    async def _run(self, mode: str, seconds: float, interval: float, memory: bool, top: int) -> dict:
+        result = {"mode": mode, "seconds": seconds, "pid": os.getpid()}
+        sampler = StackSampler(interval) if mode == "sample" else None
+        profile = cProfile.Profile() if mode == "cprofile" else None
+
+        started_tracing = False
+        if memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                started_tracing = True
+            before = tracemalloc.take_snapshot()
+
+        began = time.perf_counter()
+        try:
+            if sampler is not None:
+                sampler.start()
+            if profile is not None:
+                # Covers this thread, i.e. everything the event loop runs meanwhile
+                profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                if sampler is not None:
+                    await asyncio.to_thread(sampler.stop)
+            result["elapsed_seconds"] = round(time.perf_counter() - began, 3)
+
+            if sampler is not None:
+                result["interval"] = interval
+                result["samples"] = sampler.samples
+                result["collapsed"] = sampler.collapsed()
+            if profile is not None:
+                result["functions"] = self._top_functions(profile, top)
+            if memory:
+                result["memory"] = self._memory_growth(before, top)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+        return result
+
+    @staticmethod
+    def _top_functions(profile: cProfile.Profile, top: int) -> list:
+        stats = pstats.Stats(profile).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        return [
+            {
+                "function": f"{name} ({_short_path(filename)}:{line})",
+                "calls": calls,
+                "primitive_calls": primitive,
+                "own_seconds": round(own, 6),
+                "cumulative_seconds": round(cumulative, 6),
+            }
+            for (filename, line, name), (primitive, calls, own, cumulative, _) in rows
+        ]
+
+    @staticmethod
+    def _memory_growth(before: tracemalloc.Snapshot, top: int) -> dict:
+        # Leave out the profiler's own allocations
+        ignore = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, pstats)]
+        ignore.append(tracemalloc.Filter(False, __file__))
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        current, peak = tracemalloc.get_traced_memory()
+        growth = after.compare_to(before.filter_traces(ignore), "lineno")[:top]
+        return {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "location": f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                    "size_bytes": stat.size,
+                    "size_diff_bytes": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in growth
+            ],
+        }
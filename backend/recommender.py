@@ -0,0 +1,318 @@
+"""
+Contextual-bandit relaxation recommendations
+
+Each user has a disjoint LinUCB model (one ridge regression per action)
+over a small context vector built from the EEG score stream, the current
+mode and context. A recommendation is rewarded by how focus and load move
+in the minutes after it is issued. Inverse covariance matrices are updated
+with Sherman-Morrison, O(d^2) per event, and models are stored as one .npz
+file per user.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Action name -> message shown to the user
+ACTIONS = {
+    "continue": "You're doing fine - keep going.",
+    "box_breathing": "Try box breathing: in 4s, hold 4s, out 4s, hold 4s, for two minutes.",
+    "short_break": "Step away from the screen for five minutes.",
+    "stretch": "Stand up and stretch your neck, shoulders and back.",
+    "ambient_sound": "Put on some calm ambient sound or music.",
+    "mindful_pause": "Close your eyes and take ten slow breaths.",
+}
+ACTION_NAMES = tuple(ACTIONS)
+MODES = ("meeting", "study", "lecture", "background")
+# Bump whenever the context vector layout changes; older model files are ignored
+FEATURE_VERSION = 1
+CONTEXT_DIM = 15
+
+POLICY = os.getenv("RECOMMENDER_POLICY", "linucb")  # linucb | thompson
+EXPLORATION = float(os.getenv("RECOMMENDER_ALPHA", "0.5"))
+RIDGE = 1.0
+# Outcome window: ticks between SETTLE and REWARD_DELAY seconds after a recommendation
+SETTLE_SECONDS = float(os.getenv("RECOMMENDER_SETTLE_SECONDS", "10"))
+REWARD_DELAY = float(os.getenv("RECOMMENDER_REWARD_DELAY", "120"))
+MAX_PENDING_PER_USER = 8
+# EWMA weight per tick for the smoothed scores in the context
+SMOOTHING = 1.0 / 30
+MODEL_DIR = os.getenv(
+    "RECOMMENDER_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "recommender_models"),
+)
+
+
+class UserState:
+    """Latest and smoothed scores for one user, enough to build a context vector"""
+
+    def __init__(self):
+        self.focus = 50.0
+        self.load = 50.0
+        self.anomaly = 0.0
+        self.focus_avg: Optional[float] = None
+        self.load_avg: Optional[float] = None
+
+    def update(self, focus: float, load: float, anomaly: float):
+        self.focus, self.load, self.anomaly = focus, load, anomaly
+        if self.focus_avg is None:
+            self.focus_avg, self.load_avg = focus, load
+        else:
+            self.focus_avg += SMOOTHING * (focus - self.focus_avg)
+            self.load_avg += SMOOTHING * (load - self.load_avg)
+
+    def context_vector(self, mode: str, context: Optional[dict], now: Optional[datetime] = None) -> np.ndarray:
+        focus_avg = self.focus if self.focus_avg is None else self.focus_avg
+        load_avg = self.load if self.load_avg is None else self.load_avg
+        hour = (now or datetime.now()).hour
+        x = np.zeros(CONTEXT_DIM)
+        x[0] = 1.0
+        x[1:4] = (self.focus / 100, self.load / 100, self.anomaly / 100)
+        x[4:6] = (focus_avg / 100, load_avg / 100)
+        x[6:8] = ((self.focus - focus_avg) / 100, (self.load - load_avg) / 100)
+        if mode in MODES:
+            x[8 + MODES.index(mode)] = 1.0
+        x[12] = 1.0 if (context or {}).get("calendar_event_id") else 0.0
+        x[13:15] = (math.sin(2 * math.pi * hour / 24), math.cos(2 * math.pi * hour / 24))
+        return x
+
+
+class LinUCBModel:
+    """Disjoint LinUCB over all actions at once, stored as stacked arrays"""
+
+    def __init__(self, num_actions: int = len(ACTION_NAMES), dim: int = CONTEXT_DIM, ridge: float = RIDGE):
+        # A^-1 per action, starting from (ridge * I)^-1
+        self.a_inv = np.repeat(np.eye(dim)[None, :, :] / ridge, num_actions, axis=0)
+        self.b = np.zeros((num_actions, dim))
+        self.counts = np.zeros(num_actions, dtype=np.int64)
+
+    def ucb_scores(self, x: np.ndarray, alpha: float = EXPLORATION) -> np.ndarray:
+        a_inv_x = self.a_inv @ x                      # (actions, dim)
+        theta = np.einsum("kij,kj->ki", self.a_inv, self.b)
+        return theta @ x + alpha * np.sqrt(np.maximum(a_inv_x @ x, 0.0))
+
+    def thompson_scores(self, x: np.ndarray, rng: np.random.Generator, scale: float = EXPLORATION) -> np.ndarray:
+        theta = np.einsum("kij,kj->ki", self.a_inv, self.b)
+        # x . theta_sample ~ N(x . theta, scale^2 * x^T A^-1 x), so sample the score directly
+        variance = np.maximum((self.a_inv @ x) @ x, 0.0)
+        return theta @ x + scale * np.sqrt(variance) * rng.standard_normal(len(theta))
+
+    def update(self, action: int, x: np.ndarray, reward: float):
+        """Sherman-Morrison rank-one update of A^-1 for one action"""
+        a_inv = self.a_inv[action]
+        a_inv_x = a_inv @ x
+        a_inv -= np.outer(a_inv_x, a_inv_x) / (1.0 + x @ a_inv_x)
+        self.b[action] += reward * x
+        self.counts[action] += 1
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, a_inv=self.a_inv, b=self.b, counts=self.counts,
+                     actions=np.array(ACTION_NAMES), feature_version=FEATURE_VERSION)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LinUCBModel"]:
+        try:
+            with np.load(path) as data:
+                if int(data["feature_version"]) != FEATURE_VERSION or tuple(data["actions"]) != ACTION_NAMES:
+                    print(f"Warning: Ignoring recommender model {path} built for a different layout")
+                    return None
+                model = cls.__new__(cls)
+                model.a_inv = data["a_inv"].copy()
+                model.b = data["b"].copy()
+                model.counts = data["counts"].copy()
+                return model
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: Failed to load recommender model {path}: {e}")
+            return None
+
+
+class PendingRecommendation:
+    """A recommendation waiting for its outcome window to close"""
+
+    __slots__ = ("id", "user_id", "action", "x", "focus_before", "load_before",
+                 "issued_at", "focus_sum", "load_sum", "ticks")
+
+    def __init__(self, user_id: str, action: int, x: np.ndarray, state: UserState, issued_at: float):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.action = action
+        self.x = x
+        # Without any scores yet, the baseline is taken from the next tick instead
+        self.focus_before: Optional[float] = state.focus_avg
+        self.load_before: Optional[float] = state.load_avg
+        self.issued_at = issued_at
+        self.focus_sum = 0.0
+        self.load_sum = 0.0
+        self.ticks = 0
+
+
+class Recommender:
+    """Per-user bandit models, outcome tracking and persistence"""
+
+    _instance = None
+
+    def __init__(self, model_dir: str = MODEL_DIR, policy: str = POLICY):
+        self.model_dir = model_dir
+        self.policy = policy
+        self.models: Dict[str, LinUCBModel] = {}
+        # Model file mtimes, so a process picks up updates saved by another one
+        self.model_mtimes: Dict[str, float] = {}
+        self.states: Dict[str, UserState] = {}
+        self.pending: Dict[str, List[PendingRecommendation]] = {}
+        self.rng = np.random.default_rng()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide recommender"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def _path(self, user_id: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id)[:40]
+        digest = hashlib.sha1(user_id.encode()).hexdigest()[:8]
+        return os.path.join(self.model_dir, f"{safe}-{digest}.npz")
+
+    @staticmethod
+    def _mtime(path: str) -> float:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return 0.0
+
+    def get_model(self, user_id: str) -> LinUCBModel:
+        path = self._path(user_id)
+        mtime = self._mtime(path)
+        model = self.models.get(user_id)
+        if model is None or mtime > self.model_mtimes.get(user_id, 0.0):
+            model = (LinUCBModel.load(path) if mtime else None) or model or LinUCBModel()
+            self.models[user_id] = model
+            self.model_mtimes[user_id] = mtime
+        return model
+
+    def save(self, user_id: str):
+        path = self._path(user_id)
+        try:
+            os.makedirs(self.model_dir, exist_ok=True)
+            self.models[user_id].save(path)
+            self.model_mtimes[user_id] = self._mtime(path)
+        except OSError as e:
+            print(f"Error saving recommender model for {user_id}: {e}")
+
+    def state_for(self, user_id: str) -> UserState:
+        state = self.states.get(user_id)
+        if state is None:
+            state = self.states[user_id] = UserState()
+        return state
+
+    @staticmethod
+    def state_from_events(events: Iterable) -> UserState:
+        """Rebuild a UserState from stored events, oldest first"""
+        state = UserState()
+        for event in events:
+            state.update(event.focus_score, event.load_score, event.anomaly_score)
+        return state
+
+    def decide(self, user_id: str, x: np.ndarray) -> Tuple[int, np.ndarray]:
+        model = self.get_model(user_id)
+        if self.policy == "thompson":
+            scores = model.thompson_scores(x, self.rng)
+        else:
+            scores = model.ucb_scores(x)
+        # Untrained actions tie exactly; break ties randomly so each gets tried
+        best = np.flatnonzero(scores >= scores.max() - 1e-12)
+        return int(best[0] if len(best) == 1 else self.rng.choice(best)), scores
+
+    def recommend(self, user_id: str, mode: str, context: Optional[dict] = None,
+                  state: Optional[UserState] = None, track: bool = True, now: Optional[float] = None) -> dict:
+        """
+        Pick an action for the user's current context
+
+        With track=True the recommendation is rewarded from the user's score
+        stream (see observe); otherwise it is a read-only suggestion.
+        """
+        with self._lock:
+            state = state or self.state_for(user_id)
+            x = state.context_vector(mode, context)
+            action, scores = self.decide(user_id, x)
+            recommendation = {
+                "action": ACTION_NAMES[action],
+                "message": ACTIONS[ACTION_NAMES[action]],
+                "policy": self.policy,
+                "scores": {name: round(float(score), 4) for name, score in zip(ACTION_NAMES, scores)},
+            }
+            if track:
+                pending = PendingRecommendation(user_id, action, x, state, time.monotonic() if now is None else now)
+                queue = self.pending.setdefault(user_id, [])
+                queue.append(pending)
+                del queue[:-MAX_PENDING_PER_USER]
+                recommendation["recommendation_id"] = pending.id
+            return recommendation
+
+    def dismiss(self, recommendation_id: str) -> bool:
+        """Forget a recommendation the user declined, so it isn't rewarded"""
+        with self._lock:
+            for queue in self.pending.values():
+                for pending in queue:
+                    if pending.id == recommendation_id:
+                        queue.remove(pending)
+                        return True
+        return False
+
+    def observe(self, user_id: str, focus: float, load: float, anomaly: float,
+                now: Optional[float] = None) -> List[dict]:
+        """
+        Feed one tick of scores; returns outcomes of recommendations that resolved
+
+        Reward is the change in mean focus minus the change in mean load over
+        the outcome window, relative to the smoothed scores at issue time,
+        scaled to [-1, 1].
+        """
+        now = time.monotonic() if now is None else now
+        outcomes = []
+        with self._lock:
+            self.state_for(user_id).update(focus, load, anomaly)
+            queue = self.pending.get(user_id)
+            if not queue:
+                return outcomes
+            for pending in list(queue):
+                if pending.focus_before is None:
+                    pending.focus_before, pending.load_before = focus, load
+                    continue
+                elapsed = now - pending.issued_at
+                if elapsed >= SETTLE_SECONDS:
+                    pending.focus_sum += focus
+                    pending.load_sum += load
+                    pending.ticks += 1
+                if elapsed < REWARD_DELAY:
+                    continue
+                queue.remove(pending)
+                if pending.ticks == 0:
+                    continue
+                focus_change = pending.focus_sum / pending.ticks - pending.focus_before
+                load_change = pending.load_sum / pending.ticks - pending.load_before
+                reward = float(np.clip((focus_change - load_change) / 50.0, -1.0, 1.0))
+                self.get_model(user_id).update(pending.action, pending.x, reward)
+                outcomes.append({
+                    "recommendation_id": pending.id,
+                    "action": ACTION_NAMES[pending.action],
+                    "reward": round(reward, 4),
+                    "focus_change": round(focus_change, 2),
+                    "load_change": round(load_change, 2),
+                })
+            if outcomes:
+                self.save(user_id)
+        return outcomes
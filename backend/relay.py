@@ -0,0 +1,154 @@
+"""
+WebSocket relay: fans out frames from the acquisition process to clients
+
+Several relays can run at once; they all bind the WebSocket port with
+SO_REUSEPORT, so the kernel spreads connections across them. Topic
+subscriptions are handled here; every other client message is forwarded to
+the acquisition process over the IPC bus.
+"""
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from http import HTTPStatus
+from typing import Dict, Optional
+
+import websockets
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.ipc import BusClient, BUS_SOCKET, PUBLISH, DIRECT, CLIENT_OPEN, CLIENT_MESSAGE, CLIENT_CLOSED
+from backend.metrics import (
+    REGISTRY, CONTENT_TYPE, BROADCAST_SECONDS, DROPPED_FRAMES, CLIENT_CONNECTIONS, CONNECTED_CLIENTS,
+    SEND_QUEUE_BYTES
+)
+from backend.websocket_server import TOPICS, DEFAULT_TOPICS
+
+
+class RelayServer:
+    """One fan-out process; clients connect here instead of to the board owner"""
+
+    def __init__(self, host: str = "localhost", port: int = 8765, bus_path: str = BUS_SOCKET):
+        self.host = host
+        self.port = port
+        self.clients: Dict[int, object] = {}
+        self.client_topics: Dict[int, set] = {}
+        self._ids = itertools.count(1)
+        self.bus = BusClient(bus_path, self.on_frame, self.on_bus_connect)
+
+    async def on_bus_connect(self):
+        # The acquisition process may have restarted; re-announce existing clients
+        for client_id in self.clients:
+            self.bus.send(CLIENT_OPEN, client_id)
+
+    async def on_frame(self, kind: int, client_id: int, topic: Optional[str], payload: str):
+        if kind == PUBLISH:
+            await self.broadcast_serialized(payload, topic)
+        elif kind == DIRECT:
+            client = self.clients.get(client_id)
+            if client is not None:
+                try:
+                    await client.send(payload)
+                except websockets.exceptions.ConnectionClosed:
+                    pass
+
+    async def broadcast_serialized(self, message_str: str, topic: Optional[str] = None):
+        """Send an already-serialized message to local clients (or only subscribers of topic)"""
+        start = time.perf_counter()
+        queued_bytes = 0
+        for client_id, client in list(self.clients.items()):
+            if topic is not None and topic not in self.client_topics.get(client_id, DEFAULT_TOPICS):
+                continue
+            try:
+                await client.send(message_str)
+                transport = getattr(client, "transport", None)
+                if transport is not None:
+                    queued_bytes += transport.get_write_buffer_size()
+            except websockets.exceptions.ConnectionClosed:
+                DROPPED_FRAMES.inc(reason="client_closed")
+        SEND_QUEUE_BYTES.set(queued_bytes)
+        BROADCAST_SECONDS.observe(time.perf_counter() - start)
+
+    async def handle_message(self, client_id: int, websocket, message: str):
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            await websocket.send(json.dumps({"type": "error", "message": "Invalid JSON"}))
+            return
+        msg_type = data.get("type") if isinstance(data, dict) else None
+        if msg_type in ("subscribe", "unsubscribe"):
+            requested = set(data.get("topics", []))
+            unknown = requested - TOPICS
+            if unknown:
+                await websocket.send(json.dumps({
+                    "type": "error",
+                    "message": f"Unknown topic(s): {', '.join(sorted(unknown))}"
+                }))
+                return
+            topics = set(self.client_topics.get(client_id, DEFAULT_TOPICS))
+            if msg_type == "subscribe":
+                topics |= requested
+            else:
+                topics -= requested
+            self.client_topics[client_id] = topics
+            await websocket.send(json.dumps({"type": "subscribed", "topics": sorted(topics)}))
+            if msg_type == "subscribe" and "eeg" in topics:
+                # Frame history lives in the acquisition process
+                self.bus.send(CLIENT_MESSAGE, client_id, json.dumps({
+                    "type": "get_history", "seconds": data.get("history_seconds")
+                }))
+        elif not self.bus.send(CLIENT_MESSAGE, client_id, message):
+            await websocket.send(json.dumps({"type": "error", "message": "Acquisition process unavailable"}))
+
+    async def handle_client(self, websocket):
+        client_id = next(self._ids)
+        self.clients[client_id] = websocket
+        CLIENT_CONNECTIONS.inc()
+        CONNECTED_CLIENTS.set(len(self.clients))
+        self.bus.send(CLIENT_OPEN, client_id)
+        try:
+            async for message in websocket:
+                await self.handle_message(client_id, websocket, message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.clients.pop(client_id, None)
+            self.client_topics.pop(client_id, None)
+            CONNECTED_CLIENTS.set(len(self.clients))
+            self.bus.send(CLIENT_CLOSED, client_id)
+
+    def process_request(self, protocol, request):
+        """Serve this relay's metrics over plain HTTP"""
+        if request.path == "/metrics":
+            response = protocol.respond(HTTPStatus.OK, REGISTRY.render())
+            del response.headers["Content-Type"]
+            response.headers["Content-Type"] = CONTENT_TYPE
+            return response
+        connection = request.headers.get("Connection", "")
+        if connection and "upgrade" not in connection.lower():
+            request.headers["Connection"] = "Upgrade"
+        return None
+
+    async def start(self):
+        """Start the relay; returns only if cancelled"""
+        print(f"Starting WebSocket relay {os.getpid()} on ws://{self.host}:{self.port}")
+        bus_task = asyncio.create_task(self.bus.run())
+        try:
+            async with websockets.serve(
+                self.handle_client,
+                self.host,
+                self.port,
+                process_request=self.process_request,
+                reuse_port=True,
+            ):
+                await asyncio.Future()  # Run forever
+        finally:
+            bus_task.cancel()
+
+
+if __name__ == "__main__":
+    relay = RelayServer(port=int(os.getenv("WS_PORT", "8765")))
+    asyncio.run(relay.start())
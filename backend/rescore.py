@@ -0,0 +1,309 @@
+"""
+Re-score stored events with the current scoring formulas
+
+Replays the band powers stored on each event through compute_scores() and
+the streaming anomaly detector, and writes the results as a versioned score
+set in event_scores. Work is split by user across a multiprocessing pool;
+each worker reads its user's events in time order, one short
+keyset-paginated query per chunk, and scores each chunk vectorized. The
+parent writes the results in bulk, one transaction per user. The live
+detector restarts with every recording, so its history is split wherever
+session_id changes; legacy events stored without a session_id are split
+where they are more than --session-gap seconds apart instead.
+
+Users with a calibrated baseline had their focus and load stored as
+percentiles of that baseline, so their events from the calibration on are
+replayed through the same normalization, starting from the saved baseline.
+Events don't record which board produced them, so users calibrated on more
+than one board are scored raw and left out of --apply.
+
+Usage:
+    python -m backend.rescore --workers 8
+    python -m backend.rescore --score-version 2 --users alice,bob --apply
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNK_ROWS = 20000
+WRITE_ROWS = 10000
+SESSION_GAP_SECONDS = 300.0
+
+_EPS = 1e-12
+
+
+def _init_worker():
+    # Connections inherited across fork must not be shared with the parent
+    from backend.database import engine
+    engine.dispose(close=False)
+
+
+def score_chunk(bands: np.ndarray, timestamps: np.ndarray, sessions: np.ndarray, history: Optional[np.ndarray],
+                last_timestamp: Optional[np.datetime64], last_session: Optional[int], session_gap: float
+                ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Score one time-ordered chunk of (alpha, beta, theta, gamma) rows
+
+    sessions holds each row's session_id (-1 where NULL). history,
+    last_timestamp and last_session carry the detector window across
+    chunks. Returns (focus, load, anomaly, history for the next chunk).
+    """
+    from backend.features import compute_scores
+    from backend.anomaly import robust_z_batch, robust_z_to_score, WINDOW
+
+    scores = compute_scores(bands[:, 0], bands[:, 1], bands[:, 2], bands[:, 3])
+    log_bands = np.log10(np.maximum(bands, _EPS))
+
+    # Session starts: a new session_id, or for legacy rows a long gap after the previous row
+    if last_timestamp is None:
+        previous_time, previous_session = timestamps[0], sessions[0]
+    else:
+        previous_time, previous_session = last_timestamp, last_session
+    gaps = (timestamps - np.concatenate(([previous_time], timestamps[:-1]))) / np.timedelta64(1, "s")
+    previous_sessions = np.concatenate(([previous_session], sessions[:-1]))
+    new_session = (sessions != previous_sessions) | ((sessions == -1) & (gaps > session_gap))
+    starts = np.flatnonzero(new_session)
+    if last_timestamp is None:
+        starts = np.concatenate(([0], starts[starts > 0]))
+    bounds = np.concatenate((starts, [len(bands)]))
+
+    anomaly = np.empty(len(bands))
+    # Rows before the first session start continue the previous chunk's session
+    segments = [(0, bounds[0], history)] if bounds[0] > 0 else []
+    segments += [(bounds[i], bounds[i + 1], None) for i in range(len(bounds) - 1)]
+    for start, stop, carried in segments:
+        segment = log_bands[start:stop]
+        anomaly[start:stop] = robust_z_to_score(robust_z_batch(segment, carried))
+        if stop == len(bands):
+            history = np.concatenate([carried, segment])[-WINDOW:] if carried is not None else segment[-WINDOW:]
+    return scores["focus_score"], scores["load_score"], anomaly, history
+
+
+def normalize_chunk(profile, bands: np.ndarray, focus: np.ndarray, load: np.ndarray, anomaly: np.ndarray):
+    """Replay rows through calibration.normalize in order, replacing focus/load with percentiles"""
+    from backend.calibration import normalize
+
+    for i, (alpha, beta, theta, gamma) in enumerate(bands.tolist()):
+        tick = {"alpha": alpha, "beta": beta, "theta": theta, "gamma": gamma,
+                "focus_score": float(focus[i]), "load_score": float(load[i]), "anomaly_score": float(anomaly[i])}
+        normalize(profile, tick)
+        focus[i], load[i] = tick["focus_score"], tick["load_score"]
+
+
+def rescore_user(task: Tuple[str, float, Optional[tuple]]) -> Tuple[str, np.ndarray, np.ndarray, int]:
+    """Score every event of one user; returns (user_id, ids, [focus, load, anomaly] rows, seconds)
+
+    The task's baseline is the user's calibrated (board_id, stats,
+    calibrated_at), or None to keep raw scores.
+    """
+    from sqlalchemy import select, and_, or_
+    from backend.calibration import BaselineProfile
+    from backend.database import engine, Event, Baseline
+
+    user_id, session_gap, baseline = task
+    started = time.perf_counter()
+    profile = calibrated_at = None
+    if baseline is not None:
+        board_id, stats, calibrated_at = baseline
+        profile = BaselineProfile.from_row(Baseline(user_id=user_id, board_id=board_id, stats=stats,
+                                                    calibrated_at=calibrated_at))
+        calibrated_at = np.datetime64(calibrated_at, "us")
+    query = (
+        select(Event.id, Event.timestamp, Event.session_id, Event.alpha, Event.beta, Event.theta, Event.gamma)
+        .where(Event.user_id == user_id, Event.alpha.isnot(None), Event.beta.isnot(None),
+               Event.theta.isnot(None), Event.gamma.isnot(None))
+        .order_by(Event.timestamp, Event.id)
+        .limit(CHUNK_ROWS)
+    )
+    ids: List[np.ndarray] = []
+    results: List[np.ndarray] = []
+    history = None
+    last_timestamp = last_session = None
+    last_row = None
+    while True:
+        chunk_query = query
+        if last_row is not None:
+            chunk_query = query.where(or_(
+                Event.timestamp > last_row.timestamp,
+                and_(Event.timestamp == last_row.timestamp, Event.id > last_row.id),
+            ))
+        with engine.connect() as conn:
+            rows = conn.execute(chunk_query).all()
+        if not rows:
+            break
+        last_row = rows[-1]
+        columns = list(zip(*rows))
+        timestamps = np.array(columns[1], dtype="datetime64[us]")
+        sessions = np.array([-1 if session is None else session for session in columns[2]], dtype=np.int64)
+        bands = np.column_stack([np.asarray(column, dtype=float) for column in columns[3:]])
+        focus, load, anomaly, history = score_chunk(bands, timestamps, sessions, history,
+                                                    last_timestamp, last_session, session_gap)
+        if profile is not None and profile.is_calibrated:
+            calibrated = np.flatnonzero(timestamps >= calibrated_at)
+            if len(calibrated):
+                first = calibrated[0]
+                normalize_chunk(profile, bands[first:], focus[first:], load[first:], anomaly[first:])
+        last_timestamp, last_session = timestamps[-1], int(sessions[-1])
+        ids.append(np.asarray(columns[0], dtype=np.int64))
+        results.append(np.column_stack([focus, load, anomaly]))
+    if not ids:
+        return user_id, np.empty(0, dtype=np.int64), np.empty((0, 3)), time.perf_counter() - started
+    return user_id, np.concatenate(ids), np.concatenate(results), time.perf_counter() - started
+
+
+def load_baselines(conn, users: Optional[List[str]] = None) -> Tuple[dict, List[str]]:
+    """
+    Calibrated baselines per user: ({user_id: (board_id, stats, calibrated_at)},
+    users calibrated on more than one board)
+    """
+    from sqlalchemy import select
+    from backend.database import Baseline
+
+    query = select(Baseline.user_id, Baseline.board_id, Baseline.stats, Baseline.calibrated_at).where(
+        Baseline.calibrated_at.isnot(None))
+    if users:
+        query = query.where(Baseline.user_id.in_(users))
+    boards: dict = {}
+    for user_id, board_id, stats, calibrated_at in conn.execute(query).all():
+        boards.setdefault(user_id, []).append((board_id, stats, calibrated_at))
+    ambiguous = sorted(user for user, found in boards.items() if len(found) > 1)
+    return {user: found[0] for user, found in boards.items() if len(found) == 1}, ambiguous
+
+
+def write_scores(conn, table, score_version: int, ids: np.ndarray, scores: np.ndarray, computed_at):
+    for start in range(0, len(ids), WRITE_ROWS):
+        conn.execute(table.insert(), [
+            {"event_id": event_id, "score_version": score_version, "focus_score": focus,
+             "load_score": load, "anomaly_score": anomaly, "computed_at": computed_at}
+            for event_id, (focus, load, anomaly) in zip(ids[start:start + WRITE_ROWS].tolist(),
+                                                         scores[start:start + WRITE_ROWS].tolist())
+        ])
+
+
+def apply_scores(conn, score_version: int, exclude_users: Sequence[str] = ()) -> int:
+    """Copy a score set onto the events themselves, except those of exclude_users"""
+    from sqlalchemy import bindparam, text
+
+    statement = """
+        UPDATE events SET
+            focus_score = (SELECT s.focus_score FROM event_scores s WHERE s.event_id = events.id AND s.score_version = :version),
+            load_score = (SELECT s.load_score FROM event_scores s WHERE s.event_id = events.id AND s.score_version = :version),
+            anomaly_score = (SELECT s.anomaly_score FROM event_scores s WHERE s.event_id = events.id AND s.score_version = :version),
+            score_version = :version
+        WHERE id IN (SELECT event_id FROM event_scores WHERE score_version = :version)
+    """
+    params = {"version": score_version}
+    if exclude_users:
+        statement += " AND user_id NOT IN :excluded"
+        params["excluded"] = list(exclude_users)
+        result = conn.execute(text(statement).bindparams(bindparam("excluded", expanding=True)), params)
+    else:
+        result = conn.execute(text(statement), params)
+    return result.rowcount
+
+
+def rescore(score_version: int, workers: int, users: Optional[List[str]] = None,
+            session_gap: float = SESSION_GAP_SECONDS, apply: bool = False) -> dict:
+    from datetime import datetime
+    from sqlalchemy import select, func, delete
+    from backend.database import engine, init_db, Event, EventScore
+
+    init_db()
+    with engine.connect() as conn:
+        counts = dict(conn.execute(
+            select(Event.user_id, func.count()).group_by(Event.user_id)
+        ).all())
+        without_bands_query = select(func.count()).where(Event.alpha.is_(None))
+        if users:
+            without_bands_query = without_bands_query.where(Event.user_id.in_(users))
+        without_bands = conn.execute(without_bands_query).scalar()
+        baselines, ambiguous = load_baselines(conn, users)
+    if users:
+        counts = {user: counts.get(user, 0) for user in users}
+    # Largest users first so one long task doesn't start last
+    tasks = [(user, session_gap, baselines.get(user)) for user, _ in sorted(counts.items(), key=lambda item: -item[1])]
+    print(f"Re-scoring {sum(counts.values()):,} events for {len(tasks)} user(s) "
+          f"as score version {score_version} with {workers} worker(s)")
+    if without_bands:
+        print(f"  Skipping {without_bands:,} event(s) stored without band powers")
+    if baselines:
+        print(f"  Normalizing focus/load against the saved baseline for {len(baselines)} calibrated user(s)")
+    if ambiguous:
+        print(f"  Scoring raw and not applying for {len(ambiguous)} user(s) calibrated on several boards: "
+              f"{', '.join(ambiguous)}")
+
+    started = time.perf_counter()
+    scored = 0
+    compute_seconds = 0.0
+    computed_at = datetime.utcnow()
+    table = EventScore.__table__
+    with engine.begin() as conn:
+        # A score set is always rebuilt from scratch
+        delete_query = delete(EventScore).where(EventScore.score_version == score_version)
+        if users:
+            delete_query = delete_query.where(
+                EventScore.event_id.in_(select(Event.id).where(Event.user_id.in_(users))))
+        conn.execute(delete_query)
+
+    # Short per-user write transactions keep SQLite readers in the workers unblocked
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        for user_id, ids, scores, seconds in pool.imap_unordered(rescore_user, tasks):
+            with engine.begin() as conn:
+                write_scores(conn, table, score_version, ids, scores, computed_at)
+            scored += len(ids)
+            compute_seconds += seconds
+            elapsed = time.perf_counter() - started
+            print(f"  {user_id}: {len(ids):,} events in {seconds:.1f}s "
+                  f"({scored:,} total, {scored / max(elapsed, 1e-9):,.0f} events/s)")
+
+    applied = 0
+    if apply:
+        with engine.begin() as conn:
+            applied = apply_scores(conn, score_version, ambiguous)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "score_version": score_version,
+        "events": scored,
+        "skipped_without_bands": without_bands,
+        "applied": applied,
+        "calibrated_users": len(baselines),
+        "not_applied_users": ambiguous,
+        "seconds": elapsed,
+        "events_per_s": scored / max(elapsed, 1e-9),
+        "compute_seconds": compute_seconds,
+    }
+
+
+def main():
+    from backend.features import SCORE_VERSION
+
+    parser = argparse.ArgumentParser(description="Re-score stored events with the current scoring formulas")
+    parser.add_argument("--score-version", type=int, default=SCORE_VERSION,
+                        help=f"Version to store the score set under (default: current, {SCORE_VERSION})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--users", help="Comma-separated user ids (default: all users)")
+    parser.add_argument("--session-gap", type=float, default=SESSION_GAP_SECONDS,
+                        help="Seconds between events without a session_id that start a new session")
+    parser.add_argument("--apply", action="store_true",
+                        help="Also overwrite the scores on the events with this score set")
+    args = parser.parse_args()
+
+    users = [user.strip() for user in args.users.split(",") if user.strip()] if args.users else None
+    summary = rescore(args.score_version, max(args.workers, 1), users, args.session_gap, args.apply)
+    print(f"✅ Re-scored {summary['events']:,} events in {summary['seconds']:.1f}s "
+          f"({summary['events_per_s']:,.0f} events/s, {summary['compute_seconds']:.1f}s of worker time)")
+    if args.apply:
+        print(f"   Applied score version {summary['score_version']} to {summary['applied']:,} events")
+
+
+if __name__ == "__main__":
+    main()
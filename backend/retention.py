@@ -0,0 +1,331 @@
+"""
+Retention and tiered downsampling of events
+
+Opt-in: with RETENTION_RAW_DAYS set, raw 1 Hz events older than that are
+rolled up into per-minute and per-hour aggregates (event_rollups) and
+deleted. Rollups keep the scores only, so compacted events lose their band
+powers. Minute rollups are kept for RETENTION_MINUTE_DAYS, hourly ones
+forever. Unset (or 0), raw events are kept forever.
+
+Compaction works in batches of RETENTION_BATCH_ROWS rows, each its own
+short transaction, pausing between them so live ingestion never waits
+long for the write lock. On SQLite, freed pages are then returned with
+incremental vacuum, a few at a time.
+
+Usage:
+    python -m backend.retention                    # one compaction pass
+    python -m backend.retention --enable-incremental-vacuum   # one-off full VACUUM (SQLite)
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, func, text
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.database import engine, SessionLocal, Event, EventScore, EventRollup
+from backend.metrics import COMPACTION_SECONDS, COMPACTED_ROWS, FAILED_SYNCS
+
+# Unset or 0: nothing is compacted
+RAW_DAYS = float(os.getenv("RETENTION_RAW_DAYS") or "0")
+MINUTE_DAYS = float(os.getenv("RETENTION_MINUTE_DAYS", "180"))
+BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "2000"))
+# Pause between batches, leaving the write lock to ingestion
+BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.05"))
+INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "1000"))
+
+MINUTE, HOUR = 60, 3600
+SCORES = (("focus", "focus_score"), ("load", "load_score"), ("anomaly", "anomaly_score"))
+
+
+def _floor(moment: datetime, seconds: int) -> datetime:
+    if seconds == HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def raw_cutoff(now: Optional[datetime] = None) -> Optional[datetime]:
+    """Events before this are compacted; whole hours, so raw and rollups never share a bucket"""
+    if RAW_DAYS <= 0:
+        return None
+    return _floor((now or datetime.utcnow()) - timedelta(days=RAW_DAYS), HOUR)
+
+
+def minute_cutoff(now: Optional[datetime] = None) -> datetime:
+    """Minute rollups before this have expired; older history is served from hourly rollups"""
+    return _floor((now or datetime.utcnow()) - timedelta(days=max(MINUTE_DAYS, RAW_DAYS)), HOUR)
+
+
+def minute_horizon(db) -> Optional[datetime]:
+    """
+    Hour from which minute rollups are complete, or None if there are none
+
+    Taken from the data rather than the settings, so a reader configured
+    differently from the process that compacted still sees every bucket once.
+    """
+    oldest = db.execute(select(func.min(EventRollup.bucket)).where(EventRollup.resolution == MINUTE)).scalar()
+    if oldest is None:
+        return None
+    hour = _floor(oldest, HOUR)
+    return hour if hour == oldest else hour + timedelta(hours=1)
+
+
+class _Aggregate:
+    __slots__ = ("count", "sums", "mins", "maxs")
+
+    def __init__(self):
+        self.count = 0
+        self.sums = [None, None, None]
+        self.mins = [None, None, None]
+        self.maxs = [None, None, None]
+
+    def add(self, count: int, sums, mins, maxs):
+        self.count += count
+        for i in range(3):
+            if sums[i] is not None:
+                self.sums[i] = sums[i] if self.sums[i] is None else self.sums[i] + sums[i]
+            if mins[i] is not None:
+                self.mins[i] = mins[i] if self.mins[i] is None else min(self.mins[i], mins[i])
+            if maxs[i] is not None:
+                self.maxs[i] = maxs[i] if self.maxs[i] is None else max(self.maxs[i], maxs[i])
+
+
+def _merge_rollups(db, aggregates: Dict[Tuple, _Aggregate]):
+    """Add aggregates into event_rollups, merging with rows already there"""
+    resolutions = {key[0] for key in aggregates}
+    buckets = [key[3] for key in aggregates]
+    existing = db.execute(
+        select(EventRollup).where(
+            EventRollup.resolution.in_(resolutions),
+            EventRollup.bucket >= min(buckets),
+            EventRollup.bucket <= max(buckets),
+            EventRollup.user_id.in_({key[1] for key in aggregates}),
+        )
+    ).scalars()
+    rows = {(r.resolution, r.user_id, r.mode, r.bucket): r for r in existing}
+    for key, aggregate in aggregates.items():
+        row = rows.get(key)
+        if row is not None:
+            aggregate.add(
+                row.count,
+                [getattr(row, f"{name}_sum") for name, _ in SCORES],
+                [getattr(row, f"{name}_min") for name, _ in SCORES],
+                [getattr(row, f"{name}_max") for name, _ in SCORES],
+            )
+        else:
+            row = EventRollup(resolution=key[0], user_id=key[1], mode=key[2], bucket=key[3])
+            db.add(row)
+        row.count = aggregate.count
+        for i, (name, _) in enumerate(SCORES):
+            setattr(row, f"{name}_sum", aggregate.sums[i])
+            setattr(row, f"{name}_min", aggregate.mins[i])
+            setattr(row, f"{name}_max", aggregate.maxs[i])
+
+
+def compact_batch(cutoff: datetime, batch_rows: int = BATCH_ROWS) -> int:
+    """Roll up and delete the oldest batch of events before cutoff; returns rows removed"""
+    columns = [Event.id, Event.user_id, Event.mode, Event.timestamp] + [getattr(Event, c) for _, c in SCORES]
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        rows = db.execute(
+            select(*columns).where(Event.timestamp < cutoff).order_by(Event.timestamp).limit(batch_rows)
+        ).all()
+        if not rows:
+            return 0
+        aggregates: Dict[Tuple, _Aggregate] = {}
+        for row in rows:
+            scores = row[4:]
+            for resolution in (MINUTE, HOUR):
+                key = (resolution, row.user_id or "default", row.mode or "", _floor(row.timestamp, resolution))
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregate = aggregates[key] = _Aggregate()
+                aggregate.add(1, scores, scores, scores)
+        _merge_rollups(db, aggregates)
+        ids = [row.id for row in rows]
+        # Explicit, since the cascade isn't enforced everywhere (SQLite, partitioned PostgreSQL)
+        db.execute(delete(EventScore).where(EventScore.event_id.in_(ids)))
+        # The timestamp bounds let PostgreSQL prune partitions
+        db.execute(delete(Event).where(
+            Event.id.in_(ids), Event.timestamp >= rows[0].timestamp, Event.timestamp <= rows[-1].timestamp))
+        db.commit()
+        COMPACTED_ROWS.inc(len(ids), table="events")
+        return len(ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        COMPACTION_SECONDS.observe(time.perf_counter() - start, step="events")
+
+
+def expire_minute_batch(cutoff: datetime) -> int:
+    """Delete one day of minute rollups before cutoff; returns rows removed"""
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        oldest = db.execute(
+            select(func.min(EventRollup.bucket)).where(EventRollup.resolution == MINUTE)
+        ).scalar()
+        if oldest is None or oldest >= cutoff:
+            return 0
+        until = min(cutoff, oldest + timedelta(days=1))
+        removed = db.execute(
+            delete(EventRollup).where(EventRollup.resolution == MINUTE, EventRollup.bucket < until)
+        ).rowcount
+        db.commit()
+        COMPACTED_ROWS.inc(removed, table="event_rollups")
+        return removed
+    finally:
+        db.close()
+        COMPACTION_SECONDS.observe(time.perf_counter() - start, step="minute_rollups")
+
+
+def incremental_vacuum(max_steps: int = 100) -> int:
+    """Return free pages to the filesystem in small steps (SQLite); returns pages freed"""
+    if engine.dialect.name != "sqlite":
+        return 0
+    freed = 0
+    for _ in range(max_steps):
+        with engine.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                return freed
+            free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if not free:
+                return freed
+            conn.commit()
+            # execute() steps the pragma once (one page); executescript runs it to completion
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        freed += min(free, VACUUM_PAGES)
+        time.sleep(BATCH_PAUSE_SECONDS)
+    return freed
+
+
+def enable_incremental_vacuum():
+    """Switch an existing SQLite database to incremental auto-vacuum (rewrites the file once)"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+def drop_empty_partitions(cutoff: datetime) -> List[str]:
+    """Drop compacted PostgreSQL partitions that lie wholly before cutoff"""
+    if engine.dialect.name != "postgresql":
+        return []
+    from backend.postgres import is_partitioned, PARTITION_DAYS
+    dropped = []
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return dropped
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass('events')"
+        )).scalars().all()
+        for name in names:
+            if not name.startswith("events_p"):
+                continue
+            lower = datetime.strptime(name[len("events_p"):], "%Y%m%d")
+            if lower + timedelta(days=PARTITION_DAYS) > cutoff:
+                continue
+            if conn.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).scalar():
+                continue
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    if dropped:
+        print(f"Dropped compacted partitions: {', '.join(dropped)}")
+    return dropped
+
+
+def run_once(now: Optional[datetime] = None, stop: Optional[threading.Event] = None) -> dict:
+    """One full compaction pass"""
+    cutoff = raw_cutoff(now)
+    summary = {"events": 0, "minute_rollups": 0, "vacuumed_pages": 0}
+    if cutoff is None:
+        return summary
+    stopped = stop.is_set if stop is not None else (lambda: False)
+    while not stopped():
+        removed = compact_batch(cutoff)
+        summary["events"] += removed
+        if removed < BATCH_ROWS:
+            break
+        time.sleep(BATCH_PAUSE_SECONDS)
+    expire = minute_cutoff(now)
+    while not stopped():
+        removed = expire_minute_batch(expire)
+        if not removed:
+            break
+        summary["minute_rollups"] += removed
+        time.sleep(BATCH_PAUSE_SECONDS)
+    drop_empty_partitions(cutoff)
+    summary["vacuumed_pages"] = incremental_vacuum()
+    if any(summary.values()):
+        print(f"Retention: compacted {summary['events']} events, expired {summary['minute_rollups']} "
+              f"minute rollups, vacuumed {summary['vacuumed_pages']} pages")
+    return summary
+
+
+class RetentionJob:
+    """Runs a compaction pass every RETENTION_INTERVAL_SECONDS on a background thread"""
+
+    def __init__(self, interval: float = INTERVAL_SECONDS, initial_delay: float = 60.0):
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if RAW_DAYS <= 0 or self._thread is not None:
+            return
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                    print("Retention: this SQLite database doesn't use incremental vacuum, so the file won't "
+                          "shrink; run 'python -m backend.retention --enable-incremental-vacuum' once")
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        delay = self.initial_delay
+        while not self._stop.wait(delay):
+            try:
+                run_once(stop=self._stop)
+            except Exception as e:
+                FAILED_SYNCS.inc(target="retention")
+                print(f"Retention pass failed: {e}")
+            delay = self.interval
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old events into rollups")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="Convert an existing SQLite database to incremental auto-vacuum (full VACUUM)")
+    args = parser.parse_args()
+
+    from backend.database import init_db
+    init_db()
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+        print("Incremental vacuum enabled")
+        return
+    if RAW_DAYS <= 0:
+        print("RETENTION_RAW_DAYS isn't set; raw events are kept forever")
+        return
+    started = time.perf_counter()
+    summary = run_once()
+    print(f"✅ Compacted {summary['events']:,} events and expired {summary['minute_rollups']:,} minute rollups "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
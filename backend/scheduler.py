@@ -0,0 +1,202 @@
+"""
+Deadline-based tick scheduling for streaming sessions
+
+Every stream registers a Timer with the process-wide TickScheduler. One
+driver coroutine sleeps until the earliest deadline of all timers and
+releases the stream waiting on it. Deadlines are absolute points on the
+timer's own grid (start + n * period on the monotonic clock), so
+processing time, DB writes or a slow client never push later ticks back.
+
+A tick is missed when its deadline passes while the stream is still busy
+with an earlier one, or the loop itself was blocked past it:
+- "skip" (default): missed ticks are dropped and the next one waits for
+  the next point on the grid, keeping ticks evenly spaced
+- "catch_up": missed ticks run back to back, up to TICK_MAX_CATCH_UP of
+  them, so the tick count keeps pace with wall time
+"""
+import asyncio
+import heapq
+import itertools
+import os
+from typing import List, Optional, Tuple
+
+from backend.metrics import TICK_LATENESS_SECONDS, MISSED_TICKS
+
+# Updates per second, 1-50
+UPDATE_HZ = min(max(float(os.getenv("EEG_UPDATE_HZ", "1")), 1.0), 50.0)
+POLICIES = ("skip", "catch_up")
+MAX_CATCH_UP = int(os.getenv("TICK_MAX_CATCH_UP", "5"))
+
+
+def check_policy(policy: str) -> str:
+    """policy, if it's one of POLICIES; raises ValueError otherwise"""
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown tick policy {policy!r}; expected one of {', '.join(POLICIES)}")
+    return policy
+
+
+# A typo here fails at startup rather than in the first stream
+TICK_POLICY = check_policy(os.getenv("EEG_TICK_POLICY", "skip"))
+
+
+def _wake(future: Optional[asyncio.Future]):
+    if future is not None and not future.done():
+        future.set_result(None)
+
+
+class Timer:
+    """One stream's periodic deadlines; await wait() before each tick"""
+
+    def __init__(self, scheduler: "TickScheduler", rate_hz: float, policy: str, name: str):
+        self.scheduler = scheduler
+        self.period = 1.0 / min(max(rate_hz, 1.0), 50.0)
+        self.policy = check_policy(policy)
+        self.name = name
+        self.deadline = 0.0
+        self.ticks = 0
+        self.missed = 0     # dropped under "skip", or beyond the catch-up limit
+        self.caught_up = 0  # run back to back after their deadline under "catch_up"
+        self._pending = 0  # catch-up ticks owed
+        self._waiter: Optional[asyncio.Future] = None
+        self.cancelled = False
+        self.paused = False
+
+    async def wait(self) -> float:
+        """Until this timer's next deadline; returns how late the tick starts (seconds)"""
+        if self.cancelled:
+            raise asyncio.CancelledError()
+        if self._pending:
+            # Owed catch-up ticks run straight away
+            self._pending -= 1
+            self.caught_up += 1
+            self.ticks += 1
+            # Owed ticks are the grid points just before the next deadline, oldest first
+            return self.scheduler.loop.time() - (self.deadline - (self._pending + 1) * self.period)
+        self._waiter = self.scheduler.loop.create_future()
+        try:
+            lateness = await self._waiter
+        finally:
+            self._waiter = None
+        self.ticks += 1
+        return lateness
+
+    def _fire(self, now: float):
+        """Called by the driver once now >= deadline; moves the deadline along the grid"""
+        behind = int((now - self.deadline) // self.period)  # whole periods overdue
+        if self.paused:
+            self.deadline += (behind + 1) * self.period
+            return
+        lateness = now - self.deadline
+        TICK_LATENESS_SECONDS.observe(lateness)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(lateness)
+            overdue = behind
+        else:
+            # The stream is still busy with an earlier tick
+            overdue = behind + 1
+        if overdue:
+            if self.policy == "catch_up":
+                owed = min(self._pending + overdue, MAX_CATCH_UP)
+                dropped = self._pending + overdue - owed
+                self._pending = owed
+            else:
+                dropped = overdue
+            if dropped:
+                self.missed += dropped
+                MISSED_TICKS.inc(dropped, policy=self.policy)
+        self.deadline += (behind + 1) * self.period
+
+    def pause(self):
+        """Stop counting deadlines that pass as missed (e.g. while the board reconnects)"""
+        self.paused = True
+        self._pending = 0
+
+    def resume(self):
+        self.paused = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.scheduler.remove(self)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "rate_hz": round(1.0 / self.period, 3),
+            "policy": self.policy,
+            "ticks": self.ticks,
+            "missed": self.missed,
+            "caught_up": self.caught_up,
+        }
+
+
+class TickScheduler:
+    """One driver coroutine serving the deadlines of every stream in the process"""
+
+    _instance = None
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Timer]] = []
+        self._order = itertools.count()
+        self._wakeup: Optional[asyncio.Future] = None
+        self._driver: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide scheduler"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def add(self, rate_hz: float = UPDATE_HZ, policy: str = TICK_POLICY, name: str = "stream") -> Timer:
+        """Register a timer whose first tick is due now; raises ValueError for an unknown policy"""
+        check_policy(policy)
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self._driver is None or self._driver.done():
+            # First use, or a new event loop (e.g. tests and benchmarks calling asyncio.run again)
+            self.loop = loop
+            self._heap = []
+            self._wakeup = None
+            self._driver = loop.create_task(self._drive())
+        timer = Timer(self, rate_hz, policy, name)
+        timer.deadline = loop.time()
+        self._push(timer)
+        return timer
+
+    def remove(self, timer: Timer):
+        # Lazily dropped from the heap by the driver
+        timer.cancelled = True
+
+    def _push(self, timer: Timer):
+        heapq.heappush(self._heap, (timer.deadline, next(self._order), timer))
+        if self._heap[0][2] is timer:
+            # Earlier than what the driver sleeps towards
+            _wake(self._wakeup)
+
+    async def _drive(self):
+        while True:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            self._wakeup = self.loop.create_future()
+            if not self._heap:
+                await self._wakeup
+                continue
+            deadline = self._heap[0][0]
+            if deadline > self.loop.time():
+                handle = self.loop.call_at(deadline, _wake, self._wakeup)
+                try:
+                    await self._wakeup
+                finally:
+                    handle.cancel()
+                continue
+            now = self.loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, timer = heapq.heappop(self._heap)
+                if timer.cancelled:
+                    continue
+                timer._fire(now)
+                heapq.heappush(self._heap, (timer.deadline, next(self._order), timer))
+
+    def stats(self) -> List[dict]:
+        return [{"name": timer.name, **timer.stats()} for _, _, timer in self._heap if not timer.cancelled]
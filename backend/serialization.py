@@ -0,0 +1,61 @@
+"""
+Fast JSON encoding for hot response and broadcast paths
+
+Uses orjson when it's installed and falls back to the standard library
+with the same output for the types these paths carry (dicts, lists,
+strings, numbers, None and naive datetimes).
+
+Streamed eeg_data messages are written straight from the tick's
+FeatureFrame instead, with the same output as json.dumps of the message
+dict.
+"""
+import json
+import math
+from datetime import datetime
+from json.encoder import encode_basestring_ascii
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(value: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+_NON_FINITE = {math.inf: "Infinity", -math.inf: "-Infinity"}
+
+
+def json_number(value) -> str:
+    """A number (or None) as json.dumps writes it"""
+    if value is None:
+        return "null"
+    value = float(value)
+    if math.isfinite(value):
+        return repr(value)
+    return _NON_FINITE.get(value, "NaN")
+
+
+def eeg_data_json(frame, mode: str, timestamp: str, session_id: Optional[int], seq: int,
+                  trace_id: Optional[str] = None, sample_timestamp: Optional[float] = None) -> str:
+    """An eeg_data message for a FeatureFrame, as json.dumps of the message dict writes it"""
+    text = (
+        f'{{"type": "eeg_data", "data": {frame.to_json()}, "mode": {encode_basestring_ascii(mode)}, '
+        f'"timestamp": {encode_basestring_ascii(timestamp)}, '
+        f'"session_id": {"null" if session_id is None else int(session_id)}, "seq": {int(seq)}'
+    )
+    if trace_id is not None:
+        text = (f'{text}, "trace_id": {encode_basestring_ascii(trace_id)}, '
+                f'"sample_timestamp": {json_number(sample_timestamp)}')
+    return text + "}"
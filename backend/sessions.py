@@ -0,0 +1,283 @@
+"""
+Recording sessions and their incrementally maintained summaries
+
+A session spans start_recording to stop_recording. Its summary (score
+means, percentiles, time in each mode, anomaly and data-gap counts) is
+updated in O(1) per tick, checkpointed to the sessions table periodically
+and finalized on stop, so listing sessions and their stats never touches
+raw events. Summaries are snapshotted on the event loop and written in a
+worker thread, so database writes never stall the stream.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Awaitable, Dict, List, Optional
+
+import numpy as np
+
+from backend.database import SessionLocal, RecordingSession
+from backend.firebase_service import FirebaseService
+from backend.metrics import FAILED_SYNCS, FIRESTORE_WRITE_SECONDS
+
+SCORES = ("focus_score", "load_score", "anomaly_score")
+PERCENTILES = (10, 50, 90)
+# Scores are 0-100; fixed half-point bins give percentiles without keeping every tick
+HISTOGRAM_BINS = 200
+# Write the running summary every N seconds so a crash loses little
+CHECKPOINT_SECONDS = float(os.getenv("SESSION_CHECKPOINT_SECONDS", "30"))
+
+
+class ScoreStats:
+    """Streaming count/mean/min/max and histogram percentiles of one 0-100 score"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+
+    def add(self, value: Optional[float]):
+        if value is None or value != value:
+            return
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.histogram[min(max(int(value * HISTOGRAM_BINS / 100), 0), HISTOGRAM_BINS - 1)] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Estimate interpolated within the histogram bin, accurate to one bin width"""
+        if not self.count:
+            return None
+        cumulative = np.cumsum(self.histogram)
+        rank = q / 100 * self.count
+        index = min(int(np.searchsorted(cumulative, rank)), HISTOGRAM_BINS - 1)
+        below = cumulative[index - 1] if index else 0
+        fraction = (rank - below) / max(self.histogram[index], 1)
+        value = (index + fraction) * 100 / HISTOGRAM_BINS
+        return float(min(max(value, self.min), self.max))
+
+    def to_dict(self) -> dict:
+        if not self.count:
+            return {"mean": None, "min": None, "max": None, **{f"p{q}": None for q in PERCENTILES}}
+        return {
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            **{f"p{q}": self.percentile(q) for q in PERCENTILES},
+        }
+
+
+class SessionSummary:
+    """Running summary of one session, updated per tick"""
+
+    def __init__(self, started_at: datetime, mode: str):
+        self.started_at = started_at
+        self.scores = {name: ScoreStats() for name in SCORES}
+        self.event_count = 0
+        self.anomaly_count = 0
+        self.gap_count = 0
+        self.gap_seconds = 0.0
+        self.last_event_at: Optional[datetime] = None
+        self.segments: List[dict] = [{"mode": mode, "start": started_at, "end": None}]
+
+    @property
+    def mode(self) -> str:
+        return self.segments[-1]["mode"]
+
+    def set_mode(self, mode: str, now: datetime):
+        if mode == self.mode:
+            return
+        self.segments[-1]["end"] = now
+        self.segments.append({"mode": mode, "start": now, "end": None})
+
+    def add(self, features: dict, anomaly: bool, now: datetime):
+        self.event_count += 1
+        self.last_event_at = now
+        for name, stats in self.scores.items():
+            stats.add(features.get(name))
+        if anomaly:
+            self.anomaly_count += 1
+        if features.get("gap_seconds"):
+            self.gap_count += 1
+            self.gap_seconds += features["gap_seconds"]
+
+    def time_in_mode(self, now: datetime) -> Dict[str, float]:
+        seconds: Dict[str, float] = {}
+        for segment in self.segments:
+            end = segment["end"] or now
+            seconds[segment["mode"]] = seconds.get(segment["mode"], 0.0) + (end - segment["start"]).total_seconds()
+        return seconds
+
+    def close(self, now: datetime):
+        self.segments[-1]["end"] = now
+
+    def segments_json(self) -> List[dict]:
+        return [
+            {"mode": s["mode"], "start": s["start"].isoformat(), "end": s["end"].isoformat() if s["end"] else None}
+            for s in self.segments
+        ]
+
+    def to_dict(self, now: datetime) -> dict:
+        return {
+            "duration_seconds": (now - self.started_at).total_seconds(),
+            "event_count": self.event_count,
+            "anomaly_count": self.anomaly_count,
+            "gap_count": self.gap_count,
+            "gap_seconds": self.gap_seconds,
+            "time_in_mode": self.time_in_mode(now),
+            "scores": {name: stats.to_dict() for name, stats in self.scores.items()},
+            "updated_at": now.isoformat(),
+        }
+
+
+class SessionRecorder:
+    """Tracks the active recording session and materializes its summary"""
+
+    def __init__(self, checkpoint_seconds: float = CHECKPOINT_SECONDS):
+        self.checkpoint_seconds = checkpoint_seconds
+        self.session_id: Optional[int] = None
+        self.user_id: Optional[str] = None
+        self.board_id: Optional[int] = None
+        self.summary: Optional[SessionSummary] = None
+        self._last_checkpoint: Optional[datetime] = None
+        # Background checkpoint write, at most one at a time
+        self._checkpoint: Optional[asyncio.Future] = None
+
+    @property
+    def active(self) -> bool:
+        return self.session_id is not None
+
+    async def start(self, user_id: str, board_id: int, mode: str, now: Optional[datetime] = None) -> int:
+        """Open a session; sessions left open by a crash are closed as interrupted"""
+        if self.active:
+            await self.finish(now)
+        now = now or datetime.utcnow()
+        summary = SessionSummary(now, mode)
+        self.session_id = await asyncio.to_thread(
+            self._insert, user_id, board_id, now, summary.segments_json(), summary.to_dict(now))
+        self.summary = summary
+        self.user_id, self.board_id = user_id, board_id
+        self._last_checkpoint = now
+        print(f"Session {self.session_id} started for {user_id}")
+        return self.session_id
+
+    def set_mode(self, mode: str, now: Optional[datetime] = None):
+        if self.active:
+            self.summary.set_mode(mode, now or datetime.utcnow())
+
+    def observe(self, features: dict, anomaly: bool = False, now: Optional[datetime] = None):
+        """Fold one tick into the running summary; checkpoints are written in the background"""
+        if not self.active:
+            return
+        now = now or datetime.utcnow()
+        self.summary.add(features, anomaly, now)
+        if (now - self._last_checkpoint).total_seconds() >= self.checkpoint_seconds and (
+                self._checkpoint is None or self._checkpoint.done()):
+            self._last_checkpoint = now
+            self._checkpoint = asyncio.ensure_future(self._write(now))
+
+    async def finish(self, now: Optional[datetime] = None, status: str = "completed") -> Optional[dict]:
+        """Finalize the active session's summary and sync it to Firestore"""
+        if not self.active:
+            return None
+        if self._checkpoint is not None:
+            # Let an older checkpoint land first so it can't overwrite the final summary
+            await asyncio.gather(self._checkpoint, return_exceptions=True)
+            self._checkpoint = None
+        now = now or datetime.utcnow()
+        self.summary.close(now)
+        session = await self._write(now, ended_at=now, status=status)
+        self.session_id = None
+        self.summary = None
+        if session is not None:
+            await asyncio.to_thread(self._sync, session)
+            print(f"Session {session['id']} {status}: {session['summary']['event_count']} events")
+        return session
+
+    def _write(self, now: datetime, ended_at: Optional[datetime] = None,
+               status: str = "recording") -> Awaitable[Optional[dict]]:
+        """Snapshot the summary now and store it from a worker thread"""
+        return asyncio.to_thread(self._store, self.session_id, self.summary.segments_json(),
+                                 self.summary.to_dict(now), ended_at, status)
+
+    def _insert(self, user_id: str, board_id: int, now: datetime, segments: List[dict], summary: dict) -> int:
+        db = SessionLocal()
+        try:
+            self._close_interrupted(db)
+            session = RecordingSession(user_id=user_id, board_id=board_id, started_at=now, status="recording",
+                                       mode_segments=segments, summary=summary)
+            db.add(session)
+            db.commit()
+            return session.id
+        finally:
+            db.close()
+
+    def _store(self, session_id: int, segments: List[dict], summary: dict, ended_at: Optional[datetime],
+               status: str) -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            session = db.get(RecordingSession, session_id)
+            if session is None:
+                return None
+            session.mode_segments = segments
+            session.summary = summary
+            session.ended_at = ended_at
+            session.status = status
+            db.commit()
+            return session_to_dict(session)
+        except Exception as e:
+            FAILED_SYNCS.inc(target="database")
+            print(f"Error saving session: {e}")
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def _close_interrupted(self, db):
+        for session in db.query(RecordingSession).filter(RecordingSession.status == "recording").all():
+            updated_at = (session.summary or {}).get("updated_at")
+            session.ended_at = datetime.fromisoformat(updated_at) if updated_at else session.started_at
+            session.status = "interrupted"
+            print(f"Session {session.id} was left open; marked interrupted")
+
+    def _sync(self, session: dict):
+        try:
+            firebase_service = FirebaseService.get_instance()
+            if firebase_service.is_available():
+                with FIRESTORE_WRITE_SECONDS.time():
+                    firestore_id = firebase_service.insert_session({
+                        "session_id": session["id"],
+                        "user_id": session["user_id"],
+                        "board_id": session["board_id"],
+                        "started_at": session["started_at"],
+                        "ended_at": session["ended_at"],
+                        "status": session["status"],
+                        "mode_segments": session["mode_segments"],
+                        "summary": session["summary"],
+                    })
+                db = SessionLocal()
+                try:
+                    db.query(RecordingSession).filter(RecordingSession.id == session["id"]).update(
+                        {"firestore_id": firestore_id})
+                    db.commit()
+                finally:
+                    db.close()
+        except Exception as e:
+            FAILED_SYNCS.inc(target="firestore")
+            print(f"Warning: Failed to sync session to Firebase: {e}")
+
+
+def session_to_dict(session: RecordingSession) -> dict:
+    return {
+        "id": session.id,
+        "user_id": session.user_id,
+        "board_id": session.board_id,
+        "started_at": session.started_at,
+        "ended_at": session.ended_at,
+        "status": session.status,
+        "mode_segments": session.mode_segments or [],
+        "summary": session.summary or {},
+        "firestore_id": session.firestore_id,
+    }
@@ -0,0 +1,263 @@
+"""
+Per-tick latency tracing for the EEG pipeline
+Records acquire → feature extraction → persist → serialize → send spans and
+exports them as OpenTelemetry-compatible (OTLP/JSON) lines to a local file
+
+Only sampled ticks are traced: all of them while an exporter is configured,
+otherwise a TRACE_SAMPLE_RATE fraction, which is enough to keep the
+glass-to-glass latency stats fed by client acks. Unsampled ticks carry no
+trace_id, so clients don't ack them.
+"""
+import os
+import json
+import queue
+import random
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+
+from backend.metrics import REGISTRY
+
+GLASS_TO_GLASS_SECONDS = REGISTRY.histogram(
+    "neurocalm_glass_to_glass_seconds",
+    "Time from sample acquisition on the board to receipt by a client",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0),
+)
+
+# Fraction of ticks traced when no exporter is configured
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+# Exports waiting for the writer thread before new ones are dropped
+TRACE_EXPORT_MAX_QUEUED = int(os.getenv("TRACE_EXPORT_MAX_QUEUED", "10000"))
+
+SERVICE_NAME = "neurocalm-eeg"
+# Span kind enum values from the OTLP protobuf definition
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+def _new_id(num_bytes: int) -> str:
+    return os.urandom(num_bytes).hex()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """A single timed stage of a tick"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "start_ns", "end_ns", "attributes", "kind")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str] = None,
+                 start_ns: Optional[int] = None, kind: int = SPAN_KIND_INTERNAL):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_span_id = parent_span_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.kind = kind
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns if self.end_ns is not None else self.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class TickTrace:
+    """Trace for one pipeline tick: a root span with one child span per stage"""
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self.trace_id = _new_id(16)
+        self.root = Span("tick", self.trace_id)
+        self.spans: List[Span] = []
+        # BrainFlow timestamp (unix seconds) of the newest sample in this tick
+        self.sample_timestamp: Optional[float] = None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a stage of the tick"""
+        child = Span(name, self.trace_id, parent_span_id=self.root.span_id)
+        child.attributes.update(attributes)
+        try:
+            yield child
+        finally:
+            child.end()
+            self.spans.append(child)
+
+    def finish(self):
+        """Close the root span and hand the trace to the exporter"""
+        if self.root.end_ns is not None:
+            return
+        self.root.end()
+        if self.sample_timestamp is not None:
+            self.root.attributes["eeg.sample_timestamp"] = self.sample_timestamp
+            self.root.attributes["eeg.acquire_to_send_ms"] = round(
+                (self.root.end_ns / 1e9 - self.sample_timestamp) * 1000, 3)
+        self.tracer.export([self.root] + self.spans)
+
+
+def stage(trace: Optional[TickTrace], name: str):
+    """Span for a pipeline stage, or a no-op when the tick is not traced"""
+    return trace.span(name) if trace is not None else nullcontext()
+
+
+class OTLPJsonFileExporter:
+    """
+    Appends one OTLP/JSON ExportTraceServiceRequest per line to a local file
+
+    export() only queues the spans; a background thread encodes and writes
+    them, so tracing doesn't put disk latency into the ticks it measures.
+    Past TRACE_EXPORT_MAX_QUEUED pending exports, new ones are dropped.
+    """
+
+    def __init__(self, path: str, max_queued: int = TRACE_EXPORT_MAX_QUEUED):
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queued)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, spans: List[Span]):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Block until everything queued so far is written"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Whatever else is already waiting goes out in the same write
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = "".join(self._encode(spans) + "\n" for spans in batch)
+                with open(self.path, "a") as f:
+                    f.write(lines)
+            except Exception as e:
+                print(f"Warning: Failed to export {len(batch)} trace(s): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _encode(spans: List[Span]) -> str:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "backend.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        return json.dumps(payload, separators=(",", ":"))
+
+
+class Tracer:
+    """Creates tick traces and forwards finished spans to an optional exporter"""
+
+    def __init__(self, exporter: Optional[OTLPJsonFileExporter] = None, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.exporter = exporter
+        # Exported traces need every tick; otherwise only enough for latency stats
+        self.sample_rate = 1.0 if exporter is not None else min(max(sample_rate, 0.0), 1.0)
+        # Recent ticks, so client acks can be matched to their sample timestamps
+        self._recent: Dict[str, TickTrace] = {}
+        self._recent_order: deque = deque(maxlen=256)
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Enable file export when TRACE_EXPORT_PATH is set"""
+        path = os.getenv("TRACE_EXPORT_PATH")
+        if path:
+            print(f"Exporting EEG pipeline traces to {path}")
+            return cls(OTLPJsonFileExporter(path))
+        return cls()
+
+    def start_tick(self) -> Optional[TickTrace]:
+        """Trace for a new tick, or None when the tick isn't sampled"""
+        if self.sample_rate < 1.0 and (self.sample_rate <= 0.0 or random.random() >= self.sample_rate):
+            return None
+        trace = TickTrace(self)
+        if len(self._recent_order) == self._recent_order.maxlen:
+            self._recent.pop(self._recent_order[0], None)
+        self._recent_order.append(trace.trace_id)
+        self._recent[trace.trace_id] = trace
+        return trace
+
+    def export(self, spans: List[Span]):
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            print(f"Warning: Failed to export trace: {e}")
+
+    def record_client_receipt(self, trace_id: str, client_id: str, received_ns: int) -> Optional[float]:
+        """
+        Match a client's receive time to its tick
+        
+        Exports a client_receive span from sample acquisition to receipt and
+        returns the glass-to-glass latency in seconds, or None if the tick is
+        unknown or carried no sample timestamp.
+        """
+        trace = self._recent.get(trace_id)
+        if trace is None or trace.sample_timestamp is None:
+            return None
+        start_ns = int(trace.sample_timestamp * 1e9)
+        span = Span("client_receive", trace_id, parent_span_id=trace.root.span_id,
+                    start_ns=start_ns, kind=SPAN_KIND_SERVER)
+        span.attributes["client.id"] = client_id
+        span.end(received_ns)
+        self.export([span])
+        return (received_ns - start_ns) / 1e9
+
+
+class LatencyTracker:
+    """Bounded window of glass-to-glass latencies for one client"""
+
+    def __init__(self, window: int = 1024):
+        self.samples: deque = deque(maxlen=window)
+
+    def record(self, latency_seconds: float):
+        self.samples.append(latency_seconds)
+        GLASS_TO_GLASS_SECONDS.observe(max(latency_seconds, 0.0))
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.samples:
+            return {"count": 0, "p50_ms": None, "p99_ms": None}
+        p50, p99 = np.percentile(np.fromiter(self.samples, dtype=float), [50, 99])
+        return {"count": len(self.samples), "p50_ms": round(float(p50) * 1000, 3), "p99_ms": round(float(p99) * 1000, 3)}
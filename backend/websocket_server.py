@@ -6,16 +6,40 @@ import websockets
 import json
 import sys
 import os
-from typing import Set
-from datetime import datetime
+import time
+from http import HTTPStatus
+from typing import Set, Dict, Optional
+from datetime import datetime, timezone
 from brainflow.board_shim import BoardIds
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.eeg_service import EEGService
-from backend.database import SessionLocal, Event
+from backend.auto_detect_ganglion import find_ble_dongle_ports, detect_ganglion
+from backend.event_writer import EventWriter
+from backend.retention import RetentionJob
 from backend.firebase_service import FirebaseService
+from backend.calibration import BaselineNormalizer
+from backend.recommender import Recommender
+from backend.sessions import SessionRecorder
+from backend.contexts import ContextStore
+from backend.commands import Command, CommandDispatcher, CommandRejected, CommandFailed
+from backend.scheduler import TickScheduler
+from backend.profiler import Profiler, ProfilerBusy, is_admin
+from backend.history import HistoryStore, ReplayWindow, HISTORY_SNAPSHOT_SECONDS
+from backend.ipc import BusServer, RemoteClient, BUS_SOCKET
+from backend.features import FeatureFrame, SCORE_VERSION
+from backend.serialization import eeg_data_json
+from backend.tracing import TickTrace, LatencyTracker, stage
+from backend.metrics import (
+    REGISTRY, CONTENT_TYPE, FIRESTORE_WRITE_SECONDS, BROADCAST_SECONDS,
+    DROPPED_FRAMES, FAILED_SYNCS, CLIENT_CONNECTIONS, CONNECTED_CLIENTS, SEND_QUEUE_BYTES
+)
+
+# Streams a client can subscribe to; control messages go to everyone
+TOPICS = {"eeg", "anomaly"}
+DEFAULT_TOPICS = frozenset({"eeg"})
 
 class WebSocketServer:
     """WebSocket server to stream EEG data to frontend"""
@@ -27,35 +51,85 @@ class WebSocketServer:
         board_id = int(os.getenv("BOARD_ID", BoardIds.GANGLION_BOARD))
         self.eeg_service = EEGService(board_id=board_id)
         self.connected_clients: Set = set()
+        # Topic subscriptions per client (clients not in here get DEFAULT_TOPICS)
+        self.client_topics: Dict = {}
         self.current_mode = "background"
         self.current_context = {}
+        # Id of current_context in the contexts table, interned off the loop when it changes
+        self.current_context_id: Optional[int] = None
         self.current_user_id = "default"
         self.stream_task = None
+        # Glass-to-glass latency per client, fed by "ack" messages
+        self.client_latency: Dict = {}
+        self.normalizer = BaselineNormalizer()
+        self.calibration_task = None
+        self.recommender = Recommender.get_instance()
+        self.sessions = SessionRecorder()
+        self.contexts = ContextStore.get_instance()
+        self.events = EventWriter()
+        self.retention = RetentionJob()
+        # Recent frames per session, for clients joining mid-session
+        self.history = HistoryStore()
+        # Sequence numbers and recently sent eeg_data frames, for "resume"
+        self.replay = ReplayWindow()
+        # Long-running client commands (start/stop recording), run as cancellable tasks
+        self.commands = CommandDispatcher(self.on_command_update)
+        # Set when running as the acquisition process behind relays
+        self.bus: Optional[BusServer] = None
     
     async def register_client(self, websocket):
         """Register a new client"""
         self.connected_clients.add(websocket)
+        CLIENT_CONNECTIONS.inc()
+        CONNECTED_CLIENTS.set(len(self.connected_clients))
         print(f"Client connected. Total clients: {len(self.connected_clients)}")
     
     async def unregister_client(self, websocket):
         """Unregister a client"""
         self.connected_clients.discard(websocket)
+        self.client_latency.pop(websocket, None)
+        self.client_topics.pop(websocket, None)
+        CONNECTED_CLIENTS.set(len(self.connected_clients))
         print(f"Client disconnected. Total clients: {len(self.connected_clients)}")
     
-    async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients"""
+    async def broadcast(self, message: dict, topic: Optional[str] = None):
+        """Broadcast message to all connected clients (or only subscribers of topic)"""
+        if self.connected_clients:
+            await self.broadcast_serialized(json.dumps(message), topic)
+    
+    async def broadcast_serialized(self, message_str: str, topic: Optional[str] = None):
+        """Send an already-serialized message to all connected clients (or only subscribers of topic)"""
         if self.connected_clients:
-            message_str = json.dumps(message)
+            start = time.perf_counter()
             disconnected = set()
-            for client in self.connected_clients:
+            queued_bytes = 0
+            if topic is None:
+                recipients = list(self.connected_clients)
+            else:
+                recipients = [
+                    client for client in self.connected_clients
+                    if topic in self.client_topics.get(client, DEFAULT_TOPICS)
+                ]
+            if self.bus is not None:
+                # Relays filter by topic and fan out to their own clients
+                self.bus.publish(message_str, topic)
+                recipients = [client for client in recipients if not isinstance(client, RemoteClient)]
+            for client in recipients:
                 try:
                     await client.send(message_str)
+                    transport = getattr(client, "transport", None)
+                    if transport is not None:
+                        queued_bytes += transport.get_write_buffer_size()
                 except websockets.exceptions.ConnectionClosed:
                     disconnected.add(client)
+                    DROPPED_FRAMES.inc(reason="client_closed")
             
             # Remove disconnected clients
             for client in disconnected:
                 self.connected_clients.discard(client)
+            CONNECTED_CLIENTS.set(len(self.connected_clients))
+            SEND_QUEUE_BYTES.set(queued_bytes)
+            BROADCAST_SECONDS.observe(time.perf_counter() - start)
     
     async def handle_message(self, websocket, message: str):
         """Handle incoming messages from clients"""
@@ -65,192 +139,461 @@ class WebSocketServer:
             
             if msg_type == "set_mode":
                 self.current_mode = data.get("mode", "background")
+                self.sessions.set_mode(self.current_mode)
                 await self.broadcast({"type": "mode_changed", "mode": self.current_mode})
             
             elif msg_type == "set_context":
-                self.current_context = data.get("context", {})
+                await self.set_context(data.get("context", {}))
             
             elif msg_type == "set_user":
-                self.current_user_id = data.get("user_id", "default")
+                user_id = data.get("user_id", "default")
+                if self.sessions.active and user_id != self.sessions.user_id:
+                    # A session belongs to one user; switching users mid-recording starts a new one
+                    await self.sessions.finish()
+                    await self.sessions.start(user_id, self.eeg_service.board_id, self.current_mode)
+                self.current_user_id = user_id
             
-            elif msg_type == "start_recording":
-                # Start EEG streaming if not already started
+            elif msg_type in ("subscribe", "unsubscribe"):
+                requested = set(data.get("topics", []))
+                unknown = requested - TOPICS
+                if unknown:
+                    await websocket.send(json.dumps({
+                        "type": "error",
+                        "message": f"Unknown topic(s): {', '.join(sorted(unknown))}"
+                    }))
+                    return
+                topics = set(self.client_topics.get(websocket, DEFAULT_TOPICS))
+                if msg_type == "subscribe":
+                    topics |= requested
+                else:
+                    topics -= requested
+                self.client_topics[websocket] = topics
+                await websocket.send(json.dumps({"type": "subscribed", "topics": sorted(topics)}))
+                if msg_type == "subscribe" and "eeg" in topics:
+                    # Recent frames first, so the chart fills in before the next live one
+                    await self.send_history(websocket, data.get("history_seconds"))
+            
+            elif msg_type == "get_history":
+                await self.send_history(websocket, data.get("seconds"), data.get("session_id"))
+            
+            elif msg_type == "resume":
+                # Reconnected (or saw a gap in seq): send the frames it missed in one message
+                await websocket.send(self.replay.replay(data.get("session_id"), int(data.get("last_seq", 0))))
+            
+            elif msg_type == "calibrate":
+                # Timed baseline capture for the current user on the current board
+                duration = min(max(float(data.get("duration", 30)), 5.0), 300.0)
                 if not self.eeg_service.is_streaming:
-                    print("Starting EEG recording...")
-                    try:
-                        # Get connection parameters from message or environment
-                        serial_port = data.get("serial_port") or os.getenv("GANGLION_SERIAL_PORT")
-                        mac_address = data.get("mac_address") or os.getenv("GANGLION_MAC_ADDRESS")
-                        dongle_port = data.get("dongle_port") or os.getenv("GANGLION_DONGLE_PORT")
-                        
-                        print(f"Connection parameters - MAC: {mac_address}, Serial: {serial_port}, Dongle: {dongle_port}")
-                        
-                        # Try auto-detection if no parameters provided
-                        if not mac_address and not serial_port and not dongle_port:
-                            print("No connection parameters provided. Attempting auto-detection...")
-                            await websocket.send(json.dumps({
-                                "type": "info",
-                                "message": "Attempting to auto-detect Ganglion..."
-                            }))
-                            
-                            # Try auto-detection: scan for dongle ports and try connecting
-                            import glob
-                            dongle_ports = []
-                            # Check both cu and tty ports (prefer cu for OpenBCI on macOS)
-                            patterns = [
-                                "/dev/cu.usbserial*",  # Prefer cu ports (no dash - matches usbserial-XXX and usbserialXXX)
-                                "/dev/cu.usbmodem*",   # Matches usbmodem11, usbmodem-XXX, etc.
-                                "/dev/cu.USB-Serial*",
-                                "/dev/cu.*",  # Catch-all for cu ports (will filter out non-BLE)
-                                "/dev/tty.usbserial*",  # Fallback to tty
-                                "/dev/tty.usbmodem*",
-                                "/dev/tty.USB-Serial*",
-                            ]
-                            cu_ports = []
-                            tty_ports = []
-                            for pattern in patterns:
-                                try:
-                                    found = glob.glob(pattern)
-                                    print(f"  Checking pattern {pattern}: found {len(found)} ports")
-                                    for port in found:
-                                        # Skip common non-BLE ports
-                                        skip = False
-                                        skip_terms = ['Bluetooth', 'debug', 'Bluetooth-Incoming']
-                                        for term in skip_terms:
-                                            if term.lower() in port.lower():
-                                                skip = True
-                                                break
-                                        
-                                        if not skip:
-                                            if '/dev/cu.' in port:
-                                                if port not in cu_ports:
-                                                    cu_ports.append(port)
-                                            elif '/dev/tty.' in port:
-                                                if port not in tty_ports:
-                                                    tty_ports.append(port)
-                                except Exception as e:
-                                    print(f"  Error checking pattern {pattern}: {e}")
-                            
-                            # Prefer cu ports (recommended for OpenBCI on macOS)
-                            dongle_ports = cu_ports + tty_ports
-                            print(f"Auto-detection: Found {len(dongle_ports)} potential dongle port(s): {dongle_ports}")
-                            
-                            if dongle_ports:
-                                print(f"Found {len(dongle_ports)} potential dongle port(s), trying auto-detection...")
-                                # Try connecting with just dongle port (let BrainFlow scan for MAC)
-                                for dongle_port in dongle_ports:
-                                    try:
-                                        print(f"Trying auto-detect with dongle port: {dongle_port}")
-                                        self.eeg_service.connect(dongle_port=dongle_port)
-                                        print(f"✅ Auto-detection successful with {dongle_port}!")
-                                        break
-                                    except Exception as e:
-                                        print(f"Failed with {dongle_port}: {e}")
-                                        continue
-                                else:
-                                    # All dongle ports failed
-                                    error_msg = (
-                                        "Auto-detection failed. Please provide connection details:\n"
-                                        "1. For BLE dongle: Set GANGLION_DONGLE_PORT in .env\n"
-                                        "2. Run 'python -m backend.auto_detect_ganglion' to find your dongle port"
-                                    )
-                                    print(f"ERROR: {error_msg}")
-                                    await websocket.send(json.dumps({
-                                        "type": "error",
-                                        "message": error_msg
-                                    }))
-                                    return
-                            else:
-                                error_msg = (
-                                    "No BLE dongle found. Please:\n"
-                                    "1. Plug in your BLE dongle\n"
-                                    "2. Set GANGLION_DONGLE_PORT in .env\n"
-                                    "3. Or run 'python -m backend.auto_detect_ganglion'"
-                                )
-                                print(f"ERROR: {error_msg}")
-                                await websocket.send(json.dumps({
-                                    "type": "error",
-                                    "message": error_msg
-                                }))
-                                return
-                        # For BLE dongle: try with just dongle port (auto-detect MAC)
-                        elif dongle_port:
-                            print(f"Connecting to Ganglion via BLE dongle (auto-detect MAC): Dongle={dongle_port}")
-                            if mac_address:
-                                print(f"  Using provided MAC: {mac_address}")
-                                self.eeg_service.connect(mac_address=mac_address, dongle_port=dongle_port)
-                            else:
-                                print(f"  Auto-detecting Ganglion MAC address...")
-                                self.eeg_service.connect(dongle_port=dongle_port)
-                        # For BLE dongle with MAC: need both MAC address and dongle port
-                        elif mac_address and dongle_port:
-                            print(f"Connecting to Ganglion via BLE dongle: MAC={mac_address}, Dongle={dongle_port}")
-                            self.eeg_service.connect(mac_address=mac_address, dongle_port=dongle_port)
-                        # For direct Bluetooth: just MAC address
-                        elif mac_address:
-                            print(f"Connecting to Ganglion via Bluetooth: {mac_address}")
-                            self.eeg_service.connect(mac_address=mac_address)
-                        # For USB: serial port
-                        elif serial_port:
-                            print(f"Connecting to Ganglion via USB: {serial_port}")
-                            self.eeg_service.connect(serial_port=serial_port)
-                        
-                        print("Starting EEG stream...")
-                        self.eeg_service.start_streaming(self.on_eeg_data)
-                        # Start the stream loop as a background task
-                        self.stream_task = asyncio.create_task(self.eeg_service.stream_loop())
-                        print("EEG recording started successfully!")
-                        await self.broadcast({"type": "recording_started"})
-                    except Exception as e:
-                        error_msg = f"Failed to start EEG: {str(e)}\n\nMake sure:\n1. Ganglion is powered on\n2. Ganglion is paired (System Settings → Bluetooth)\n3. Connection details are set in .env file\n\nRun 'python find_ganglion.py' to find your MAC address."
-                        print(f"ERROR: {error_msg}")
-                        print(f"Exception details: {type(e).__name__}: {e}")
-                        await websocket.send(json.dumps({
-                            "type": "error",
-                            "message": error_msg
-                        }))
+                    await websocket.send(json.dumps({
+                        "type": "error",
+                        "message": "Start recording before calibrating"
+                    }))
                 else:
-                    print("EEG already streaming, ignoring start_recording request")
+                    if self.calibration_task:
+                        self.calibration_task.cancel()
+                    await self.normalizer.start_calibration(self.current_user_id, self.eeg_service.board_id, duration)
+                    self.calibration_task = asyncio.create_task(
+                        self.run_calibration(self.current_user_id, duration)
+                    )
+                    await self.broadcast({
+                        "type": "calibration_started",
+                        "user_id": self.current_user_id,
+                        "duration": duration
+                    })
+            
+            elif msg_type == "get_recommendation":
+                recommendation = self.recommender.recommend(
+                    self.current_user_id, self.current_mode, self.current_context
+                )
+                await websocket.send(json.dumps({
+                    "type": "recommendation",
+                    "user_id": self.current_user_id,
+                    **recommendation
+                }))
+            
+            elif msg_type == "dismiss_recommendation":
+                # The user declined it, so its outcome shouldn't be learned from
+                self.recommender.dismiss(data.get("recommendation_id", ""))
+            
+            elif msg_type == "ack":
+                # Client echo of an eeg_data frame: received_at is unix time in ms
+                received_at = data.get("received_at")
+                trace_id = data.get("trace_id")
+                if trace_id and received_at is not None:
+                    latency = self.eeg_service.tracer.record_client_receipt(
+                        trace_id, str(getattr(websocket, "id", id(websocket))), int(float(received_at) * 1e6)
+                    )
+                    if latency is not None:
+                        self.client_latency.setdefault(websocket, LatencyTracker()).record(latency)
+            
+            elif msg_type == "get_latency":
+                await websocket.send(json.dumps({
+                    "type": "latency_stats",
+                    "clients": {
+                        str(getattr(client, "id", id(client))): tracker.summary()
+                        for client, tracker in self.client_latency.items()
+                    },
+                    "ticks": TickScheduler.get_instance().stats()
+                }))
+            
+            elif msg_type in ("start_recording", "stop_recording"):
+                if msg_type == "stop_recording":
+                    # Stopping abandons this client's board connect still in progress (an admin's: anyone's)
+                    self.commands.cancel(client=self._command_scope(websocket, data), name="start_recording")
+                handler = self.start_recording if msg_type == "start_recording" else self.stop_recording
+                try:
+                    self.commands.submit(websocket, msg_type, lambda: handler(websocket, data), "board",
+                                         data.get("command_id"))
+                except CommandRejected as e:
                     await websocket.send(json.dumps({
-                        "type": "info",
-                        "message": "Recording already in progress"
+                        "type": "error",
+                        "message": str(e),
+                        "command_id": data.get("command_id")
+                    }))
+            
+            elif msg_type == "cancel":
+                # By id, or all of this client's commands; only an admin can cancel other clients' commands
+                command_id = data.get("command_id")
+                scope = self._command_scope(websocket, data) if command_id else websocket
+                cancelled = self.commands.cancel(command_id, client=scope)
+                if not cancelled:
+                    await websocket.send(json.dumps({
+                        "type": "error",
+                        "message": f"No command in progress to cancel{f' with id {command_id}' if command_id else ''}",
+                        "command_id": command_id
                     }))
             
-            elif msg_type == "stop_recording":
-                if self.eeg_service.is_streaming:
-                    self.eeg_service.stop_streaming()
-                    # Cancel the stream task if it exists
-                    if self.stream_task:
-                        self.stream_task.cancel()
-                        try:
-                            await self.stream_task
-                        except asyncio.CancelledError:
-                            pass
-                        self.stream_task = None
-                    self.eeg_service.disconnect()
-                    await self.broadcast({"type": "recording_stopped"})
+            elif msg_type == "get_commands":
+                commands = self.commands.status(client=self._command_scope(websocket, data))
+                await websocket.send(json.dumps({"type": "commands", "commands": commands}))
+            
+            elif msg_type == "profile":
+                # Admin only; runs as a command so streaming carries on and it can be cancelled
+                if not is_admin(data.get("token")):
+                    await websocket.send(json.dumps({
+                        "type": "error",
+                        "message": "Admin token required (profiling is off unless ADMIN_TOKEN is set)"
+                    }))
+                    return
+                try:
+                    self.commands.submit(websocket, "profile", lambda: self.run_profile(websocket, data), "profiler",
+                                         data.get("command_id"))
+                except CommandRejected as e:
+                    await websocket.send(json.dumps({
+                        "type": "error",
+                        "message": str(e),
+                        "command_id": data.get("command_id")
+                    }))
         
         except json.JSONDecodeError:
             await websocket.send(json.dumps({"type": "error", "message": "Invalid JSON"}))
         except Exception as e:
             await websocket.send(json.dumps({"type": "error", "message": str(e)}))
     
-    async def on_eeg_data(self, bandpowers: dict):
-        """Callback when new EEG data is available"""
-        # Save to database
-        db = SessionLocal()
+    def _command_scope(self, websocket, data: dict):
+        """Client whose commands a message may see or cancel; None (every client's) with the admin token"""
+        return None if is_admin(data.get("token")) else websocket
+    
+    async def set_context(self, context: dict):
+        """Make context current, interning it in a worker thread so ticks just reuse its id"""
+        self.current_context = context
+        context_id = await asyncio.to_thread(self.contexts.intern, context)
+        if self.current_context is context:
+            # Unless a later set_context replaced it while this one was interned
+            self.current_context_id = context_id
+    
+    async def run_profile(self, websocket, data: dict):
+        """Profile this server process and send the results; runs as a tracked command"""
+        try:
+            result = await Profiler.get_instance().run(
+                data.get("mode", "sample"), data.get("seconds", 10), data.get("interval", 0.005),
+                bool(data.get("memory")), data.get("top", 30)
+            )
+        except (ProfilerBusy, ValueError) as e:
+            await websocket.send(json.dumps({"type": "error", "message": str(e), "command_id": data.get("command_id")}))
+            raise CommandFailed(str(e))
+        await websocket.send(json.dumps({"type": "profile_result", "command_id": data.get("command_id"), **result}))
+    
+    async def start_recording(self, websocket, data: dict):
+        """Connect to the board and start streaming; runs as a tracked, cancellable command"""
+        if not self.eeg_service.is_streaming:
+            print("Starting EEG recording...")
+            try:
+                # Get connection parameters from message or environment
+                serial_port = data.get("serial_port") or os.getenv("GANGLION_SERIAL_PORT")
+                mac_address = data.get("mac_address") or os.getenv("GANGLION_MAC_ADDRESS")
+                dongle_port = data.get("dongle_port") or os.getenv("GANGLION_DONGLE_PORT")
+                
+                print(f"Connection parameters - MAC: {mac_address}, Serial: {serial_port}, Dongle: {dongle_port}")
+                
+                # Try auto-detection if no parameters provided
+                if not mac_address and not serial_port and not dongle_port:
+                    print("No connection parameters provided. Attempting auto-detection...")
+                    await websocket.send(json.dumps({
+                        "type": "info",
+                        "message": "Attempting to auto-detect Ganglion..."
+                    }))
+                    
+                    dongle_ports = find_ble_dongle_ports()
+                    print(f"Auto-detection: Found {len(dongle_ports)} potential dongle port(s): {dongle_ports}")
+                    detection = await self.auto_detect_board(websocket, dongle_ports)
+                    if detection is None:
+                        if dongle_ports:
+                            error_msg = (
+                                "Auto-detection failed. Please provide connection details:\n"
+                                "1. For BLE dongle: Set GANGLION_DONGLE_PORT in .env\n"
+                                "2. Run 'python -m backend.auto_detect_ganglion' to find your dongle port"
+                            )
+                        else:
+                            error_msg = (
+                                "No BLE dongle found. Please:\n"
+                                "1. Plug in your BLE dongle\n"
+                                "2. Set GANGLION_DONGLE_PORT in .env\n"
+                                "3. Or run 'python -m backend.auto_detect_ganglion'"
+                            )
+                        print(f"ERROR: {error_msg}")
+                        await websocket.send(json.dumps({
+                            "type": "error",
+                            "message": error_msg
+                        }))
+                        raise CommandFailed("Auto-detection failed")
+                    print(f"✅ Auto-detection successful with {detection['dongle_port']} ({detection['elapsed']:.1f}s)")
+                # For BLE dongle: try with just dongle port (auto-detect MAC)
+                elif dongle_port:
+                    print(f"Connecting to Ganglion via BLE dongle (auto-detect MAC): Dongle={dongle_port}")
+                    if mac_address:
+                        print(f"  Using provided MAC: {mac_address}")
+                        await self._board_call(self.eeg_service.connect, mac_address=mac_address, dongle_port=dongle_port)
+                    else:
+                        print(f"  Auto-detecting Ganglion MAC address...")
+                        await self._board_call(self.eeg_service.connect, dongle_port=dongle_port)
+                # For BLE dongle with MAC: need both MAC address and dongle port
+                elif mac_address and dongle_port:
+                    print(f"Connecting to Ganglion via BLE dongle: MAC={mac_address}, Dongle={dongle_port}")
+                    await self._board_call(self.eeg_service.connect, mac_address=mac_address, dongle_port=dongle_port)
+                # For direct Bluetooth: just MAC address
+                elif mac_address:
+                    print(f"Connecting to Ganglion via Bluetooth: {mac_address}")
+                    await self._board_call(self.eeg_service.connect, mac_address=mac_address)
+                # For USB: serial port
+                elif serial_port:
+                    print(f"Connecting to Ganglion via USB: {serial_port}")
+                    await self._board_call(self.eeg_service.connect, serial_port=serial_port)
+                
+                # Open the session first so the first tick is recorded under it
+                session_id = await self.sessions.start(
+                    self.current_user_id, self.eeg_service.board_id, self.current_mode
+                )
+                print("Starting EEG stream...")
+                try:
+                    self.eeg_service.start_streaming(self.on_eeg_data, self.on_board_state)
+                except ValueError as e:
+                    # Bad stream settings (tick policy), not a board problem
+                    await self._abandon_session()
+                    await asyncio.to_thread(self.eeg_service.disconnect)
+                    await websocket.send(json.dumps({"type": "error", "message": f"Failed to start EEG: {e}"}))
+                    raise CommandFailed(str(e))
+                # Start the stream loop as a background task
+                self.stream_task = asyncio.create_task(self.eeg_service.stream_loop())
+                print("EEG recording started successfully!")
+                await self.broadcast({"type": "recording_started", "session_id": session_id})
+            except asyncio.CancelledError:
+                # Cancelled (or superseded by stop_recording) before streaming began
+                print("start_recording cancelled")
+                if not self.eeg_service.is_streaming:
+                    await self._abandon_session()
+                    await asyncio.to_thread(self.eeg_service.disconnect)
+                raise
+            except CommandFailed:
+                raise
+            except Exception as e:
+                await self._abandon_session()
+                error_msg = f"Failed to start EEG: {str(e)}\n\nMake sure:\n1. Ganglion is powered on\n2. Ganglion is paired (System Settings → Bluetooth)\n3. Connection details are set in .env file\n\nRun 'python find_ganglion.py' to find your MAC address."
+                print(f"ERROR: {error_msg}")
+                print(f"Exception details: {type(e).__name__}: {e}")
+                await websocket.send(json.dumps({
+                    "type": "error",
+                    "message": error_msg
+                }))
+                raise CommandFailed(str(e))
+        else:
+            print("EEG already streaming, ignoring start_recording request")
+            await websocket.send(json.dumps({
+                "type": "info",
+                "message": "Recording already in progress"
+            }))
+    
+    async def _abandon_session(self):
+        """Close a session opened by a start_recording that never began streaming"""
+        if self.sessions.active and not self.eeg_service.is_streaming:
+            await self.sessions.finish(status="interrupted")
+    
+    async def stop_recording(self, websocket, data: dict):
+        """Stop streaming, flush pending events and finish the session"""
+        if self.eeg_service.is_streaming:
+            self.eeg_service.stop_streaming()
+            # Cancel the stream task if it exists
+            if self.stream_task:
+                self.stream_task.cancel()
+                try:
+                    await self.stream_task
+                except asyncio.CancelledError:
+                    pass
+                self.stream_task = None
+            if self.calibration_task:
+                self.calibration_task.cancel()
+                self.calibration_task = None
+            await self.normalizer.flush()
+            await self.events.flush_async()
+            session = await self.sessions.finish()
+            self.eeg_service.disconnect()
+            await self.broadcast({
+                "type": "recording_stopped",
+                "session_id": session["id"] if session else None,
+                "summary": session["summary"] if session else None
+            })
+    
+    async def on_command_update(self, command: Command):
+        """Report a tracked command's progress to the client that sent it"""
+        await command.client.send(json.dumps({"type": "command_status", **command.to_dict()}))
+    
+    async def _board_call(self, func, *args, on_cancel=None, **kwargs):
+        """Run a blocking board call in a thread
+        
+        Threads can't be interrupted, so a cancelled caller still waits for
+        the call to return (keeping the board lock) and then releases what
+        it opened, via on_cancel(result) or the caller's own cleanup.
+        """
+        call = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        try:
+            return await asyncio.shield(call)
+        except asyncio.CancelledError:
+            try:
+                result = await call
+            except Exception:
+                result = None
+            if on_cancel is not None and result is not None:
+                await asyncio.to_thread(on_cancel, result)
+            raise
+    
+    async def send_history(self, websocket, seconds=None, session_id=None):
+        """Send a snapshot of a session's recent frames (the latest session by default)"""
+        seconds = HISTORY_SNAPSHOT_SECONDS if seconds is None else float(seconds)
+        if seconds > 0:
+            snapshot = self.history.snapshot(session_id, seconds)
+            if snapshot["session_id"] == self.replay.session_id:
+                # Where live frames (and a later resume) pick up from
+                snapshot["last_seq"] = self.replay.seq
+            await websocket.send(json.dumps(snapshot))
+    
+    async def run_calibration(self, user_id: str, duration: float):
+        """Wait out a baseline capture, then finalize and persist it"""
+        board_id = self.eeg_service.board_id
+        try:
+            await asyncio.sleep(duration)
+        except asyncio.CancelledError:
+            self.normalizer.cancel_calibration(user_id, board_id)
+            raise
+        profile = await self.normalizer.finish_calibration(user_id, board_id)
+        if profile is None:
+            await self.broadcast({
+                "type": "calibration_failed",
+                "user_id": user_id,
+                "message": "Not enough EEG data during calibration. Check the headset and try again."
+            })
+        else:
+            print(f"Calibration complete for {user_id} ({profile.count} samples)")
+            await self.broadcast({
+                "type": "calibration_complete",
+                "user_id": user_id,
+                "samples": profile.count,
+                "baseline": profile.baseline_scores()
+            })
+        self.calibration_task = None
+    
+    async def auto_detect_board(self, websocket, ports):
+        """Probe dongle ports in worker threads, streaming progress to the requesting client"""
+        loop = asyncio.get_running_loop()
+        progress_queue: asyncio.Queue = asyncio.Queue()
+        
+        def progress(event):
+            # Called from probe threads
+            loop.call_soon_threadsafe(progress_queue.put_nowait, event)
+        
+        async def forward_progress():
+            while True:
+                event = await progress_queue.get()
+                if event is None:
+                    return
+                print(f"  [{event['stage']}] {event['message']}")
+                try:
+                    await websocket.send(json.dumps({"type": "info", **event}))
+                except websockets.exceptions.ConnectionClosed:
+                    pass
+        
+        forwarder = asyncio.create_task(forward_progress())
         try:
-            event = Event(
-                timestamp=datetime.utcnow(),
-                mode=self.current_mode,
-                focus_score=bandpowers["focus_score"],
-                load_score=bandpowers["load_score"],
-                anomaly_score=bandpowers["anomaly_score"],
-                context=self.current_context,
-                user_id=self.current_user_id
+            detection = await self._board_call(
+                detect_ganglion, ports,
+                board_id=self.eeg_service.board_id, progress=progress, keep_session=True,
+                on_cancel=lambda found: found["board"].release_session()
+            )
+        finally:
+            progress_queue.put_nowait(None)
+            await forwarder
+        if detection:
+            self.eeg_service.use_board(detection["board"])
+        return detection
+    
+    async def on_board_state(self, state: dict):
+        """Callback when the board drops out, is reconnecting, or streams again"""
+        await self.broadcast({
+            "type": "board_state",
+            **state,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
+    async def on_eeg_data(self, bandpowers: FeatureFrame, trace: Optional[TickTrace] = None):
+        """Callback when new EEG data is available
+        
+        Every stage reads the same frame: it is normalized in place, queued
+        as a row tuple and serialized without intermediate dicts.
+        """
+        # Anomaly events detected in the processing stage go out on their own topic
+        anomaly_event = bandpowers.anomaly_event
+        if anomaly_event:
+            await self.broadcast({
+                "type": "anomaly",
+                **anomaly_event,
+                "user_id": self.current_user_id,
+                "mode": self.current_mode,
+                "timestamp": datetime.utcnow().isoformat()
+            }, topic="anomaly")
+        
+        # Normalize against the user's baseline (or feed an active calibration)
+        bandpowers = await self.normalizer.process(self.current_user_id, self.eeg_service.board_id, bandpowers)
+        
+        # Score the outcome of any pending recommendations for this user
+        outcomes = self.recommender.observe(
+            self.current_user_id, bandpowers.focus_score, bandpowers.load_score, bandpowers.anomaly_score
+        )
+        for outcome in outcomes:
+            await self.broadcast({"type": "recommendation_outcome", "user_id": self.current_user_id, **outcome})
+        
+        self.sessions.observe(bandpowers, anomaly=anomaly_event is not None)
+        
+        # Queue for the batch writer
+        with stage(trace, "persist"):
+            if self.current_context_id is None:
+                # Default context, before any set_context
+                await self.set_context(self.current_context)
+            timestamp = datetime.utcnow()
+            flush_due = self.events.add_frame(
+                bandpowers, timestamp, self.current_mode, self.current_context_id,
+                self.current_user_id, SCORE_VERSION, self.sessions.session_id
             )
-            db.add(event)
-            db.commit()
+            if flush_due:
+                await self.events.flush_async()
             
             # Optionally sync to Firebase
             try:
@@ -258,29 +601,33 @@ class WebSocketServer:
                 if firebase_service.is_available():
                     firebase_data = {
                         "mode": self.current_mode,
-                        "focus_score": bandpowers["focus_score"],
-                        "load_score": bandpowers["load_score"],
-                        "anomaly_score": bandpowers["anomaly_score"],
+                        "focus_score": bandpowers.focus_score,
+                        "load_score": bandpowers.load_score,
+                        "anomaly_score": bandpowers.anomaly_score,
                         "context": self.current_context,
                         "user_id": self.current_user_id,
-                        "timestamp": event.timestamp
+                        "timestamp": timestamp
                     }
-                    firebase_service.insert_event(firebase_data)
+                    with FIRESTORE_WRITE_SECONDS.time():
+                        firebase_service.insert_event(firebase_data)
             except Exception as e:
+                FAILED_SYNCS.inc(target="firestore")
                 print(f"Warning: Failed to sync event to Firebase: {e}")
-        except Exception as e:
-            print(f"Error saving event: {e}")
-            db.rollback()
-        finally:
-            db.close()
         
         # Broadcast to clients
-        await self.broadcast({
-            "type": "eeg_data",
-            "data": bandpowers,
-            "mode": self.current_mode,
-            "timestamp": datetime.utcnow().isoformat()
-        })
+        with stage(trace, "serialize"):
+            now = datetime.utcnow()
+            session_id = self.sessions.session_id
+            self.history.append(session_id, now.replace(tzinfo=timezone.utc).timestamp(), self.current_mode, bandpowers)
+            seq = self.replay.next_seq(session_id)
+            if trace is not None:
+                message_str = eeg_data_json(bandpowers, self.current_mode, now.isoformat(), session_id, seq,
+                                            trace.trace_id, trace.sample_timestamp)
+            else:
+                message_str = eeg_data_json(bandpowers, self.current_mode, now.isoformat(), session_id, seq)
+            self.replay.add(seq, message_str)
+        with stage(trace, "send"):
+            await self.broadcast_serialized(message_str, topic="eeg")
     
     async def handle_client(self, websocket):
         """Handle a client connection"""
@@ -288,6 +635,8 @@ class WebSocketServer:
         try:
             async for message in websocket:
                 await self.handle_message(websocket, message)
+                # Buffered messages don't suspend; yield so one chatty client can't hog the loop
+                await asyncio.sleep(0)
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
@@ -295,6 +644,13 @@ class WebSocketServer:
     
     def process_request(self, protocol, request):
         """Custom request processor to handle Connection header issues"""
+        # Plain HTTP scrape of the metrics registry
+        if request.path == "/metrics":
+            response = protocol.respond(HTTPStatus.OK, REGISTRY.render())
+            del response.headers["Content-Type"]
+            response.headers["Content-Type"] = CONTENT_TYPE
+            return response
+        
         # In websockets 15.x, request is a Request object
         # Access headers via request.headers
         connection = request.headers.get("Connection", "")
@@ -306,13 +662,28 @@ class WebSocketServer:
     async def start(self):
         """Start the WebSocket server"""
         print(f"Starting WebSocket server on ws://{self.host}:{self.port}")
+        # The process that writes events also compacts them (a no-op unless RETENTION_RAW_DAYS is set)
+        self.retention.start()
         async with websockets.serve(
             self.handle_client, 
             self.host, 
             self.port,
             process_request=self.process_request,
         ):
-            await asyncio.Future()  # Run forever
+            try:
+                await asyncio.Future()  # Run forever
+            finally:
+                self.events.flush()
+    
+    async def start_acquisition(self, bus_path: str = BUS_SOCKET):
+        """Own the board behind WebSocket relays (see backend/relay.py)
+        
+        Relay clients reach handle_message through the IPC bus. The usual
+        server still listens on self.port, for /metrics and direct clients.
+        """
+        self.bus = BusServer(bus_path, self.register_client, self.handle_message, self.unregister_client)
+        await self.bus.start()
+        await self.start()
 
 if __name__ == "__main__":
     server = WebSocketServer()
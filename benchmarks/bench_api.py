@@ -0,0 +1,91 @@
+"""
+Benchmark GET /events: ORM + response_model route vs the column/orjson path
+
+The legacy route (ORM objects validated through List[EventResponse]) is
+rebuilt here on its own app so both run against the same seeded scratch
+SQLite database, in-process through TestClient, at several page sizes.
+Responses are checked to decode to the same JSON before timing.
+
+Usage:
+    python -m benchmarks.bench_api --output bench_api.json
+    python -m benchmarks.bench_api --baseline main.json --threshold 0.2
+"""
+import os
+import sys
+import tempfile
+
+from benchmarks.harness import time_call, result, make_parser, finish
+
+PAGE_SIZES = (100, 1000, 5000, 10000)
+
+
+def legacy_app():
+    """The /events route as it was before the fast path, resolving interned contexts per event"""
+    from typing import List, Optional
+    from fastapi import Depends, FastAPI
+    from sqlalchemy.orm import Session
+    from backend.database import Event, get_db
+    from backend.api import event_to_dict
+    from backend.models import EventResponse
+
+    app = FastAPI()
+
+    @app.get("/events", response_model=List[EventResponse])
+    def get_events(user_id: Optional[str] = None, mode: Optional[str] = None, limit: int = 100,
+                   db: Session = Depends(get_db)):
+        query = db.query(Event)
+        if user_id:
+            query = query.filter(Event.user_id == user_id)
+        if mode:
+            query = query.filter(Event.mode == mode)
+        return [event_to_dict(event, db) for event in query.order_by(Event.timestamp.desc()).limit(limit).all()]
+
+    return app
+
+
+def bench_events(quick: bool) -> dict:
+    from fastapi.testclient import TestClient
+    from backend.api import app
+
+    clients = {"orm": TestClient(legacy_app()), "fast": TestClient(app)}
+    repeat = 5 if quick else 30
+    results = {}
+    for page_size in PAGE_SIZES:
+        params = {"limit": page_size}
+        bodies = {name: client.get("/events", params=params) for name, client in clients.items()}
+        if bodies["orm"].json() != bodies["fast"].json():
+            raise AssertionError(f"/events responses differ at limit={page_size}")
+        for name, client in clients.items():
+            stats = time_call(lambda: client.get("/events", params=params), repeat=repeat, warmup=2)
+            rows_per_s = page_size / (stats["mean_ms"] / 1000)
+            results[f"events_{name}_{page_size}_ms"] = result(stats["mean_ms"], "ms", False, **stats)
+            results[f"events_{name}_{page_size}_rows_per_s"] = result(rows_per_s, "rows/s", True)
+            print(f"  {name:>4} limit={page_size:<6} {stats['mean_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  {rows_per_s:12,.0f} rows/s  "
+                  f"{len(bodies[name].content):,} bytes")
+        speedup = results[f"events_orm_{page_size}_ms"]["value"] / results[f"events_fast_{page_size}_ms"]["value"]
+        results[f"events_speedup_{page_size}"] = result(speedup, "x", True)
+        print(f"  speedup limit={page_size}: {speedup:.1f}x")
+    return results
+
+
+def main() -> int:
+    parser = make_parser(__doc__.splitlines()[1], "bench_api.json")
+    parser.add_argument("--rows", type=int, default=20000, help="Events to seed into the scratch database")
+    args = parser.parse_args()
+
+    # The database engine is created at import time, so point it at a scratch file first
+    scratch = tempfile.mkdtemp(prefix="neurocalm-bench-")
+    database_url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    from benchmarks.seed_events import seed
+    seed(database_url, users=5, days=2, sessions_per_day=4, session_minutes=45,
+         max_rows=max(args.rows, max(PAGE_SIZES)), seed_value=42)
+
+    print("GET /events")
+    results = bench_events(args.quick)
+    config = {"page_sizes": PAGE_SIZES, "rows": args.rows, "quick": args.quick}
+    return finish(args, "api", results, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+Benchmark a tick's trip through persistence and serialization: dicts vs FeatureFrame
+
+The previous representation (a fresh dict per consumer: pipeline result,
+queued Event row, the row again at flush, broadcast message) is rebuilt
+here next to the FeatureFrame path, and both run the same ticks through
+row queueing, batch parameter building and eeg_data serialization. Ticks
+come plain and calibrated (z-scores and raw_* scores added). The
+serialized messages are checked to decode the same before measuring:
+- time per tick
+- peak traced memory per tick (tracemalloc)
+- bytes held by one queued row
+- GC collections and time per 10k ticks
+
+Usage:
+    python -m benchmarks.bench_frames --output bench_frames.json
+    python -m benchmarks.bench_frames --baseline main.json --threshold 0.2
+"""
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.harness import result, make_parser, finish
+
+BATCH_SIZE = 50
+MODE = "study"
+USER_ID = "bench"
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+SAMPLE_TIMESTAMP = 1700000000.25
+
+
+def make_ticks(count: int, calibrated: bool, seed: int = 0) -> list:
+    """Extractor outputs per tick (band_powers, then scores), plus what calibration adds"""
+    rng = np.random.default_rng(seed)
+    bands = 10 ** rng.uniform(-2, 1, (count, 4))
+    scores = rng.uniform(0, 100, (count, 3))
+    ticks = []
+    for i in range(count):
+        band_powers = dict(zip(("alpha", "beta", "theta", "gamma"), bands[i].tolist()))
+        tick_scores = dict(zip(("focus_score", "load_score", "anomaly_score"), scores[i].tolist()))
+        z = {name: round(float(value), 4) for name, value in zip(("alpha", "beta", "theta", "gamma"), bands[i])}
+        ticks.append((band_powers, tick_scores, z if calibrated else None, 0.5 if i % 97 == 0 else None))
+    return ticks
+
+
+def calibrate(features, z):
+    """What BaselineNormalizer.process adds to a calibrated user's tick"""
+    features["z"] = z
+    for name in ("focus_score", "load_score"):
+        features[f"raw_{name}"] = features[name]
+        features[name] = 50.0
+
+
+class DictQueue:
+    """EventWriter's queue as it was, holding each row as a dict"""
+
+    def __init__(self):
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def add(self, row: dict) -> bool:
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(row)
+            return len(self._pending) >= BATCH_SIZE or time.monotonic() - self._oldest >= 1e9
+
+
+def dict_path():
+    """The previous tick path: one dict per consumer"""
+    from backend.event_writer import EVENT_COLUMNS
+    queue = DictQueue()
+
+    def tick(seq: int, band_powers: dict, scores: dict, z, gap) -> str:
+        features = {}
+        features.update(band_powers)
+        features.update(scores)
+        features["anomaly_event"] = None
+        if gap:
+            features["gap_seconds"] = gap
+        features.pop("anomaly_event", None)
+        if z is not None:
+            calibrate(features, z)
+        now = datetime.utcnow()
+        flush_due = queue.add({
+            "timestamp": now, "mode": MODE, "focus_score": features["focus_score"],
+            "load_score": features["load_score"], "anomaly_score": features["anomaly_score"],
+            "context_id": 1, "user_id": USER_ID, "alpha": features.get("alpha"), "beta": features.get("beta"),
+            "theta": features.get("theta"), "gamma": features.get("gamma"), "score_version": 1,
+            "session_id": 1, "gap_seconds": features.get("gap_seconds"),
+        })
+        if flush_due:
+            rows, queue._pending = queue._pending, []
+            params = [{column: row.get(column) for column in EVENT_COLUMNS} for row in rows]
+        return json.dumps({
+            "type": "eeg_data", "data": features, "mode": MODE, "timestamp": now.isoformat(),
+            "session_id": 1, "seq": seq, "trace_id": TRACE_ID, "sample_timestamp": SAMPLE_TIMESTAMP,
+        })
+
+    return tick
+
+
+def frame_path():
+    """The FeatureFrame path, as EEGService and WebSocketServer.on_eeg_data run it"""
+    from backend.event_writer import EventWriter, ROW_COLUMNS
+    from backend.features import FeatureFrame
+    from backend.serialization import eeg_data_json
+    writer = EventWriter(batch_size=BATCH_SIZE, flush_seconds=1e9)
+
+    def tick(seq: int, band_powers: dict, scores: dict, z, gap) -> str:
+        frame = FeatureFrame()
+        frame.update(band_powers)
+        frame.update(scores)
+        frame.anomaly_event = None
+        if gap:
+            frame.gap_seconds = gap
+        if z is not None:
+            calibrate(frame, z)
+        now = datetime.utcnow()
+        if writer.add_frame(frame, now, MODE, 1, USER_ID, 1, 1):
+            # What flush() hands to executemany, minus the database
+            rows, writer._pending = writer._pending, []
+            params = [dict(zip(ROW_COLUMNS, row)) for row in rows]
+        return eeg_data_json(frame, MODE, now.isoformat(), 1, seq, TRACE_ID, SAMPLE_TIMESTAMP)
+
+    return tick
+
+
+PATHS = {"dicts": dict_path, "frame": frame_path}
+
+
+def run(tick, ticks: list) -> list:
+    return [tick(seq, *data) for seq, data in enumerate(ticks, 1)]
+
+
+def check_same_output(ticks: list):
+    outputs = {name: [json.loads(message) for message in run(path(), ticks)] for name, path in PATHS.items()}
+    for message in outputs["dicts"] + outputs["frame"]:
+        message.pop("timestamp")
+    if outputs["dicts"] != outputs["frame"]:
+        raise AssertionError("dict and frame paths serialize different eeg_data messages")
+
+
+def queued_row_bytes() -> dict:
+    """Memory one queued row holds (container plus its boxed floats are shared, so container only)"""
+    from backend.event_writer import ROW_COLUMNS
+    row = {column: 0.0 for column in ROW_COLUMNS}
+    return {"dicts": sys.getsizeof(row), "frame": sys.getsizeof(tuple(row.values()))}
+
+
+def measure(path, ticks: list, repeat: int) -> dict:
+    tick = path()
+    run(tick, ticks[:100])  # warm up imports and caches
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(tick, ticks)
+        best = min(best, time.perf_counter() - start)
+
+    collections = [0]
+    gc_seconds = [0.0]
+    started = [0.0]
+
+    def on_gc(phase, info):
+        if phase == "start":
+            started[0] = time.perf_counter()
+        else:
+            collections[0] += 1
+            gc_seconds[0] += time.perf_counter() - started[0]
+
+    gc.collect()
+    gc.callbacks.append(on_gc)
+    try:
+        run(tick, ticks)
+    finally:
+        gc.callbacks.remove(on_gc)
+
+    # Peak traced memory of single ticks, above what is already held
+    tracemalloc.start()
+    try:
+        peaks = []
+        for seq, data in enumerate(ticks[:500], 1):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            tick(seq, *data)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    per_10k = 10000 / len(ticks)
+    return {
+        "us_per_tick": best / len(ticks) * 1e6,
+        "peak_bytes_per_tick": float(np.mean(peaks)),
+        "gc_collections_per_10k": collections[0] * per_10k,
+        "gc_ms_per_10k": gc_seconds[0] * 1000 * per_10k,
+    }
+
+
+def bench_frames(quick: bool) -> dict:
+    count = 2000 if quick else 20000
+    repeat = 2 if quick else 5
+    results = {}
+    row_bytes = queued_row_bytes()
+    for name, size in row_bytes.items():
+        results[f"{name}_queued_row_bytes"] = result(size, "bytes", False)
+    print(f"  queued row: dict {row_bytes['dicts']} bytes, tuple {row_bytes['frame']} bytes")
+    for calibrated in (False, True):
+        label = "calibrated" if calibrated else "plain"
+        ticks = make_ticks(count, calibrated)
+        check_same_output(ticks[:500])
+        stats = {name: measure(path, ticks, repeat) for name, path in PATHS.items()}
+        for name, values in stats.items():
+            results[f"{name}_{label}_us_per_tick"] = result(values["us_per_tick"], "us", False)
+            results[f"{name}_{label}_peak_bytes_per_tick"] = result(values["peak_bytes_per_tick"], "bytes", False)
+            results[f"{name}_{label}_gc_collections_per_10k"] = result(
+                values["gc_collections_per_10k"], "collections", False, gc_ms=values["gc_ms_per_10k"])
+            print(f"  {name:>5} {label:<10} {values['us_per_tick']:7.2f} us/tick  "
+                  f"peak {values['peak_bytes_per_tick']:7.0f} B/tick  "
+                  f"gc {values['gc_collections_per_10k']:5.1f} collections ({values['gc_ms_per_10k']:.2f} ms) per 10k")
+        speedup = stats["dicts"]["us_per_tick"] / stats["frame"]["us_per_tick"]
+        results[f"frame_{label}_speedup"] = result(speedup, "x", True)
+        print(f"  speedup {label}: {speedup:.2f}x")
+    return results
+
+
+def main() -> int:
+    parser = make_parser(__doc__.splitlines()[1], "bench_frames.json")
+    args = parser.parse_args()
+
+    # The event writer imports the database engine, so point it at a scratch file first
+    scratch = tempfile.mkdtemp(prefix="neurocalm-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+
+    print("Tick path: persistence and serialization")
+    results = bench_frames(args.quick)
+    return finish(args, "frames", results, {"batch_size": BATCH_SIZE, "quick": args.quick})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Benchmark the EEG processing and streaming path without hardware
+
+DSP: the feature pipeline's extraction over samples captured from
+BrainFlow's SYNTHETIC_BOARD, for varying channel counts, window sizes and
+update rates, both unfiltered and through the streaming filter chain.
+Recommender: per-decision and per-update cost of the contextual bandit.
+Streaming: WebSocketServer.on_eeg_data driven as fast as possible with N
+simulated websocket clients, persisting to a throwaway SQLite database.
+
+Usage:
+    python -m benchmarks.bench_pipeline --output bench_pipeline.json
+    python -m benchmarks.bench_pipeline --baseline main.json --threshold 0.2
+"""
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.harness import time_call, result, make_parser, finish
+
+CHANNEL_COUNTS = (1, 4, 8, 16)
+WINDOW_SECONDS = (1, 2, 4)
+UPDATE_RATES_HZ = (1, 10, 50)
+CLIENT_COUNTS = (1, 10, 50)
+
+
+def capture_synthetic(seconds: float = 2.0) -> np.ndarray:
+    """Record a short stretch of SYNTHETIC_BOARD data"""
+    from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
+
+    BoardShim.disable_board_logger()
+    board = BoardShim(BoardIds.SYNTHETIC_BOARD, BrainFlowInputParams())
+    board.prepare_session()
+    try:
+        board.start_stream()
+        time.sleep(seconds)
+        board.stop_stream()
+        return board.get_board_data()
+    finally:
+        board.release_session()
+
+
+def bench_dsp(quick: bool) -> dict:
+    from brainflow.board_shim import BoardShim, BoardIds
+    from backend.eeg_service import EEGService
+    from backend.features import SpectralWindow
+    from backend.filters import StreamingFilterChain, filter_config
+
+    board_id = BoardIds.SYNTHETIC_BOARD
+    sampling_rate = BoardShim.get_sampling_rate(board_id)
+    eeg_channels = BoardShim.get_eeg_channels(board_id)
+    recording = capture_synthetic()
+    service = EEGService(board_id=board_id)
+    repeat = 10 if quick else 100
+
+    results = {}
+    for window in WINDOW_SECONDS:
+        num_samples = window * sampling_rate
+        # Tile the capture so every window size sees real synthetic samples
+        reps = int(np.ceil(num_samples / recording.shape[1]))
+        data = np.ascontiguousarray(np.tile(recording, reps)[:, :num_samples])
+        for channels in CHANNEL_COUNTS:
+            rows = [np.ascontiguousarray(data[ch]) for ch in eeg_channels[:channels]]
+
+            def extract():
+                for row in rows:
+                    service._extract_features(SpectralWindow(row, sampling_rate))
+
+            chain = StreamingFilterChain(sampling_rate, filter_config(board_id))
+            block = np.ascontiguousarray(data[eeg_channels[:channels]])
+
+            def extract_filtered():
+                filtered, artifacts = chain.process(block)
+                for row, artifact in zip(filtered, artifacts):
+                    service._extract_features(SpectralWindow(row[~artifact], sampling_rate))
+
+            stats = time_call(extract, repeat=repeat)
+            filtered_stats = time_call(extract_filtered, repeat=repeat)
+            name = f"dsp.ch{channels}.win{window}s"
+            results[name] = result(stats["p50_ms"], "ms", False, **stats)
+            results[f"{name}.filtered"] = result(filtered_stats["p50_ms"], "ms", False, **filtered_stats)
+            for rate in UPDATE_RATES_HZ:
+                # Share of each tick's budget spent on feature extraction at this rate
+                results[f"{name}.budget_at_{rate}hz"] = result(
+                    filtered_stats["p99_ms"] * rate / 1000, "fraction", False)
+            print(f"  {name}: p50={stats['p50_ms']:.3f} ms p99={stats['p99_ms']:.3f} ms, "
+                  f"filtered p50={filtered_stats['p50_ms']:.3f} ms p99={filtered_stats['p99_ms']:.3f} ms")
+    return results
+
+
+def bench_recommender(quick: bool) -> dict:
+    from backend.recommender import Recommender, UserState, LinUCBModel
+
+    recommender = Recommender(model_dir=tempfile.mkdtemp(prefix="neurocalm-bench-models-"))
+    state = UserState()
+    state.update(55.0, 42.0, 3.0)
+    x = state.context_vector("study", {})
+    model = LinUCBModel()
+    repeat = 200 if quick else 2000
+
+    results = {}
+    for policy in ("linucb", "thompson"):
+        recommender.policy = policy
+        stats = time_call(lambda: recommender.recommend("bench", "study", {}, state=state, track=False),
+                          repeat=repeat)
+        results[f"recommender.{policy}.decision"] = result(stats["p50_ms"], "ms", False, **stats)
+        print(f"  {policy} decision: p50={stats['p50_ms']:.4f} ms p99={stats['p99_ms']:.4f} ms")
+    stats = time_call(lambda: model.update(1, x, 0.1), repeat=repeat)
+    results["recommender.update"] = result(stats["p50_ms"], "ms", False, **stats)
+    print(f"  update: p50={stats['p50_ms']:.4f} ms p99={stats['p99_ms']:.4f} ms")
+    return results
+
+
+async def _bench_fanout(num_clients: int, num_frames: int) -> dict:
+    import websockets
+    from backend.websocket_server import WebSocketServer
+    from backend.database import SessionLocal, Event
+    from backend.features import FeatureFrame
+
+    server = WebSocketServer(host="127.0.0.1", port=0)
+    features = {
+        "alpha": 1.2, "beta": 0.8, "theta": 0.9, "gamma": 0.1,
+        "focus_score": 66.7, "load_score": 26.7, "anomaly_score": 13.3,
+    }
+
+    async with websockets.serve(server.handle_client, "127.0.0.1", 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        received = [0] * num_clients
+
+        async def client(index: int, ready: asyncio.Event):
+            async with websockets.connect(f"ws://127.0.0.1:{port}", max_queue=None) as ws:
+                ready.set()
+                while received[index] < num_frames:
+                    message = json.loads(await ws.recv())
+                    if message["type"] == "eeg_data":
+                        received[index] += 1
+
+        readies = [asyncio.Event() for _ in range(num_clients)]
+        tasks = [asyncio.create_task(client(i, readies[i])) for i in range(num_clients)]
+        await asyncio.gather(*(ready.wait() for ready in readies))
+        while len(server.connected_clients) < num_clients:
+            await asyncio.sleep(0.01)
+
+        db = SessionLocal()
+        before = db.query(Event).count()
+        start = time.perf_counter()
+        for _ in range(num_frames):
+            # A fresh frame per tick, as the feature pipeline produces them
+            frame = FeatureFrame()
+            frame.update(features)
+            await server.on_eeg_data(frame)
+        await server.events.flush_async()
+        persist_elapsed = time.perf_counter() - start
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=60)
+        deliver_elapsed = time.perf_counter() - start
+        persisted = db.query(Event).count() - before
+        db.close()
+
+    return {
+        "persisted_events_per_s": persisted / persist_elapsed,
+        "delivered_frames_per_s": sum(received) / deliver_elapsed,
+    }
+
+
+def bench_streaming(quick: bool) -> dict:
+    num_frames = 50 if quick else 500
+    results = {}
+    for clients in CLIENT_COUNTS:
+        # Silence the server's per-connection logging while measuring
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            stats = asyncio.run(_bench_fanout(clients, num_frames))
+        results[f"stream.clients{clients}.persisted_events_per_s"] = result(
+            stats["persisted_events_per_s"], "events/s", True)
+        results[f"stream.clients{clients}.delivered_frames_per_s"] = result(
+            stats["delivered_frames_per_s"], "frames/s", True)
+        print(f"  clients={clients}: {stats['persisted_events_per_s']:.0f} events/s persisted, "
+              f"{stats['delivered_frames_per_s']:.0f} frames/s delivered")
+    return results
+
+
+def main() -> int:
+    parser = make_parser(__doc__.splitlines()[1], "bench_pipeline.json")
+    parser.add_argument("--skip-streaming", action="store_true", help="Only run the DSP benchmarks")
+    args = parser.parse_args()
+
+    # The database engine is created at import time, so point it at a scratch file first
+    scratch = tempfile.mkdtemp(prefix="neurocalm-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    from brainflow.board_shim import BoardIds
+    os.environ["BOARD_ID"] = str(BoardIds.SYNTHETIC_BOARD.value)
+    from backend.database import init_db
+    from backend.firebase_service import FirebaseService
+    init_db()
+    # Resolve Firebase credentials up front so the first measurement doesn't pay for it
+    FirebaseService.get_instance()
+
+    print("DSP feature extraction (SYNTHETIC_BOARD samples)")
+    results = bench_dsp(args.quick)
+    print("Recommender")
+    results.update(bench_recommender(args.quick))
+    if not args.skip_streaming:
+        print("Streaming fan-out and SQLite persistence")
+        results.update(bench_streaming(args.quick))
+
+    config = {
+        "channel_counts": CHANNEL_COUNTS,
+        "window_seconds": WINDOW_SECONDS,
+        "update_rates_hz": UPDATE_RATES_HZ,
+        "client_counts": CLIENT_COUNTS,
+        "quick": args.quick,
+    }
+    return finish(args, "pipeline", results, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
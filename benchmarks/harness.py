@@ -0,0 +1,106 @@
+"""
+Shared helpers for benchmark scripts
+Timing, JSON result files and regression checks against a baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def time_call(fn: Callable, repeat: int = 50, warmup: int = 5) -> Dict[str, float]:
+    """Run fn repeatedly and return latency statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples[i] = time.perf_counter() - start
+    samples *= 1000
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "max_ms": float(samples.max()),
+    }
+
+
+def result(value: float, unit: str, higher_is_better: bool, **extra) -> Dict[str, Any]:
+    """A single benchmark measurement; value is what regressions are checked on"""
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better, **extra}
+
+
+def write_results(path: str, suite: str, results: Dict[str, Dict[str, Any]], config: Dict[str, Any]):
+    payload = {
+        "suite": suite,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    print(f"Wrote {len(results)} results to {path}")
+
+
+def find_regressions(results: Dict[str, Dict[str, Any]], baseline_path: str, threshold: float) -> List[str]:
+    """
+    Compare results to a baseline file
+
+    A result regresses when it is worse than the baseline by more than
+    threshold (a fraction, e.g. 0.2 for 20%). Results missing from the
+    baseline are ignored.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f).get("results", {})
+
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("value"):
+            continue
+        change = (current["value"] - previous["value"]) / previous["value"]
+        worse = -change if current.get("higher_is_better") else change
+        if worse > threshold:
+            regressions.append(
+                f"{name}: {previous['value']:.4g} -> {current['value']:.4g} {current['unit']} "
+                f"({worse * 100:.1f}% worse, threshold {threshold * 100:.0f}%)"
+            )
+    return regressions
+
+
+def make_parser(description: str, default_output: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--output", default=default_output, help="Path of the JSON results file")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown before a result counts as a regression")
+    parser.add_argument("--quick", action="store_true", help="Fewer repetitions, for smoke runs")
+    return parser
+
+
+def finish(args: argparse.Namespace, suite: str, results: Dict[str, Dict[str, Any]],
+           config: Optional[Dict[str, Any]] = None) -> int:
+    """Write results, check the baseline and return a process exit code"""
+    write_results(args.output, suite, results, config or {})
+    if not args.baseline:
+        return 0
+    regressions = find_regressions(results, args.baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"\n✅ No regressions against {args.baseline}")
+    return 0
@@ -0,0 +1,141 @@
+"""
+Async load driver and soak test for the REST API
+
+Hammers GET /events, GET /stats/{user_id} and GET /users at a fixed
+concurrency and reports throughput and tail latency per endpoint. For soak
+runs, a rolling report is printed every --report-interval seconds so
+latency drift over time is visible.
+
+Usage:
+    python -m benchmarks.load_api --base-url http://localhost:8000 --concurrency 32 --duration 60
+    python -m benchmarks.load_api --duration 3600 --report-interval 60 --baseline main.json
+"""
+import asyncio
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.harness import result, make_parser, finish
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - only hit when dev dependencies are missing
+    httpx = None
+
+MODES = ("meeting", "study", "lecture", "background")
+
+
+def build_requests(users: List[str], limit: int):
+    """Weighted mix of (endpoint name, request path) factories"""
+    return [
+        (4, "events_by_user", lambda: f"/events?user_id={random.choice(users)}&limit={limit}"),
+        (2, "events_by_mode", lambda: f"/events?mode={random.choice(MODES)}&limit={limit}"),
+        (2, "stats", lambda: f"/stats/{random.choice(users)}"),
+        (1, "users", lambda: "/users"),
+    ]
+
+
+def summarize(latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> Dict[str, dict]:
+    summary = {}
+    for name, samples in sorted(latencies.items()):
+        values = np.asarray(samples) * 1000
+        summary[name] = {
+            "requests": len(values),
+            "errors": errors.get(name, 0),
+            "rps": len(values) / elapsed,
+            "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "p99_ms": float(np.percentile(values, 99)),
+        }
+    return summary
+
+
+def print_summary(title: str, summary: Dict[str, dict]):
+    print(title)
+    for name, stats in summary.items():
+        print(f"  {name:<16} {stats['rps']:8.1f} req/s  p50={stats['p50_ms']:8.2f} ms  "
+              f"p95={stats['p95_ms']:8.2f} ms  p99={stats['p99_ms']:8.2f} ms  errors={stats['errors']}")
+
+
+async def run_load(base_url: str, concurrency: int, duration: float, limit: int,
+                   report_interval: float) -> Dict[str, dict]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        users = (await client.get("/users")).json() or ["default"]
+        mix = build_requests(users, limit)
+        weights = [weight for weight, _, _ in mix]
+
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, int] = defaultdict(int)
+        window: Dict[str, List[float]] = defaultdict(list)
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                _, name, path = random.choices(mix, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path())
+                    if response.status_code >= 400:
+                        errors[name] += 1
+                except httpx.HTTPError:
+                    errors[name] += 1
+                elapsed = time.perf_counter() - start
+                latencies[name].append(elapsed)
+                window[name].append(elapsed)
+
+        async def reporter():
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(report_interval)
+                snapshot = {name: samples[:] for name, samples in window.items() if samples}
+                window.clear()
+                if snapshot:
+                    print_summary(f"[{time.strftime('%H:%M:%S')}] last {report_interval:.0f}s",
+                                  summarize(snapshot, {}, report_interval))
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        report_task = asyncio.create_task(reporter()) if report_interval > 0 else None
+        await asyncio.gather(*tasks)
+        if report_task:
+            report_task.cancel()
+        return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def main() -> int:
+    parser = make_parser(__doc__.splitlines()[1], "load_api.json")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--limit", type=int, default=100, help="limit parameter for /events")
+    parser.add_argument("--report-interval", type=float, default=0.0,
+                        help="Print rolling stats every N seconds (soak mode)")
+    args = parser.parse_args()
+
+    if httpx is None:
+        print("httpx is required for the load driver: pip install httpx")
+        return 2
+    if args.quick:
+        args.duration = min(args.duration, 5.0)
+
+    print(f"Load testing {args.base_url} with {args.concurrency} concurrent clients for {args.duration:.0f}s")
+    summary = asyncio.run(run_load(args.base_url, args.concurrency, args.duration, args.limit,
+                                   args.report_interval))
+    print_summary("Overall", summary)
+
+    results = {}
+    for name, stats in summary.items():
+        results[f"api.{name}.rps"] = result(stats["rps"], "req/s", True)
+        results[f"api.{name}.p99_ms"] = result(stats["p99_ms"], "ms", False, p50_ms=stats["p50_ms"],
+                                               p95_ms=stats["p95_ms"], errors=stats["errors"])
+    config = {"base_url": args.base_url, "concurrency": args.concurrency,
+              "duration": args.duration, "limit": args.limit}
+    return finish(args, "api_load", results, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
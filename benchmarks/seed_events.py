@@ -0,0 +1,147 @@
+"""
+Bulk-generate realistic event histories for load testing
+
+Writes per-user, per-mode sessions of 1 Hz events into DATABASE_URL (SQLite
+or Postgres). Scores and log band powers follow slow random walks per
+session so they look like real recordings rather than uniform noise.
+
+Usage:
+    DATABASE_URL=sqlite:///./loadtest.db python -m benchmarks.seed_events --rows 5000000
+    python -m benchmarks.seed_events --database-url postgresql://localhost/neurocalm --users 200
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ("meeting", "study", "lecture", "background")
+TABS = ("docs", "slides", "email", "video", "notes", "calendar")
+CHUNK_ROWS = 20000
+
+
+def _random_walk(rng: np.random.Generator, length: int, start: float, step: float) -> np.ndarray:
+    walk = start + np.cumsum(rng.normal(0.0, step, length))
+    return np.clip(walk, 0.0, 100.0)
+
+
+def generate_sessions(rng: np.random.Generator, users: int, days: int, sessions_per_day: int,
+                      session_minutes: int, end: datetime):
+    """Yield (user_id, mode, context, start, length_seconds) for every session"""
+    start_of_range = end - timedelta(days=days)
+    for user in range(users):
+        user_id = f"user{user:04d}"
+        for day in range(days):
+            day_start = start_of_range + timedelta(days=day, hours=8)
+            # Spread sessions over a working day
+            offsets = np.sort(rng.uniform(0, 10 * 3600, sessions_per_day))
+            for offset in offsets:
+                mode = MODES[rng.integers(len(MODES))]
+                length = int(max(60, rng.normal(session_minutes, session_minutes / 4)) * 60)
+                context = {
+                    "tab": TABS[rng.integers(len(TABS))],
+                    "url": f"https://example.com/{mode}/{rng.integers(1000)}",
+                    "calendar_event_id": f"evt-{rng.integers(100000)}" if mode in ("meeting", "lecture") else None,
+                }
+                yield user_id, mode, context, day_start + timedelta(seconds=float(offset)), length
+
+
+def seed(database_url: str, users: int, days: int, sessions_per_day: int, session_minutes: int,
+         max_rows: int, seed_value: int) -> int:
+    # The engine is created on import, so DATABASE_URL must be set first
+    os.environ["DATABASE_URL"] = database_url
+    from backend.database import engine, init_db, Event
+    from backend.contexts import ContextStore
+
+    init_db()
+    contexts = ContextStore.get_instance()
+    postgres = engine.dialect.name == "postgresql"
+    end = datetime.utcnow()
+    if postgres:
+        from backend.postgres import ensure_partitions, copy_rows, refresh_stats
+        from backend.event_writer import EVENT_COLUMNS
+        # Backfilled history would otherwise all land in the default partition
+        ensure_partitions(engine, end - timedelta(days=days), end)
+    rng = np.random.default_rng(seed_value)
+    table = Event.__table__
+    inserted = 0
+    buffer = []
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal inserted
+        if not buffer:
+            return
+        with engine.begin() as conn:
+            if postgres:
+                copy_rows(conn, table.name, EVENT_COLUMNS, buffer)
+            else:
+                conn.execute(table.insert(), buffer)
+        inserted += len(buffer)
+        buffer.clear()
+        rate = inserted / (time.perf_counter() - started)
+        print(f"  {inserted:,} rows ({rate:,.0f} rows/s)")
+
+    for user_id, mode, context, start, length in generate_sessions(
+            rng, users, days, sessions_per_day, session_minutes, end):
+        length = min(length, max_rows - inserted - len(buffer))
+        if length <= 0:
+            break
+        focus = _random_walk(rng, length, rng.uniform(30, 80), 0.8)
+        load = _random_walk(rng, length, rng.uniform(20, 70), 0.8)
+        anomaly = np.abs(rng.normal(8, 6, length)).clip(0, 100)
+        # alpha, beta, theta, gamma as random walks in log10 space
+        bands = 10 ** (rng.uniform(-1.5, 0.5, (1, 4)) + np.cumsum(rng.normal(0, 0.02, (length, 4)), axis=0))
+        context_id = contexts.intern(context)
+        base = np.datetime64(start, "us")
+        timestamps = (base + np.arange(length) * np.timedelta64(1, "s")).astype(datetime)
+        buffer.extend(
+            {
+                "timestamp": ts,
+                "mode": mode,
+                "focus_score": f,
+                "load_score": l,
+                "anomaly_score": a,
+                "context_id": context_id,
+                "user_id": user_id,
+                "alpha": b[0],
+                "beta": b[1],
+                "theta": b[2],
+                "gamma": b[3],
+            }
+            for ts, f, l, a, b in zip(timestamps, focus.tolist(), load.tolist(), anomaly.tolist(), bands.tolist())
+        )
+        if len(buffer) >= CHUNK_ROWS:
+            flush()
+    flush()
+    if postgres:
+        refresh_stats(engine, full=True)
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the events table with synthetic histories")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///./neurocalm_loadtest.db"))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--sessions-per-day", type=int, default=4)
+    parser.add_argument("--session-minutes", type=int, default=45)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Stop after this many rows")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.database_url} with up to {args.rows:,} events")
+    started = time.perf_counter()
+    inserted = seed(args.database_url, args.users, args.days, args.sessions_per_day,
+                    args.session_minutes, args.rows, args.seed)
+    elapsed = time.perf_counter() - started
+    print(f"✅ Inserted {inserted:,} events in {elapsed:.1f}s ({inserted / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
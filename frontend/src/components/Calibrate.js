@@ -1,21 +1,49 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './Calibrate.css';
 
+const CALIBRATION_SECONDS = 30;
+
 const Calibrate = ({ currentUser }) => {
   const [isCalibrating, setIsCalibrating] = useState(false);
   const [baseline, setBaseline] = useState(null);
+  const [error, setError] = useState(null);
+  const wsRef = useRef(null);
+
+  useEffect(() => {
+    const websocket = new WebSocket('ws://localhost:8765');
+    wsRef.current = websocket;
+
+    websocket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+
+      if (message.type === 'calibration_complete') {
+        setBaseline({
+          focus: message.baseline.focus_score,
+          load: message.baseline.load_score,
+          anomaly: message.baseline.anomaly_score
+        });
+        setIsCalibrating(false);
+      } else if (message.type === 'calibration_failed' || message.type === 'error') {
+        setError(message.message);
+        setIsCalibrating(false);
+      }
+    };
+
+    return () => {
+      websocket.close();
+    };
+  }, []);
 
   const startCalibration = () => {
+    const websocket = wsRef.current;
+    if (!websocket || websocket.readyState !== WebSocket.OPEN) {
+      setError('WebSocket not connected. Please refresh the page.');
+      return;
+    }
+    setError(null);
     setIsCalibrating(true);
-    // Calibration logic would go here
-    setTimeout(() => {
-      setBaseline({
-        focus: 50,
-        load: 50,
-        anomaly: 10
-      });
-      setIsCalibrating(false);
-    }, 5000);
+    websocket.send(JSON.stringify({ type: 'set_user', user_id: currentUser }));
+    websocket.send(JSON.stringify({ type: 'calibrate', duration: CALIBRATION_SECONDS }));
   };
 
   return (
@@ -27,6 +55,7 @@ const Calibrate = ({ currentUser }) => {
           Sit comfortably and relax for 30 seconds. We'll measure your baseline
           brain activity to personalize your recommendations.
         </p>
+        {error && <p className="error">{error}</p>}
         
         {!baseline ? (
           <div className="calibration-section">
@@ -76,6 +105,3 @@ const Calibrate = ({ currentUser }) => {
 };
 
 export default Calibrate;
-
-
-
@@ -14,65 +14,153 @@ const Dashboard = ({ currentUser }) => {
   });
   const [status, setStatus] = useState('Disconnected');
   const [error, setError] = useState(null);
+  const [recommendation, setRecommendation] = useState(null);
 
   useEffect(() => {
-    // Connect to WebSocket
-    const websocket = new WebSocket('ws://localhost:8765');
-    
-    websocket.onopen = () => {
-      console.log('WebSocket connected');
-      setWs(websocket);
-      setStatus('Connected');
-      setError(null);
+    // Last eeg_data frame seen, so a reconnect can resume instead of losing frames
+    const stream = { sessionId: null, seq: 0, resuming: false };
+    let websocket = null;
+    let retryDelay = 1000;
+    let retryTimer = null;
+    let closed = false;
+
+    const resume = () => {
+      // Frames sent until the replay arrives are part of it, so they're skipped meanwhile
+      stream.resuming = true;
+      websocket.send(JSON.stringify({ type: 'resume', session_id: stream.sessionId, last_seq: stream.seq }));
     };
 
-    websocket.onmessage = (event) => {
-      const message = JSON.parse(event.data);
-      console.log('Received message:', message);
-      
-      if (message.type === 'eeg_data') {
-        const newData = {
-          time: new Date(message.timestamp).toLocaleTimeString(),
-          focus: message.data.focus_score,
-          load: message.data.load_score,
-          anomaly: message.data.anomaly_score
-        };
-        
-        setScores({
-          focus: message.data.focus_score,
-          load: message.data.load_score,
-          anomaly: message.data.anomaly_score
-        });
-        
-        setEegData(prev => [...prev.slice(-59), newData]); // Keep last 60 points
-      } else if (message.type === 'recording_started') {
-        setStatus('Recording...');
-        setError(null);
-        setIsRecording(true);
-      } else if (message.type === 'recording_stopped') {
-        setStatus('Connected (Stopped)');
-        setIsRecording(false);
-      } else if (message.type === 'error') {
-        setError(message.message);
-        setStatus('Error');
-        setIsRecording(false);
-        console.error('Backend error:', message.message);
+    const showFrame = (message) => {
+      if (message.session_id === stream.sessionId && message.seq <= stream.seq) {
+        return; // Already shown (a live frame that was also in a replay)
       }
-    };
+      stream.sessionId = message.session_id;
+      stream.seq = message.seq;
 
-    websocket.onerror = (error) => {
-      console.error('WebSocket error:', error);
-      setError('Failed to connect to WebSocket server');
-      setStatus('Connection Error');
+      const newData = {
+        time: new Date(message.timestamp).toLocaleTimeString(),
+        focus: message.data.focus_score,
+        load: message.data.load_score,
+        anomaly: message.data.anomaly_score
+      };
+      
+      setScores({
+        focus: message.data.focus_score,
+        load: message.data.load_score,
+        anomaly: message.data.anomaly_score
+      });
+      
+      setEegData(prev => [...prev.slice(-59), newData]); // Keep last 60 points
     };
 
-    websocket.onclose = () => {
-      console.log('WebSocket disconnected');
-      setWs(null);
-      setStatus('Disconnected');
+    const connect = () => {
+      websocket = new WebSocket('ws://localhost:8765');
+      
+      websocket.onopen = () => {
+        console.log('WebSocket connected');
+        setWs(websocket);
+        setStatus('Connected');
+        setError(null);
+        retryDelay = 1000;
+        if (stream.seq) {
+          // Reconnected: catch up on what was missed rather than reloading history
+          websocket.send(JSON.stringify({ type: 'subscribe', topics: ['anomaly'], history_seconds: 0 }));
+          resume();
+        } else {
+          websocket.send(JSON.stringify({ type: 'subscribe', topics: ['anomaly'] }));
+        }
+      };
+
+      websocket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        console.log('Received message:', message);
+        
+        if (message.type === 'eeg_data') {
+          // Echo receive time so the server can measure glass-to-glass latency;
+          // only sampled frames carry a trace_id
+          if (message.trace_id) {
+            websocket.send(JSON.stringify({ type: 'ack', trace_id: message.trace_id, received_at: Date.now() }));
+          }
+          if (stream.resuming) {
+            return;
+          }
+          if (message.session_id === stream.sessionId && message.seq > stream.seq + 1) {
+            // Frames were dropped on the way; fetch them (the replay includes this one)
+            resume();
+            return;
+          }
+          showFrame(message);
+        } else if (message.type === 'replay') {
+          stream.resuming = false;
+          if (message.reset) {
+            setEegData([]);
+            stream.seq = 0;
+          }
+          message.frames.forEach(showFrame);
+        } else if (message.type === 'history') {
+          // Recent frames of the session, sent on subscribe; replaces whatever the chart had
+          const start = Math.max(message.timestamps.length - 60, 0);
+          setEegData(message.timestamps.slice(start).map((timestamp, i) => ({
+            time: new Date(timestamp).toLocaleTimeString(),
+            focus: message.focus_score[start + i],
+            load: message.load_score[start + i],
+            anomaly: message.anomaly_score[start + i]
+          })));
+          if (message.last_seq) {
+            stream.sessionId = message.session_id;
+            stream.seq = message.last_seq;
+          }
+        } else if (message.type === 'recommendation') {
+          setRecommendation(message);
+        } else if (message.type === 'recommendation_outcome') {
+          setRecommendation(prev => (prev && prev.recommendation_id === message.recommendation_id ? null : prev));
+        } else if (message.type === 'anomaly') {
+          console.warn(`EEG anomaly in ${message.bands.join(', ') || 'band powers'} (score ${message.score})`);
+        } else if (message.type === 'recording_started') {
+          setStatus('Recording...');
+          setError(null);
+          setIsRecording(true);
+        } else if (message.type === 'board_state') {
+          if (message.state === 'reconnecting') {
+            setStatus(`Headset disconnected, reconnecting (attempt ${message.attempt + 1})...`);
+          } else if (message.state === 'streaming') {
+            setStatus('Recording...');
+          }
+        } else if (message.type === 'recording_stopped') {
+          setStatus('Connected (Stopped)');
+          setIsRecording(false);
+        } else if (message.type === 'error') {
+          stream.resuming = false;
+          setError(message.message);
+          setStatus('Error');
+          setIsRecording(false);
+          console.error('Backend error:', message.message);
+        }
+      };
+
+      websocket.onerror = (error) => {
+        console.error('WebSocket error:', error);
+        setError('Failed to connect to WebSocket server');
+        setStatus('Connection Error');
+      };
+
+      websocket.onclose = () => {
+        console.log('WebSocket disconnected');
+        setWs(null);
+        if (closed) {
+          return;
+        }
+        setStatus('Disconnected, reconnecting...');
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 10000);
+      };
     };
 
+    connect();
+
     return () => {
+      closed = true;
+      clearTimeout(retryTimer);
       websocket.close();
     };
   }, []);
@@ -97,6 +185,19 @@ const Dashboard = ({ currentUser }) => {
     }
   };
 
+  const requestRecommendation = () => {
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: 'get_recommendation' }));
+    }
+  };
+
+  const dismissRecommendation = () => {
+    if (ws && recommendation) {
+      ws.send(JSON.stringify({ type: 'dismiss_recommendation', recommendation_id: recommendation.recommendation_id }));
+    }
+    setRecommendation(null);
+  };
+
   const changeMode = (mode) => {
     setCurrentMode(mode);
     if (ws) {
@@ -159,6 +260,20 @@ const Dashboard = ({ currentUser }) => {
         </div>
       </div>
 
+      <div className="card">
+        <h3 className="card-title">Recommendation</h3>
+        {recommendation ? (
+          <div>
+            <p>{recommendation.message}</p>
+            <button className="button" onClick={dismissRecommendation}>Not now</button>
+          </div>
+        ) : (
+          <button className="button" onClick={requestRecommendation} disabled={!isRecording}>
+            Suggest a break
+          </button>
+        )}
+      </div>
+
       <div className="card">
         <h3 className="card-title">Real-time EEG Data</h3>
         <ResponsiveContainer width="100%" height={400}>
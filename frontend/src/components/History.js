@@ -1,16 +1,31 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import './History.css';
 
+const RANGES = {
+  '24h': 24 * 60 * 60 * 1000,
+  '7d': 7 * 24 * 60 * 60 * 1000,
+  '30d': 30 * 24 * 60 * 60 * 1000
+};
+// Server-side downsampling keeps the chart at this many points whatever the range
+const CHART_POINTS = 300;
+
 const History = ({ currentUser }) => {
   const [events, setEvents] = useState([]);
   const [loading, setLoading] = useState(true);
   const [filter, setFilter] = useState('all');
+  const [range, setRange] = useState('7d');
+  const [series, setSeries] = useState([]);
 
   useEffect(() => {
     fetchEvents();
   }, [currentUser, filter]);
 
+  useEffect(() => {
+    fetchSeries();
+  }, [currentUser, filter, range]);
+
   const fetchEvents = async () => {
     try {
       setLoading(true);
@@ -27,6 +42,33 @@ const History = ({ currentUser }) => {
     }
   };
 
+  const fetchSeries = async () => {
+    try {
+      const end = new Date();
+      const params = {
+        user_id: currentUser,
+        start: new Date(end.getTime() - RANGES[range]).toISOString(),
+        end: end.toISOString(),
+        points: CHART_POINTS,
+        method: 'minmax'
+      };
+      if (filter !== 'all') {
+        params.mode = filter;
+      }
+      const response = await axios.get('http://localhost:8000/events/series', { params });
+      const { timestamps, series: scores } = response.data;
+      setSeries(timestamps.map((timestamp, i) => ({
+        // Bucket timestamps are naive UTC
+        time: new Date(`${timestamp}Z`).toLocaleString(),
+        focus: scores.focus_score.mean[i],
+        load: scores.load_score.mean[i],
+        anomaly: scores.anomaly_score.mean[i]
+      })));
+    } catch (error) {
+      console.error('Error fetching event series:', error);
+    }
+  };
+
   const formatDate = (dateString) => {
     return new Date(dateString).toLocaleString();
   };
@@ -58,6 +100,33 @@ const History = ({ currentUser }) => {
         </select>
       </div>
 
+      <div className="card">
+        <div className="history-chart-header">
+          <h3 className="card-title">Trends</h3>
+          <select
+            className="select filter-select"
+            value={range}
+            onChange={(e) => setRange(e.target.value)}
+          >
+            <option value="24h">Last 24 hours</option>
+            <option value="7d">Last 7 days</option>
+            <option value="30d">Last 30 days</option>
+          </select>
+        </div>
+        <ResponsiveContainer width="100%" height={300}>
+          <LineChart data={series}>
+            <CartesianGrid strokeDasharray="3 3" />
+            <XAxis dataKey="time" />
+            <YAxis domain={[0, 100]} />
+            <Tooltip />
+            <Legend />
+            <Line type="monotone" dataKey="focus" stroke="#667eea" name="Focus" dot={false} />
+            <Line type="monotone" dataKey="load" stroke="#f093fb" name="Load" dot={false} />
+            <Line type="monotone" dataKey="anomaly" stroke="#4facfe" name="Anomaly" dot={false} />
+          </LineChart>
+        </ResponsiveContainer>
+      </div>
+
       {loading ? (
         <div className="loading">Loading...</div>
       ) : events.length === 0 ? (
@@ -0,0 +1,31 @@
+"""
+Shared test setup
+
+The backend modules create their database engine at import time, so point
+DATABASE_URL at a scratch SQLite file before anything imports them.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_SCRATCH = tempfile.mkdtemp(prefix="neurocalm-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_SCRATCH, 'test.db')}"
+os.environ.setdefault("TRACE_EXPORT_PATH", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    """The scratch database, emptied after the test"""
+    from backend.contexts import ContextStore
+    from backend.database import Base, engine, init_db
+    init_db()
+    yield engine
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    # Its cache maps context hashes to the ids just deleted
+    ContextStore._instance = None
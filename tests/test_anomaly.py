@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from backend.anomaly import (
+    MIN_SAMPLES, HalfSpaceTrees, RollingRobustZ, StreamingAnomalyDetector, robust_z_batch, robust_z_to_score,
+)
+
+
+def stream_z(values: np.ndarray, window: int, history: np.ndarray = None) -> np.ndarray:
+    robust = RollingRobustZ(values.shape[1], window)
+    for row in [] if history is None else history:
+        robust.update(row)
+    z = np.full(values.shape, np.nan)
+    for i, row in enumerate(values):
+        scored = robust.score(row)
+        if scored is not None:
+            z[i] = scored
+        robust.update(row)
+    return z
+
+
+@pytest.mark.parametrize("window", [MIN_SAMPLES, 16, 50])
+def test_robust_z_batch_matches_rolling(window):
+    values = np.random.default_rng(window).normal(size=(300, 4))
+    np.testing.assert_allclose(robust_z_batch(values, window=window), stream_z(values, window), equal_nan=True)
+
+
+@pytest.mark.parametrize("history_rows", [3, 20, 80])
+def test_robust_z_batch_continues_from_history(history_rows):
+    rng = np.random.default_rng(history_rows)
+    history, values = rng.normal(size=(history_rows, 4)), rng.normal(size=(120, 4))
+    np.testing.assert_allclose(robust_z_batch(values, history, window=40),
+                               stream_z(values, 40, history), equal_nan=True)
+
+
+def test_warming_up_rows_score_zero():
+    z = robust_z_batch(np.ones((5, 2)), window=20)
+    assert np.isnan(z).all()
+    assert (robust_z_to_score(z) == 0).all()
+
+
+def test_detector_emits_one_event_per_anomaly():
+    rng = np.random.default_rng(0)
+    detector = StreamingAnomalyDetector(["alpha", "beta"], window=60)
+    events = []
+    for i in range(200):
+        spike = 1000.0 if 150 <= i < 153 else 1.0
+        result = detector.update({"alpha": spike * 10 ** rng.uniform(-0.05, 0.05),
+                                  "beta": 10 ** rng.uniform(-0.05, 0.05)})
+        if i < MIN_SAMPLES:
+            assert result["score"] == 0.0
+        if result["event"]:
+            events.append((i, result["event"]))
+    assert [i for i, _ in events] == [150]
+    assert events[0][1]["bands"] == ["alpha"] and events[0][1]["methods"] == ["robust_z"]
+
+
+def test_half_space_trees_scores_outliers_higher():
+    rng = np.random.default_rng(0)
+    hst = HalfSpaceTrees(2, num_trees=25, depth=6, window=100, seed=1)
+    for _ in range(300):
+        hst.score_and_update(rng.normal(0, 1, 2))
+    typical = np.mean([hst.score_and_update(rng.normal(0, 1, 2)) for _ in range(50)])
+    outlier = hst.score_and_update(np.array([8.0, -8.0]))
+    assert outlier > 0.5 > typical
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from backend import auto_detect_ganglion as detect
+
+
+class FakeBoard:
+    """BoardShim stand-in: prepare_session succeeds only on the given ports"""
+
+    working = set()
+    delays = {}
+    prepared = []
+    released = []
+    lock = threading.Lock()
+
+    def __init__(self, board_id, params):
+        self.port = params.serial_port
+
+    def prepare_session(self):
+        time.sleep(self.delays.get(self.port, 0))
+        if self.port not in self.working:
+            raise RuntimeError("BOARD_NOT_READY_ERROR: discovery timeout")
+        with self.lock:
+            self.prepared.append(self.port)
+
+    def release_session(self):
+        with self.lock:
+            self.released.append(self.port)
+
+
+@pytest.fixture
+def fake_board(monkeypatch, tmp_path):
+    FakeBoard.working, FakeBoard.delays = set(), {}
+    FakeBoard.prepared, FakeBoard.released = [], []
+    monkeypatch.setattr(detect, "BoardShim", FakeBoard)
+    monkeypatch.setattr(detect, "CACHE_PATH", str(tmp_path / "ganglion.json"))
+    return FakeBoard
+
+
+def test_first_working_port_wins_and_is_cached(fake_board):
+    fake_board.working = {"/dev/b"}
+    events = []
+    result = detect.detect_ganglion(["/dev/a", "/dev/b", "/dev/c"], timeout=1, progress=events.append)
+    assert result["dongle_port"] == "/dev/b" and result["method"] == "auto-detect"
+    assert result["board"] is None and fake_board.released == ["/dev/b"]
+    assert detect.load_cached_connection()["dongle_port"] == "/dev/b"
+    assert {event["stage"] for event in events} >= {"scan", "probe", "timeout", "connected"}
+
+
+def test_kept_session_survives_and_late_winner_releases(fake_board):
+    fake_board.working = {"/dev/a", "/dev/b"}
+    fake_board.delays = {"/dev/b": 0.2}
+    result = detect.detect_ganglion(["/dev/a", "/dev/b"], timeout=1, keep_session=True, use_cache=False)
+    assert result["dongle_port"] == "/dev/a" and isinstance(result["board"], FakeBoard)
+    time.sleep(0.4)
+    assert fake_board.released == ["/dev/b"]
+
+
+def test_cached_port_is_tried_alone_first(fake_board):
+    detect.save_cached_connection("/dev/c", "aa:bb")
+    fake_board.working = {"/dev/c", "/dev/a"}
+    result = detect.detect_ganglion(["/dev/a", "/dev/c"], timeout=1)
+    assert result["method"] == "cache" and result["mac_address"] == "aa:bb"
+    assert fake_board.prepared == ["/dev/c"]
+
+
+def test_no_ports_returns_none(fake_board):
+    assert detect.detect_ganglion([], timeout=1, use_cache=False) is None
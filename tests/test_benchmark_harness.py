@@ -0,0 +1,33 @@
+import argparse
+import json
+
+from benchmarks.harness import find_regressions, finish, result
+
+
+def test_regressions_respect_direction_and_threshold(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"results": {
+        "latency": result(10.0, "ms", False),
+        "throughput": result(100.0, "rows/s", True),
+        "zero": result(0.0, "ms", False),
+    }}))
+    current = {
+        "latency": result(12.5, "ms", False),      # 25% slower
+        "throughput": result(85.0, "rows/s", True),  # 15% fewer
+        "zero": result(5.0, "ms", False),           # no usable baseline
+        "new": result(1.0, "ms", False),            # not in the baseline
+    }
+    regressions = find_regressions(current, str(baseline), 0.2)
+    assert len(regressions) == 1 and regressions[0].startswith("latency:")
+    assert len(find_regressions(current, str(baseline), 0.1)) == 2
+
+
+def test_finish_writes_results_and_returns_exit_code(tmp_path):
+    output = tmp_path / "current.json"
+    args = argparse.Namespace(output=str(output), baseline=None, threshold=0.2)
+    assert finish(args, "suite", {"latency": result(1.0, "ms", False)}) == 0
+    written = json.loads(output.read_text())
+    assert written["suite"] == "suite" and written["results"]["latency"]["value"] == 1.0
+
+    args = argparse.Namespace(output=str(tmp_path / "next.json"), baseline=str(output), threshold=0.2)
+    assert finish(args, "suite", {"latency": result(2.0, "ms", False)}) == 1
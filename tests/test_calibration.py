@@ -0,0 +1,81 @@
+import asyncio
+
+import numpy as np
+
+from backend.calibration import FEATURES, BaselineNormalizer, BaselineProfile, load_profile
+
+
+def tick(rng, focus=50.0, load=40.0):
+    bands = 10 ** rng.normal(0, 0.1, 4)
+    return {"alpha": bands[0], "beta": bands[1], "theta": bands[2], "gamma": bands[3],
+            "focus_score": focus + rng.normal(0, 5), "load_score": load + rng.normal(0, 5), "anomaly_score": 10.0}
+
+
+def test_welford_matches_numpy():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(size=(50, len(FEATURES)))
+    profile = BaselineProfile("u", 1)
+    for values in samples:
+        profile.add_calibration_sample(values)
+    assert profile.finish_calibration()
+    np.testing.assert_allclose(profile.ewma_mean, samples.mean(axis=0))
+    np.testing.assert_allclose(profile.ewma_var, samples.var(axis=0, ddof=1))
+
+
+def test_calibration_needs_enough_samples():
+    profile = BaselineProfile("u", 1)
+    profile.add_calibration_sample(np.zeros(len(FEATURES)))
+    assert not profile.finish_calibration() and not profile.is_calibrated
+
+
+def test_calibrate_normalize_and_persist(db):
+    async def run():
+        rng = np.random.default_rng(1)
+        normalizer = BaselineNormalizer()
+        await normalizer.start_calibration("alice", 1, 30)
+        for _ in range(40):
+            assert "z" not in await normalizer.process("alice", 1, tick(rng))
+        profile = await normalizer.finish_calibration("alice", 1)
+        assert profile is not None and profile.count == 40
+
+        typical = tick(rng)
+        typical["focus_score"] = float(profile.ewma_mean[FEATURES.index("focus_score")])
+        typical = await normalizer.process("alice", 1, typical)
+        assert abs(typical["focus_score"] - 50.0) < 1e-6 and typical["raw_focus_score"] != 50.0
+        high = await normalizer.process("alice", 1, tick(rng, focus=90.0))
+        assert high["focus_score"] > 99 and high["z"]["focus_score"] > 3
+        assert profile.updates_since_persist == 2
+        await normalizer.flush()
+        assert profile.updates_since_persist == 0
+        return profile
+
+    profile = asyncio.run(run())
+    saved = load_profile("alice", 1)
+    assert saved.is_calibrated
+    np.testing.assert_allclose(saved.ewma_mean, profile.ewma_mean)
+    assert load_profile("bob", 1) is None
+
+
+def test_overrun_capture_is_finished_by_the_next_tick(db, monkeypatch):
+    from backend import calibration
+    clock = [1000.0]
+    monkeypatch.setattr(calibration.time, "monotonic", lambda: clock[0])
+    rng = np.random.default_rng(3)
+    normalizer = BaselineNormalizer()
+
+    async def go():
+        await normalizer.start_calibration("u", 1, duration=10)
+        for _ in range(10):
+            await normalizer.process("u", 1, tick(rng))
+        # Past the deadline but within the grace period the capture still runs
+        clock[0] += 10 + calibration.CALIBRATION_GRACE_SECONDS - 1
+        assert "z" not in await normalizer.process("u", 1, tick(rng))
+        # The timer never fired; the next tick ends the capture and is normalized
+        clock[0] += 2
+        result = await normalizer.process("u", 1, tick(rng))
+        assert not normalizer.is_calibrating("u", 1) and "z" in result
+        # A late finish from the lost timer doesn't redo it
+        assert await normalizer.finish_calibration("u", 1) is None
+
+    asyncio.run(go())
+    assert load_profile("u", 1).count == 11
@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+
+from backend.commands import (
+    CommandDispatcher, CommandFailed, CommandRejected, CANCELLED, DONE, FAILED, QUEUED, RUNNING
+)
+
+
+class Recorder:
+    """on_update callback keeping every state each command passed through"""
+
+    def __init__(self):
+        self.states = {}
+
+    async def __call__(self, command):
+        self.states.setdefault(command.id, []).append(command.state)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_commands_on_a_resource_run_in_order():
+    updates = Recorder()
+    order = []
+
+    async def go():
+        dispatcher = CommandDispatcher(updates)
+        release = asyncio.Event()
+
+        async def first():
+            order.append("first")
+            await release.wait()
+
+        async def second():
+            order.append("second")
+
+        a = dispatcher.submit("client", "start_recording", first, "board")
+        b = dispatcher.submit("client", "stop_recording", second, "board")
+        await _settle()
+        assert (a.state, b.state) == (RUNNING, QUEUED)
+        release.set()
+        await asyncio.gather(a.task, b.task)
+        await _settle()
+        return a, b
+
+    a, b = asyncio.run(go())
+    assert order == ["first", "second"]
+    assert updates.states[a.id] == [QUEUED, RUNNING, DONE]
+    assert updates.states[b.id] == [QUEUED, RUNNING, DONE]
+
+
+def test_failures_are_reported():
+    updates = Recorder()
+
+    async def go():
+        dispatcher = CommandDispatcher(updates)
+
+        async def reported():
+            raise CommandFailed("No board found")
+
+        async def crashed():
+            raise RuntimeError("boom")
+
+        commands = [dispatcher.submit("client", "start_recording", run, "board") for run in (reported, crashed)]
+        await asyncio.gather(*(command.task for command in commands))
+        await _settle()
+        return commands
+
+    reported, crashed = asyncio.run(go())
+    assert (reported.state, reported.error) == (FAILED, "No board found")
+    assert (crashed.state, crashed.error) == (FAILED, "boom")
+    assert updates.states[crashed.id][-1] == FAILED
+
+
+def test_cancel_running_and_queued_commands():
+    updates = Recorder()
+
+    async def go():
+        dispatcher = CommandDispatcher(updates)
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(60)
+
+        running = dispatcher.submit("a", "start_recording", slow, "board")
+        queued = dispatcher.submit("a", "start_recording", slow, "board")
+        other = dispatcher.submit("b", "start_recording", slow, "other")
+        await started.wait()
+        assert dispatcher.cancel("missing") == []
+        assert dispatcher.cancel(running.id) == [running]
+        # Already cancelling: not cancelled twice
+        assert dispatcher.cancel(running.id) == []
+        assert dispatcher.cancel(client="a") == [queued]
+        await asyncio.gather(running.task, queued.task, return_exceptions=True)
+        await _settle()
+        assert other.active
+        assert dispatcher.cancel(name="start_recording") == [other]
+        await asyncio.gather(other.task, return_exceptions=True)
+        await _settle()
+        return running, queued, other
+
+    running, queued, other = asyncio.run(go())
+    assert [command.state for command in (running, queued, other)] == [CANCELLED] * 3
+    assert updates.states[running.id][-1] == CANCELLED
+    # The queued one never ran
+    assert RUNNING not in updates.states[queued.id]
+
+
+def test_rejects_duplicates_and_too_many_per_client():
+    async def go():
+        dispatcher = CommandDispatcher(Recorder(), max_per_client=2)
+        forever = asyncio.Event()
+        dispatcher.submit("a", "start_recording", forever.wait, "board", command_id="x")
+        with pytest.raises(CommandRejected, match="already in progress"):
+            dispatcher.submit("b", "start_recording", forever.wait, "board", command_id="x")
+        dispatcher.submit("a", "start_recording", forever.wait, "board")
+        with pytest.raises(CommandRejected, match="Too many"):
+            dispatcher.submit("a", "start_recording", forever.wait, "board")
+        # The cap is per client
+        dispatcher.submit("b", "start_recording", forever.wait, "board")
+        dispatcher.cancel(command_id="x")
+        await _settle()
+        # A finished id can be reused
+        dispatcher.submit("a", "start_recording", forever.wait, "board", command_id="x")
+        assert len(dispatcher.status("a")) == 2 and len(dispatcher.status()) == 3
+        dispatcher.cancel(client=None)
+        await _settle()
+
+    asyncio.run(go())
+
+
+def test_keeps_only_recent_finished_commands():
+    async def go():
+        dispatcher = CommandDispatcher(Recorder(), keep=2)
+
+        async def quick():
+            pass
+
+        for _ in range(5):
+            await dispatcher.submit("a", "stop_recording", quick, "board").task
+        await _settle()
+        dispatcher.submit("a", "stop_recording", quick, "board")
+        await _settle()
+        return [status["command_id"] for status in dispatcher.status()]
+
+    assert asyncio.run(go()) == ["cmd-4", "cmd-5", "cmd-6"]
+
+
+def test_cancel_by_id_is_scoped_to_the_client():
+    async def go():
+        dispatcher = CommandDispatcher(Recorder())
+        command = dispatcher.submit("alice", "profile", asyncio.Event().wait, "profiler", "p1")
+        assert dispatcher.cancel("p1", client="bob") == []
+        assert dispatcher.status(client="bob") == [] and len(dispatcher.status(client="alice")) == 1
+        assert dispatcher.cancel("p1", client="alice") == [command]
+        await _settle()
+        return command
+
+    assert asyncio.run(go()).state == CANCELLED
+
+
+def test_clients_cannot_see_or_cancel_each_others_commands(db, monkeypatch):
+    import json
+    from backend import profiler
+    from backend.websocket_server import WebSocketServer
+
+    class Socket:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, message):
+            self.sent.append(json.loads(message))
+
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "secret")
+    server = WebSocketServer()
+    alice, bob = Socket(), Socket()
+
+    async def go():
+        command = server.commands.submit(alice, "profile", asyncio.Event().wait, "profiler", "p1")
+        await _settle()
+        await server.handle_message(bob, json.dumps({"type": "cancel", "command_id": "p1"}))
+        assert bob.sent[-1]["type"] == "error" and command.state == RUNNING
+        await server.handle_message(bob, json.dumps({"type": "get_commands"}))
+        assert bob.sent[-1] == {"type": "commands", "commands": []}
+        await server.handle_message(alice, json.dumps({"type": "get_commands"}))
+        assert [c["command_id"] for c in alice.sent[-1]["commands"]] == ["p1"]
+        # The admin token reaches every client's commands
+        await server.handle_message(bob, json.dumps({"type": "get_commands", "token": "secret"}))
+        assert [c["command_id"] for c in bob.sent[-1]["commands"]] == ["p1"]
+        await server.handle_message(bob, json.dumps({"type": "cancel", "command_id": "p1", "token": "secret"}))
+        await _settle()
+        return command
+
+    assert asyncio.run(go()).state == CANCELLED
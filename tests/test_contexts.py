@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from backend.event_writer import EventWriter, ROW_COLUMNS
+from backend.contexts import ContextStore, context_hash, _LRU
+
+
+class NoQueries:
+    """A session that fails the test if the cache misses"""
+
+    def execute(self, *args, **kwargs):
+        raise AssertionError("unexpected query")
+
+
+def test_hash_ignores_key_order():
+    assert context_hash({"tab": "a", "url": "b"}) == context_hash({"url": "b", "tab": "a"})
+    assert context_hash({"tab": "a"}) != context_hash({"tab": "b"})
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = _LRU(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert list(cache.items) == ["a", "c"]
+
+
+def test_intern_stores_each_context_once(db):
+    from backend.database import Context, SessionLocal
+    store = ContextStore()
+    first = store.intern({"tab": "docs", "url": "x"})
+    assert store.intern({"url": "x", "tab": "docs"}) == first
+    assert store.intern(None) == store.intern({}) != first
+    # Another process (a fresh store) finds the existing row instead of duplicating it
+    assert ContextStore().intern({"tab": "docs", "url": "x"}) == first
+    with SessionLocal() as session:
+        assert session.query(Context).count() == 2
+
+
+def test_lookup_queries_only_cache_misses(db):
+    from backend.database import SessionLocal
+    writer = ContextStore()
+    ids = [writer.intern({"n": n}) for n in range(3)]
+    assert writer.lookup(NoQueries(), ids + [None]) == {ids[n]: {"n": n} for n in range(3)}
+
+    reader = ContextStore(cache_size=2)
+    with SessionLocal() as session:
+        assert reader.lookup(session, ids) == {ids[n]: {"n": n} for n in range(3)}
+    assert reader.lookup(NoQueries(), ids[1:]) == {ids[1]: {"n": 1}, ids[2]: {"n": 2}}
+    assert reader.resolve(NoQueries(), None, {"legacy": True}) == {"legacy": True}
+    assert reader.resolve(NoQueries(), None, None) == {}
+
+
+def test_server_interns_on_set_context_not_per_tick(db, monkeypatch):
+    from backend.features import FeatureFrame
+    from backend.websocket_server import WebSocketServer
+
+    server = WebSocketServer()
+    server.events = EventWriter(batch_size=100, flush_seconds=1e9)
+    calls = []
+    intern = server.contexts.intern
+    monkeypatch.setattr(server.contexts, "intern", lambda context: calls.append(context) or intern(context))
+
+    def frame():
+        values = FeatureFrame()
+        values.update({"alpha": 1.0, "beta": 1.0, "theta": 1.0, "gamma": 1.0,
+                       "focus_score": 50.0, "load_score": 40.0, "anomaly_score": 0.0})
+        return values
+
+    async def go():
+        # The default context is interned by the first tick, once
+        await server.on_eeg_data(frame())
+        await server.on_eeg_data(frame())
+        default_id = server.current_context_id
+        await server.handle_message(None, json.dumps({"type": "set_context", "context": {"tab": "docs"}}))
+        for _ in range(3):
+            await server.on_eeg_data(frame())
+        return default_id
+
+    default_id = asyncio.run(go())
+    assert calls == [{}, {"tab": "docs"}]
+    assert server.current_context_id == intern({"tab": "docs"}) != default_id
+    assert [row[ROW_COLUMNS.index("context_id")] for row in server.events._pending] == [default_id] * 2 + [
+        server.current_context_id] * 3
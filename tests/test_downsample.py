@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from backend.downsample import lttb, lttb_series, minmax_series
+
+START = datetime(2024, 1, 1)
+
+
+def reference_lttb(x, y, threshold):
+    """Straightforward per-bucket LTTB, bucketed the same way"""
+    n = len(x)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected, previous = [0], 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 1 < threshold - 2:
+            following = slice(edges[i + 1], edges[i + 2])
+            next_x, next_y = x[following].mean(), y[following].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        best, best_area = start, -1.0
+        for j in range(start, stop):
+            area = abs((x[previous] - next_x) * (y[j] - y[previous]) - (x[previous] - x[j]) * (next_y - y[previous]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        previous = best
+    return np.array(selected + [n - 1])
+
+
+@pytest.mark.parametrize("n,threshold", [(1000, 50), (101, 100), (10, 3), (5000, 7)])
+def test_lttb_keeps_endpoints_and_point_count(n, threshold):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.uniform(0.5, 1.5, n))
+    y = np.cumsum(rng.normal(size=n))
+    selected = lttb(x, y, threshold)
+    assert len(selected) == threshold
+    assert selected[0] == 0 and selected[-1] == n - 1
+    assert (np.diff(selected) > 0).all()
+    np.testing.assert_array_equal(selected, reference_lttb(x, y, threshold))
+
+
+def test_lttb_keeps_spikes():
+    y = np.zeros(1000)
+    y[437] = 100.0
+    assert 437 in lttb(np.arange(1000.0), y, 20)
+
+
+def test_lttb_short_series_returned_whole():
+    np.testing.assert_array_equal(lttb(np.arange(5.0), np.arange(5.0), 10), np.arange(5))
+    np.testing.assert_array_equal(lttb(np.arange(5.0), np.arange(5.0), 2), np.arange(5))
+
+
+@pytest.fixture
+def events(db):
+    from backend.database import Event, SessionLocal
+    with SessionLocal() as session:
+        session.add_all([
+            Event(timestamp=START + timedelta(seconds=i), mode="study", user_id="alice",
+                  focus_score=float(i % 100), load_score=50.0, anomaly_score=None if i == 5 else 1.0)
+            for i in range(3600)
+        ])
+        session.commit()
+        yield session
+
+
+def test_minmax_series_buckets(events):
+    result = minmax_series(events, "alice", None, START, START + timedelta(hours=1), 60)
+    assert result["bucket_seconds"] == 60 and len(result["timestamps"]) == 60
+    assert result["timestamps"][1] == "2024-01-01T00:01:00.000"
+    assert result["counts"] == [60] * 60 and result["total_events"] == 3600
+    focus = result["series"]["focus_score"]
+    assert focus["min"][0] == 0 and focus["max"][0] == 59 and focus["mean"][0] == pytest.approx(29.5)
+    assert minmax_series(events, "bob", None, START, START + timedelta(hours=1), 60)["total_events"] == 0
+
+
+def test_lttb_series_skips_missing_values(events):
+    result = lttb_series(events, "alice", "study", START, START + timedelta(hours=1), 100)
+    assert result["total_events"] == 3600
+    focus, anomaly = result["series"]["focus_score"], result["series"]["anomaly_score"]
+    assert len(focus["values"]) == 100 and focus["timestamps"][0] == "2024-01-01T00:00:00.000"
+    assert focus["timestamps"][-1] == "2024-01-01T00:59:59.000"
+    assert len(anomaly["values"]) == 100 and not np.isnan(anomaly["values"]).any()
+
+
+def test_lttb_series_aggregates_long_ranges_in_sql(events, monkeypatch):
+    from backend import downsample
+    monkeypatch.setattr(downsample, "LTTB_MAX_RAW_ROWS", 1000)
+    result = lttb_series(events, "alice", None, START, START + timedelta(hours=1), 100)
+    assert result["total_events"] == 3600
+    focus = result["series"]["focus_score"]
+    # 400 sub-buckets of 9 seconds, each giving LTTB its min and max
+    assert len(focus["values"]) == 100 and focus["timestamps"][0] == "2024-01-01T00:00:02.250"
+    assert max(focus["values"]) == 99 and min(focus["values"]) == 0
+    empty = lttb_series(events, "bob", None, START, START + timedelta(hours=1), 100)
+    assert empty["total_events"] == 0 and empty["series"]["focus_score"] == {"timestamps": [], "values": []}
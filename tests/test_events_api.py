@@ -0,0 +1,53 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import serialization
+from backend.api import app
+from backend.models import EventResponse
+
+
+@pytest.fixture
+def client(db):
+    # Not entered as a context manager, so startup (Firebase) doesn't run
+    return TestClient(app)
+
+
+def _post(client, **fields):
+    event = {"mode": "study", "focus_score": 60.0, "load_score": 40.0, "anomaly_score": 0.1,
+             "context": {"app": "notes"}, "user_id": "u1", **fields}
+    response = client.post("/events", json=event, params={"sync_firebase": False})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_list_matches_the_event_response_schema(client):
+    from backend.database import Event, SessionLocal
+    created = [_post(client), _post(client, mode="meeting", context={"app": "zoom", "n": 2}), _post(client, user_id="u2")]
+    # A row from before contexts were interned keeps its inline context
+    with SessionLocal() as session:
+        session.add(Event(timestamp=datetime(2020, 1, 1), mode="study", focus_score=1.0, load_score=2.0,
+                          anomaly_score=0.0, context={"legacy": True}, user_id="u1"))
+        session.commit()
+
+    response = client.get("/events", params={"user_id": "u1"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/json"
+    events = response.json()
+    assert [EventResponse(**event).model_dump(mode="json") for event in events] == events
+    assert [event["id"] for event in events[:2]] == [created[1]["id"], created[0]["id"]]
+    assert [event["context"] for event in events] == [{"app": "zoom", "n": 2}, {"app": "notes"}, {"legacy": True}]
+    assert events[0] == created[1]
+
+    assert [event["mode"] for event in client.get("/events", params={"mode": "meeting"}).json()] == ["meeting"]
+    assert len(client.get("/events", params={"limit": 2}).json()) == 2
+
+
+def test_standard_library_fallback_encodes_the_same(monkeypatch):
+    value = [{"id": 1, "timestamp": datetime(2024, 1, 2, 3, 4, 5, 678000), "score": 0.1,
+              "context": {"app": "é", "n": None}}]
+    fast = json.loads(serialization.dumps_bytes(value))
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert json.loads(serialization.dumps_bytes(value)) == fast
+    assert fast[0]["timestamp"] == "2024-01-02T03:04:05.678000"
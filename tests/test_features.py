@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from brainflow.data_filter import DataFilter, WindowOperations
+
+from backend.features import (
+    BANDS, CORE_FEATURES, EXTRACTORS, FeatureExtractor, FeaturePipeline, FeatureUnavailable, SpectralWindow,
+    compute_scores, register,
+)
+
+RATE = 200
+
+
+def window_of(seconds: float = 2, channels: int = 2, seed: int = 0) -> SpectralWindow:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE)) / RATE
+    data = np.stack([10 * np.sin(2 * np.pi * 10 * t) + rng.normal(0, 1, len(t)) for _ in range(channels)])
+    return SpectralWindow(data, RATE)
+
+
+def test_unimplemented_extractor_cannot_register():
+    with pytest.raises(TypeError):
+        @register
+        class Broken(FeatureExtractor):
+            name = "broken"
+            outputs = ("broken",)
+    assert "broken" not in EXTRACTORS
+    with pytest.raises(TypeError):
+        FeatureExtractor()
+
+
+def test_band_powers_match_brainflow():
+    window = window_of()
+    samples = window.samples(0)
+    power, freqs = DataFilter.get_psd_welch(samples.copy(), 256, 128, RATE, WindowOperations.HANNING.value)
+    expected = [DataFilter.get_band_power((power, freqs), low, high) for low, high in BANDS.values()]
+    np.testing.assert_allclose(window.band_powers(list(BANDS.values())), expected, rtol=1e-9)
+
+
+def test_default_pipeline_runs_only_whats_required():
+    pipeline = FeaturePipeline(["band_powers", "scores", "hjorth"], outputs=CORE_FEATURES)
+    assert [ex.name for ex in pipeline.plan] == ["band_powers", "scores"]
+    frame = pipeline.run(window_of())
+    assert frame.alpha > frame.beta and 0 <= frame.focus_score <= 100
+    assert "hjorth_activity" not in frame
+
+    pipeline.require(["hjorth_mobility"])
+    assert [ex.name for ex in pipeline.plan] == ["band_powers", "scores", "hjorth"]
+    assert pipeline.run(window_of())["hjorth_mobility"] > 0
+
+
+def test_dependencies_are_added_and_ordered():
+    pipeline = FeaturePipeline(["ratios"])
+    assert [ex.name for ex in pipeline.extractors] == ["band_powers", "ratios"]
+    frame = pipeline.run(window_of())
+    assert frame["alpha_theta_ratio"] == pytest.approx(frame.alpha / (frame.theta + 1e-6))
+
+
+def test_configuration_errors():
+    with pytest.raises(ValueError):
+        FeaturePipeline(["nope"])
+    with pytest.raises(ValueError, match="No registered extractor produces: nope"):
+        FeaturePipeline(["band_powers"], outputs=["nope"])
+
+
+def test_required_outputs_bring_in_their_providers():
+    # A research config that leaves out the features the service needs
+    pipeline = FeaturePipeline(["spectral_entropy"])
+    assert [ex.name for ex in pipeline.plan] == ["spectral_entropy"]
+    pipeline.require(CORE_FEATURES)
+    assert [ex.name for ex in pipeline.extractors] == ["spectral_entropy", "band_powers", "scores"]
+    assert [ex.name for ex in pipeline.plan] == ["spectral_entropy", "band_powers", "scores"]
+    frame = pipeline.run(window_of())
+    assert 0 <= frame["spectral_entropy"] <= 1 and 0 <= frame.focus_score <= 100
+    assert [ex.name for ex in FeaturePipeline(["band_powers"], outputs=["focus_score"]).plan] == [
+        "band_powers", "scores"]
+
+
+def test_zero_power_drops_the_tick():
+    with pytest.raises(FeatureUnavailable) as error:
+        FeaturePipeline(["band_powers", "scores"]).run(SpectralWindow(np.zeros((1, 400)), RATE))
+    assert error.value.reason == "zero_power"
+
+
+def test_compute_scores_vectorized_matches_scalar():
+    bands = 10 ** np.random.default_rng(0).uniform(-2, 1, (20, 4))
+    batch = compute_scores(*bands.T)
+    for i, row in enumerate(bands):
+        scalar = compute_scores(*row)
+        for name, values in batch.items():
+            assert values[i] == pytest.approx(float(scalar[name]))
@@ -0,0 +1,57 @@
+import numpy as np
+
+from backend.filters import DEFAULT_FILTER_CONFIG, StreamingFilterChain, filter_config
+
+RATE = 200
+
+
+def signal_of(seconds: float, channels: int = 2, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE)) / RATE
+    alpha = 20 * np.sin(2 * np.pi * 10 * t)
+    mains = 30 * np.sin(2 * np.pi * 60 * t)
+    return np.stack([alpha + mains + 500 + rng.normal(0, 2, len(t)) for _ in range(channels)])
+
+
+def test_chunked_filtering_matches_whole_signal():
+    data = signal_of(10)
+    whole, _ = StreamingFilterChain(RATE, DEFAULT_FILTER_CONFIG).process(data)
+    chain = StreamingFilterChain(RATE, DEFAULT_FILTER_CONFIG)
+    bounds = np.cumsum(np.random.default_rng(1).integers(1, 90, 60))
+    chunks = [chain.process(chunk)[0] for chunk in np.split(data, bounds[bounds < data.shape[1]], axis=1)]
+    np.testing.assert_allclose(np.concatenate(chunks, axis=1), whole, atol=1e-9)
+
+
+def test_removes_drift_and_mains_but_keeps_alpha():
+    filtered, _ = StreamingFilterChain(RATE, DEFAULT_FILTER_CONFIG).process(signal_of(10))
+    settled = filtered[:, 4 * RATE:]
+    spectrum = np.abs(np.fft.rfft(settled[0])) / settled.shape[1] * 2
+    freqs = np.fft.rfftfreq(settled.shape[1], 1 / RATE)
+    assert abs(settled.mean()) < 1
+    assert spectrum[np.argmin(np.abs(freqs - 10))] > 15
+    assert spectrum[np.argmin(np.abs(freqs - 60))] < 1
+
+
+def test_artifacts_are_masked_with_margin():
+    chain = StreamingFilterChain(RATE, DEFAULT_FILTER_CONFIG)
+    chain.process(signal_of(5))
+    chunk = signal_of(1, seed=2)
+    chunk[0, 100] += 2000
+    _, mask = chain.process(chunk)
+    margin = int(DEFAULT_FILTER_CONFIG["mask_margin_s"] * RATE)
+    assert mask[0, 100 - margin:100 + margin].all()
+    assert not mask[1].any()
+
+
+def test_empty_chunk_and_reset():
+    chain = StreamingFilterChain(RATE, DEFAULT_FILTER_CONFIG)
+    filtered, mask = chain.process(np.empty((2, 0)))
+    assert filtered.shape == mask.shape == (2, 0) and chain.zi is None
+    chain.process(signal_of(1))
+    chain.reset()
+    assert chain.zi is None
+
+
+def test_board_overrides():
+    assert filter_config(-1)["amplitude_uv"] == 1500.0
+    assert filter_config(12345) == DEFAULT_FILTER_CONFIG
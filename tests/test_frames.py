@@ -0,0 +1,78 @@
+import json
+import math
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from backend.event_writer import EventWriter, ROW_COLUMNS
+from backend.features import FeatureFrame
+from backend.serialization import eeg_data_json
+
+TIMESTAMP = datetime(2024, 1, 2, 3, 4, 5, 250000)
+
+
+def _frame(**values) -> FeatureFrame:
+    frame = FeatureFrame()
+    frame.update({"alpha": 1.5, "beta": np.float64(0.1) * 3, "theta": 2e-07, "gamma": 12.0,
+                  "focus_score": 61.25, "load_score": np.float32(40.5), "anomaly_score": 0.0, **values})
+    return frame
+
+
+FRAMES = {
+    "core": lambda: _frame(),
+    "gap": lambda: _frame(gap_seconds=0.75),
+    "calibrated": lambda: _frame(z={"alpha": -1.25, "beta": 0.5}, raw_focus_score=70.0, focus_percentile=55),
+    "missing": lambda: _frame(anomaly_score=None, extra_ratio=math.inf),
+    "nan": lambda: _frame(theta=float("nan")),
+}
+
+
+@pytest.mark.parametrize("name", FRAMES)
+def test_to_json_matches_json_dumps(name):
+    frame = FRAMES[name]()
+    frame.anomaly_event = {"score": 5.0}
+    expected = json.dumps({key: float(value) if isinstance(value, np.floating) else value
+                           for key, value in frame.to_dict().items()})
+    assert frame.to_json() == expected
+
+
+@pytest.mark.parametrize("name", FRAMES)
+@pytest.mark.parametrize("trace_id, sample_timestamp", [(None, None), ("0af7651916cd43dd", 1700000000.25)])
+def test_eeg_data_json_matches_the_message_dict(name, trace_id, sample_timestamp):
+    frame = FRAMES[name]()
+    message = {"type": "eeg_data", "data": json.loads(frame.to_json()), "mode": "stüdy",
+               "timestamp": TIMESTAMP.isoformat(), "session_id": 3, "seq": 9}
+    if trace_id is not None:
+        message.update(trace_id=trace_id, sample_timestamp=sample_timestamp)
+    text = eeg_data_json(frame, "stüdy", TIMESTAMP.isoformat(), 3, 9, trace_id, sample_timestamp)
+    assert text == json.dumps(message)
+    assert '"session_id": null' in eeg_data_json(frame, "study", "t", None, 1)
+
+
+def test_frame_mapping_access():
+    frame = _frame(z={"alpha": 1.0})
+    assert frame["alpha"] == 1.5 and frame.get("gap_seconds", 0) == 0
+    assert "z" in frame and "gap_seconds" not in frame
+    frame["gap_seconds"] = 0.5
+    assert frame["gap_seconds"] == 0.5
+    with pytest.raises(KeyError):
+        frame["missing"]
+
+
+def test_add_frame_queues_and_writes_the_row(db):
+    from backend.database import Event, SessionLocal
+    writer = EventWriter(batch_size=2, flush_seconds=1e9)
+    assert not writer.add_frame(_frame(gap_seconds=0.5), TIMESTAMP, "study", None, "u1", 1, 7)
+    row = dict(zip(ROW_COLUMNS, writer._pending[0]))
+    assert row == {**row, "timestamp": TIMESTAMP, "mode": "study", "focus_score": 61.25, "alpha": 1.5,
+                   "user_id": "u1", "score_version": 1, "session_id": 7, "gap_seconds": 0.5, "context_id": None}
+    # Dict rows use the same columns, and a full batch is due
+    assert writer.add({"timestamp": TIMESTAMP, "mode": "meeting", "focus_score": 1.0, "load_score": 2.0,
+                       "anomaly_score": 0.0, "user_id": "u2"})
+    assert writer.flush() == 2 and writer.pending == 0
+    with SessionLocal() as session:
+        events = session.query(Event).order_by(Event.mode).all()
+    assert [(event.mode, event.session_id, event.gap_seconds, event.beta) for event in events] == [
+        ("meeting", None, None, None), ("study", 7, 0.5, pytest.approx(0.3)),
+    ]
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.history import FrameHistory, HistoryStore, HISTORY_FIELDS
+
+
+def _frame(focus):
+    return {"focus_score": focus, "load_score": 50.0, "alpha": None}
+
+
+def test_ring_buffer_snapshot_is_oldest_first_after_wrapping():
+    history = FrameHistory(capacity=4)
+    for i, mode in enumerate(["study", "study", "meeting", "meeting", "study", "study"]):
+        history.append(100.0 + i, mode, _frame(float(i)))
+    assert len(history) == 4
+    snapshot = history.snapshot(seconds=60)
+    assert snapshot["timestamps"] == [102000, 103000, 104000, 105000]
+    assert snapshot["focus_score"] == [2.0, 3.0, 4.0, 5.0]
+    assert snapshot["alpha"] == [None] * 4 and snapshot["gamma"] == [None] * 4
+    assert snapshot["mode_runs"] == [[0, "meeting"], [2, "study"]]
+    # Only the last `seconds` before the newest frame
+    assert history.snapshot(seconds=1.5)["focus_score"] == [4.0, 5.0]
+
+
+def test_empty_snapshot_has_every_column():
+    snapshot = FrameHistory(0).snapshot(30)
+    assert snapshot["timestamps"] == [] and snapshot["mode_runs"] == []
+    assert all(snapshot[field] == [] for field in HISTORY_FIELDS)
+
+
+def test_store_keeps_the_latest_sessions():
+    store = HistoryStore(capacity=10, sessions=2)
+    for session_id in (1, 2, 3):
+        store.append(session_id, 100.0, "study", _frame(float(session_id)))
+    assert store.snapshot()["session_id"] == 3
+    assert store.snapshot(2)["focus_score"] == [2.0]
+    # Evicted sessions come back empty rather than failing
+    evicted = store.snapshot(1, seconds=60)
+    assert evicted == {**evicted, "type": "history", "session_id": 1, "seconds": 60, "timestamps": []}
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+@pytest.mark.parametrize("seconds, sent", [(None, True), (0, False)])
+def test_subscribe_snapshot_carries_the_live_sequence(seconds, sent):
+    from backend.websocket_server import WebSocketServer
+    server = WebSocketServer()
+    for i in range(3):
+        server.history.append(7, 100.0 + i, "study", _frame(float(i)))
+        server.replay.add(server.replay.next_seq(7), "{}")
+    websocket = FakeSocket()
+    asyncio.run(server.send_history(websocket, seconds))
+    if not sent:
+        # history_seconds=0 opts out of the snapshot
+        assert websocket.sent == []
+        return
+    assert websocket.sent[0]["session_id"] == 7 and websocket.sent[0]["last_seq"] == 3
+    assert len(websocket.sent[0]["timestamps"]) == 3
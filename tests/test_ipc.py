@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import tempfile
+
+from backend.ipc import (
+    BusClient, BusServer, encode_frame, read_frame, PUBLISH, DIRECT, CLIENT_OPEN, CLIENT_MESSAGE, CLIENT_CLOSED
+)
+
+
+def _decode(frame: bytes):
+    async def go():
+        reader = asyncio.StreamReader()
+        reader.feed_data(frame)
+        reader.feed_eof()
+        return await read_frame(reader)
+    return asyncio.run(go())
+
+
+def test_frames_round_trip():
+    assert _decode(encode_frame(PUBLISH, payload='{"a": "é"}', topic="eeg")) == (PUBLISH, 0, "eeg", '{"a": "é"}')
+    assert _decode(encode_frame(PUBLISH, payload="x")) == (PUBLISH, 0, None, "x")
+    assert _decode(encode_frame(DIRECT, 2 ** 40, "reply")) == (DIRECT, 2 ** 40, None, "reply")
+    assert _decode(encode_frame(CLIENT_CLOSED, 7)) == (CLIENT_CLOSED, 7, None, "")
+
+
+def test_server_routes_client_frames_and_replies():
+    path = os.path.join(tempfile.mkdtemp(prefix="neurocalm-bus-"), "bus.sock")
+    events = []
+    received = []
+
+    async def on_open(client):
+        events.append(("open", client.id))
+
+    async def on_message(client, message):
+        events.append(("message", client.id, message))
+        await client.send(f"echo {message}")
+
+    async def on_close(client):
+        events.append(("close", client.id))
+
+    async def on_frame(*frame):
+        received.append(frame)
+
+    async def wait_for(condition):
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("timed out")
+
+    async def go():
+        server = BusServer(path, on_open, on_message, on_close)
+        await server.start()
+        client = BusClient(path, on_frame)
+        task = asyncio.create_task(client.run())
+        try:
+            await wait_for(lambda: client.connected and server.relays)
+            client.send(CLIENT_OPEN, 5)
+            client.send(CLIENT_MESSAGE, 5, "hello")
+            # Unknown clients' messages are ignored
+            client.send(CLIENT_MESSAGE, 6, "stray")
+            await wait_for(lambda: received)
+            server.publish("frame", topic="eeg")
+            await wait_for(lambda: len(received) == 2)
+            client.send(CLIENT_CLOSED, 5)
+            await wait_for(lambda: events[-1][0] == "close")
+        finally:
+            task.cancel()
+            server.server.close()
+        return list(server.clients)
+
+    remaining = asyncio.run(go())
+    assert events == [("open", "1:5"), ("message", "1:5", "hello"), ("close", "1:5")]
+    assert received == [(DIRECT, 5, None, "echo hello"), (PUBLISH, 0, "eeg", "frame")]
+    assert remaining == []
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+
+def test_relay_fans_out_by_topic():
+    from backend.relay import RelayServer
+    relay = RelayServer(bus_path="/nonexistent")
+    default, anomaly_only = FakeSocket(), FakeSocket()
+    relay.clients = {1: default, 2: anomaly_only}
+
+    async def go():
+        await relay.handle_message(2, anomaly_only, json.dumps({"type": "subscribe", "topics": ["anomaly"]}))
+        await relay.handle_message(2, anomaly_only, json.dumps({"type": "unsubscribe", "topics": ["eeg"]}))
+        await relay.handle_message(2, anomaly_only, json.dumps({"type": "subscribe", "topics": ["bogus"]}))
+        replies = [json.loads(message) for message in anomaly_only.sent]
+        anomaly_only.sent.clear()
+        await relay.on_frame(PUBLISH, 0, "eeg", "frame")
+        await relay.on_frame(PUBLISH, 0, "anomaly", "spike")
+        await relay.on_frame(PUBLISH, 0, None, "everyone")
+        await relay.on_frame(DIRECT, 1, None, "just you")
+        # Without a bus connection, commands are refused rather than lost silently
+        await relay.handle_message(1, default, json.dumps({"type": "set_mode", "mode": "study"}))
+        return replies
+
+    replies = asyncio.run(go())
+    assert replies[1] == {"type": "subscribed", "topics": ["anomaly"]}
+    assert replies[2]["type"] == "error"
+    assert default.sent[:3] == ["frame", "everyone", "just you"]
+    assert json.loads(default.sent[3])["type"] == "error"
+    assert anomaly_only.sent == ["spike", "everyone"]
@@ -0,0 +1,25 @@
+from backend.main import RestartBackoff
+
+
+def test_restart_delay_doubles_for_rapid_exits_and_gives_up():
+    backoff = RestartBackoff(base=1, cap=5, max_failures=4, rapid=30)
+    delays = []
+    now = 0.0
+    for _ in range(5):
+        backoff.started("relay-0", now)
+        now += 2
+        delays.append(backoff.exited("relay-0", now))
+    assert delays == [1, 2, 4, 5, None]
+    # Other services keep their own count
+    backoff.started("api-0", now)
+    assert backoff.exited("api-0", now + 1) == 1
+
+
+def test_long_running_service_starts_over():
+    backoff = RestartBackoff(base=1, cap=60, max_failures=3, rapid=30)
+    backoff.started("acquisition", 0)
+    assert backoff.exited("acquisition", 1) == 1
+    backoff.started("acquisition", 2)
+    assert backoff.exited("acquisition", 3) == 2
+    backoff.started("acquisition", 4)
+    assert backoff.exited("acquisition", 100) == 1
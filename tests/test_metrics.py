@@ -0,0 +1,51 @@
+import pytest
+
+from backend.metrics import Counter, Gauge, Histogram, _Metric
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("neurocalm_test", "doc")
+
+    class Incomplete(_Metric):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("neurocalm_test", "doc")
+
+
+def test_counter_renders_labelled_samples():
+    counter = Counter("neurocalm_test_total", "Things counted", ["kind"])
+    counter.inc(kind="a")
+    counter.inc(2, kind="b")
+    assert counter.value(kind="b") == 2
+    rendered = counter.render()
+    assert "# TYPE neurocalm_test_total counter" in rendered
+    assert 'neurocalm_test_total{kind="a"} 1' in rendered
+    with pytest.raises(ValueError):
+        counter.inc(-1, kind="a")
+    with pytest.raises(ValueError):
+        counter.inc(other="a")
+
+
+def test_unlabelled_counter_renders_zero():
+    assert Counter("neurocalm_empty_total", "Nothing yet").render().endswith("neurocalm_empty_total 0")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("neurocalm_test_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    lines = histogram.render().splitlines()
+    assert 'neurocalm_test_seconds_bucket{le="0.1"} 2' in lines
+    assert 'neurocalm_test_seconds_bucket{le="1"} 3' in lines
+    assert 'neurocalm_test_seconds_bucket{le="+Inf"} 4' in lines
+    assert "neurocalm_test_seconds_count 4" in lines
+    assert "neurocalm_test_seconds_sum 2.65" in lines
+
+
+def test_gauge_set_and_dec():
+    gauge = Gauge("neurocalm_test_clients", "Clients")
+    gauge.set(3)
+    gauge.dec()
+    assert gauge.value() == 2
@@ -0,0 +1,68 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from backend import postgres
+
+
+class _Cursor:
+    def __init__(self):
+        self.sql = self.data = None
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Psycopg2Cursor(_Cursor):
+    def copy_expert(self, sql, buffer):
+        self.sql, self.data = sql, buffer.read()
+
+
+class Psycopg3Cursor(_Cursor):
+    def copy(self, sql):
+        cursor = self
+        cursor.sql = sql
+
+        class Copy:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def write(self, data):
+                cursor.data = data
+
+        return Copy()
+
+
+def _conn(cursor):
+    return SimpleNamespace(connection=SimpleNamespace(dbapi_connection=SimpleNamespace(cursor=lambda: cursor)))
+
+
+def test_partitions_start_on_the_period_boundary():
+    assert postgres.partition_start(datetime(2024, 1, 1)) == postgres.PARTITION_EPOCH
+    start = postgres.partition_start(datetime(2024, 3, 14, 23, 59))
+    assert start <= datetime(2024, 3, 14, 23, 59) < start + timedelta(days=postgres.PARTITION_DAYS)
+    assert (start - postgres.PARTITION_EPOCH) % timedelta(days=postgres.PARTITION_DAYS) == timedelta(0)
+    # Before the epoch too
+    assert postgres.partition_start(datetime(2023, 12, 31)) < datetime(2023, 12, 31)
+    assert postgres.partition_name(datetime(2024, 3, 11)) == "events_p20240311"
+
+
+def test_copy_rows_writes_csv_with_nulls():
+    columns = ("timestamp", "mode", "context", "gap_seconds")
+    rows = [
+        {"timestamp": datetime(2024, 1, 2, 3, 4, 5), "mode": "study", "context": {"tab": "a,b"}},
+        (datetime(2024, 1, 2, 3, 4, 6), "", None, 0.5),
+    ]
+    for cursor in (Psycopg2Cursor(), Psycopg3Cursor()):
+        assert postgres.copy_rows(_conn(cursor), "events", columns, rows) == 2
+        assert cursor.sql == "COPY events (timestamp, mode, context, gap_seconds) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        assert cursor.closed
+        assert list(csv.reader(io.StringIO(cursor.data))) == [
+            ["2024-01-02T03:04:05", "study", '{"tab": "a,b"}', "\\N"],
+            ["2024-01-02T03:04:06", "", "\\N", "0.5"],
+        ]
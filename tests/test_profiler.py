@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import profiler
+from backend.profiler import Profiler, ProfilerBusy, StackSampler, is_admin
+
+TOKEN = "secret"
+
+
+def _spin(stop: threading.Event):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+def test_admin_token_is_required_and_off_when_unset(monkeypatch):
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "")
+    assert not is_admin("") and not is_admin(None)
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", TOKEN)
+    assert is_admin(TOKEN) and not is_admin("wrong") and not is_admin(None)
+
+
+def test_sampler_collapses_other_threads_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="worker")
+    worker.start()
+    sampler = StackSampler(0.002)
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    worker.join()
+    lines = sampler.collapsed().splitlines()
+    assert sampler.samples > 0
+    worker_lines = [line for line in lines if line.startswith("worker;")]
+    assert worker_lines and all("_spin (tests/test_profiler.py:" in line for line in worker_lines)
+    assert not any("stack-sampler" in line for line in lines)
+    counts = [int(line.rsplit(" ", 1)[1]) for line in lines]
+    assert counts == sorted(counts, reverse=True)
+
+
+def test_cprofile_and_memory_runs():
+    async def busy():
+        while True:
+            sum(range(1000))
+            await asyncio.sleep(0.001)
+
+    async def go():
+        task = asyncio.create_task(busy())
+        try:
+            return await Profiler().run("cprofile", seconds=0.2, memory=True, top=5)
+        finally:
+            task.cancel()
+
+    result = asyncio.run(go())
+    assert result["mode"] == "cprofile" and len(result["functions"]) == 5
+    assert any(row["function"].startswith("busy (tests/test_profiler.py:") for row in result["functions"])
+    assert set(result["memory"]) == {"traced_bytes", "peak_bytes", "top"}
+
+
+def test_one_run_at_a_time_and_modes_checked():
+    async def go():
+        instance = Profiler()
+        with pytest.raises(ValueError, match="Unknown profile mode"):
+            await instance.run("perf")
+        first = asyncio.create_task(instance.run("sample", seconds=0.2))
+        await asyncio.sleep(0.05)
+        assert instance.running
+        with pytest.raises(ProfilerBusy):
+            await instance.run("sample", seconds=0.1)
+        result = await first
+        assert not instance.running
+        return result
+
+    result = asyncio.run(go())
+    assert result["seconds"] == 0.2 and result["samples"] > 0 and "functions" not in result
+
+
+def test_api_route(monkeypatch):
+    from backend.api import app
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", TOKEN)
+    monkeypatch.setattr(Profiler, "_instance", None)
+    client = TestClient(app)
+    body = {"mode": "sample", "seconds": 0.1}
+    assert client.post("/admin/profile", json=body).status_code == 403
+    assert client.post("/admin/profile", json=body, headers={"X-Admin-Token": "wrong"}).status_code == 403
+    headers = {"X-Admin-Token": TOKEN}
+    # Sync routes run in the thread pool, which cProfile of the loop thread can't see
+    response = client.post("/admin/profile", json={**body, "mode": "cprofile"}, headers=headers)
+    assert response.status_code == 400 and "mode=sample" in response.json()["detail"]
+    assert client.post("/admin/profile", json={**body, "mode": "perf"}, headers=headers).status_code == 400
+    response = client.post("/admin/profile", json=body, headers=headers, params={"format": "collapsed"})
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    assert client.post("/admin/profile", json=body, headers=headers).json()["mode"] == "sample"
@@ -0,0 +1,77 @@
+import numpy as np
+
+from backend.recommender import (
+    ACTION_NAMES, CONTEXT_DIM, REWARD_DELAY, SETTLE_SECONDS, LinUCBModel, Recommender, UserState,
+)
+
+
+def test_sherman_morrison_matches_direct_inverse():
+    rng = np.random.default_rng(0)
+    model = LinUCBModel(num_actions=2, dim=5, ridge=1.0)
+    design = [np.eye(5), np.eye(5)]
+    rewards = [np.zeros(5), np.zeros(5)]
+    for _ in range(200):
+        action, x, reward = int(rng.integers(2)), rng.normal(size=5), float(rng.normal())
+        model.update(action, x, reward)
+        design[action] += np.outer(x, x)
+        rewards[action] += reward * x
+    for action in range(2):
+        np.testing.assert_allclose(model.a_inv[action], np.linalg.inv(design[action]), atol=1e-10)
+    x = rng.normal(size=5)
+    expected = [np.linalg.solve(design[k], rewards[k]) @ x + 0.5 * np.sqrt(x @ np.linalg.solve(design[k], x))
+                for k in range(2)]
+    np.testing.assert_allclose(model.ucb_scores(x, alpha=0.5), expected)
+
+
+def test_learns_the_rewarded_action():
+    rng = np.random.default_rng(1)
+    model = LinUCBModel()
+    best = ACTION_NAMES.index("box_breathing")
+    for _ in range(300):
+        x = np.abs(rng.normal(size=CONTEXT_DIM))
+        action = int(np.argmax(model.ucb_scores(x, alpha=0.2)))
+        model.update(action, x, 1.0 if action == best else -0.5)
+    assert int(np.argmax(model.ucb_scores(np.ones(CONTEXT_DIM), alpha=0.0))) == best
+
+
+def test_save_and_load_round_trip(tmp_path):
+    model = LinUCBModel()
+    model.update(2, np.ones(CONTEXT_DIM), 0.5)
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+    loaded = LinUCBModel.load(path)
+    np.testing.assert_array_equal(loaded.a_inv, model.a_inv)
+    assert loaded.counts[2] == 1
+    assert LinUCBModel.load(str(tmp_path / "missing.npz")) is None
+
+
+def test_context_vector_layout():
+    state = UserState()
+    state.update(80.0, 20.0, 5.0)
+    x = state.context_vector("study", {"calendar_event_id": "evt"})
+    assert x.shape == (CONTEXT_DIM,) and x[0] == 1.0
+    assert x[1:4].tolist() == [0.8, 0.2, 0.05] and x[9] == 1.0 and x[12] == 1.0
+
+
+def test_tracked_recommendation_is_rewarded_after_delay(tmp_path):
+    recommender = Recommender(model_dir=str(tmp_path))
+    for _ in range(5):
+        recommender.observe("alice", 40.0, 60.0, 0.0, now=0.0)
+    recommendation = recommender.recommend("alice", "study", now=0.0)
+    action = ACTION_NAMES.index(recommendation["action"])
+
+    assert recommender.observe("alice", 70.0, 30.0, 0.0, now=SETTLE_SECONDS) == []
+    outcomes = recommender.observe("alice", 70.0, 30.0, 0.0, now=REWARD_DELAY)
+    assert [outcome["recommendation_id"] for outcome in outcomes] == [recommendation["recommendation_id"]]
+    assert outcomes[0]["reward"] == 1.0
+    assert recommender.get_model("alice").counts[action] == 1
+    assert LinUCBModel.load(recommender._path("alice")).counts[action] == 1
+
+
+def test_dismissed_recommendation_is_not_rewarded(tmp_path):
+    recommender = Recommender(model_dir=str(tmp_path))
+    recommender.observe("bob", 50.0, 50.0, 0.0, now=0.0)
+    recommendation = recommender.recommend("bob", "meeting", now=0.0)
+    assert recommender.dismiss(recommendation["recommendation_id"])
+    assert not recommender.dismiss(recommendation["recommendation_id"])
+    assert recommender.observe("bob", 90.0, 10.0, 0.0, now=REWARD_DELAY) == []
@@ -0,0 +1,104 @@
+import asyncio
+
+import numpy as np
+import pytest
+from brainflow.board_shim import BoardIds, BoardShim
+
+from backend import eeg_service
+from backend.eeg_service import EEGService
+
+RATE = 250
+
+
+def _packages(values) -> np.ndarray:
+    """Board data with only the package counter channel filled in"""
+    channel = BoardShim.get_package_num_channel(BoardIds.SYNTHETIC_BOARD)
+    data = np.zeros((channel + 1, len(values)))
+    data[channel] = values
+    return data
+
+
+def test_gaps_counted_across_reads_and_counter_wrap():
+    service = EEGService()
+    service._track_gaps(_packages(range(0, 256)), RATE)
+    assert service._pending_gap_seconds == 0
+    # Wraps 255 -> 0 between reads, then skips 10 samples
+    service._track_gaps(_packages(list(range(0, 100)) + list(range(110, 120))), RATE)
+    assert service._pending_gap_seconds == pytest.approx(10 / RATE)
+    # Losing samples across the wrap itself
+    service._pending_gap_seconds = 0.0
+    service._track_gaps(_packages(range(120, 250)), RATE)
+    service._track_gaps(_packages(range(4, 20)), RATE)
+    assert service._pending_gap_seconds == pytest.approx(10 / RATE)
+
+
+def test_window_keeps_the_latest_seconds(monkeypatch):
+    monkeypatch.setattr(eeg_service, "WINDOW_SECONDS", 1.0)
+    service = EEGService()
+    chunks = [np.arange(start, start + 100, dtype=float).reshape(1, -1) for start in range(0, 400, 100)]
+    for chunk in chunks:
+        window, artifacts = service._slide_window(chunk, np.zeros_like(chunk, dtype=bool), RATE)
+    assert window.shape == (1, RATE) and artifacts.shape == (1, RATE)
+    np.testing.assert_array_equal(window[0], np.arange(400 - RATE, 400))
+    # A tick after a long pause still uses everything it read
+    window, _ = service._slide_window(np.zeros((1, 600)), None, RATE)
+    assert window.shape == (1, 600)
+
+
+class FlakyBoard:
+    """Fails prepare_session a few times before coming back"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.prepared = 0
+
+    def stop_stream(self):
+        pass
+
+    def release_session(self):
+        pass
+
+    def prepare_session(self):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("no dongle")
+        self.prepared += 1
+
+    def start_stream(self, size):
+        pass
+
+
+def test_reconnect_backs_off_and_reports_the_gap(monkeypatch):
+    monkeypatch.setattr(eeg_service, "RECONNECT_INITIAL_DELAY", 0.01)
+    monkeypatch.setattr(eeg_service, "RECONNECT_MAX_DELAY", 0.02)
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(eeg_service.asyncio, "sleep", fake_sleep)
+    service = EEGService()
+    service.board = FlakyBoard(failures=3)
+    service.is_streaming = True
+    service._last_package = 17
+    states = []
+
+    async def on_state(state):
+        states.append(state)
+
+    service.state_callback = on_state
+    assert asyncio.run(service.reconnect("stalled"))
+    assert sleeps == [0.01, 0.02, 0.02]
+    assert service.board.prepared == 1 and service._last_package is None
+    assert service._pending_gap_seconds > 0
+    assert [state["state"] for state in states] == ["reconnecting"] * 4 + ["streaming"]
+    assert states[-1]["attempts"] == 4
+
+
+def test_reconnect_gives_up_when_streaming_stops():
+    service = EEGService()
+    service.board = FlakyBoard(failures=0)
+    service.is_streaming = False
+    assert not asyncio.run(service.reconnect("read_error"))
@@ -0,0 +1,44 @@
+import json
+
+from backend.history import ReplayWindow
+
+
+def _window(seconds, rate_hz, session_id, frames):
+    window = ReplayWindow(seconds, rate_hz)
+    for _ in range(frames):
+        seq = window.next_seq(session_id)
+        window.add(seq, json.dumps({"seq": seq}))
+    return window
+
+
+def _seqs(message):
+    return [frame["seq"] for frame in message["frames"]]
+
+
+def test_window_holds_seconds_at_any_rate():
+    assert ReplayWindow(10, 1).frames.maxlen == 10
+    assert ReplayWindow(10, 50).frames.maxlen == 500
+    assert ReplayWindow(0.01, 1).frames.maxlen == 1
+
+
+def test_replay_sends_frames_after_last_seq():
+    message = json.loads(_window(10, 1, 5, 6).replay(5, 3))
+    assert _seqs(message) == [4, 5, 6]
+    assert message == {**message, "session_id": 5, "from_seq": 4, "to_seq": 6, "lost": 0, "reset": False}
+    assert _seqs(json.loads(_window(10, 1, 5, 6).replay(5, 6))) == []
+
+
+def test_replay_counts_frames_that_left_the_window():
+    message = json.loads(_window(2, 2, 5, 10).replay(5, 3))
+    assert _seqs(message) == [7, 8, 9, 10]
+    assert message["lost"] == 3
+
+
+def test_replay_after_a_session_switch_resets():
+    window = _window(10, 1, 5, 4)
+    seq = window.next_seq(6)
+    window.add(seq, json.dumps({"seq": seq}))
+    # A client still on session 5 gets the new session from its start
+    message = json.loads(window.replay(5, 4))
+    assert message == {**message, "session_id": 6, "from_seq": 1, "to_seq": 1, "lost": 0, "reset": True}
+    assert _seqs(message) == [1]
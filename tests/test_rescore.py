@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend.anomaly import MIN_SAMPLES
+from backend.calibration import FEATURES, BaselineProfile, normalize
+from backend.features import compute_scores
+from backend.rescore import rescore, score_chunk
+
+START = datetime(2024, 1, 1, 9)
+
+
+def rows(count: int, seed: int = 0) -> np.ndarray:
+    return 10 ** np.random.default_rng(seed).uniform(-1, 1, (count, 4))
+
+
+def times(count: int, start: datetime = START) -> np.ndarray:
+    return np.datetime64(start, "us") + np.arange(count) * np.timedelta64(1, "s")
+
+
+def score_whole(bands, timestamps, sessions, gap=300.0):
+    return score_chunk(bands, timestamps, sessions, None, None, None, gap)
+
+
+def test_sessions_restart_the_detector_without_a_time_gap():
+    bands = rows(60)
+    sessions = np.repeat([1, 2], 30)
+    _, _, anomaly, _ = score_whole(bands, times(60), sessions)
+    assert (anomaly[30:30 + MIN_SAMPLES] == 0).all()
+    assert anomaly[30 + MIN_SAMPLES:].any()
+    _, _, continuous, _ = score_whole(bands, times(60), np.ones(60, dtype=np.int64))
+    assert continuous[30:30 + MIN_SAMPLES].any()
+
+
+def test_legacy_rows_split_on_time_gaps_only():
+    bands = rows(60)
+    timestamps = times(60)
+    timestamps[30:] += np.timedelta64(10, "m")
+    _, _, anomaly, _ = score_whole(bands, timestamps, np.full(60, -1))
+    assert (anomaly[30:30 + MIN_SAMPLES] == 0).all()
+    _, _, wide_gap, _ = score_whole(bands, timestamps, np.full(60, -1), gap=3600.0)
+    assert wide_gap[30:30 + MIN_SAMPLES].any()
+
+
+def test_chunked_scoring_matches_one_chunk():
+    bands = rows(400, seed=3)
+    sessions = np.repeat([-1, 5, 6], [100, 170, 130])
+    timestamps = times(400)
+    expected = score_whole(bands, timestamps, sessions)[2]
+    history = last_time = last_session = None
+    anomaly = []
+    for chunk in np.array_split(np.arange(400), [37, 150, 269, 271]):
+        _, _, part, history = score_chunk(bands[chunk], timestamps[chunk], sessions[chunk],
+                                          history, last_time, last_session, 300.0)
+        last_time, last_session = timestamps[chunk][-1], int(sessions[chunk][-1])
+        anomaly.append(part)
+    np.testing.assert_allclose(np.concatenate(anomaly), expected)
+
+
+def insert_events(user_id: str, bands: np.ndarray, session_id=None, start=START):
+    from backend.database import Event, SessionLocal
+    with SessionLocal() as db:
+        db.add_all([
+            Event(timestamp=start + timedelta(seconds=i), mode="study", user_id=user_id, session_id=session_id,
+                  alpha=a, beta=b, theta=t, gamma=g, focus_score=0.0, load_score=0.0, anomaly_score=0.0)
+            for i, (a, b, t, g) in enumerate(bands.tolist())
+        ])
+        db.commit()
+
+
+def calibrated_stats(seed: int = 0) -> dict:
+    profile = BaselineProfile("u", 1)
+    for values in np.random.default_rng(seed).normal(size=(30, len(FEATURES))):
+        profile.add_calibration_sample(values)
+    profile.finish_calibration()
+    return profile.to_stats()
+
+
+def test_rescore_normalizes_calibrated_users_and_skips_ambiguous_ones(db):
+    from backend.database import Baseline, Event, SessionLocal
+    bands = rows(40, seed=7)
+    calibrated_at = START + timedelta(seconds=20)
+    insert_events("alice", bands, session_id=1)
+    insert_events("bob", bands, session_id=2)
+    insert_events("carol", bands, session_id=3)
+    stats = calibrated_stats()
+    with SessionLocal() as session:
+        session.add(Baseline(user_id="alice", board_id=1, stats=stats, calibrated_at=calibrated_at))
+        session.add(Baseline(user_id="carol", board_id=1, stats=stats, calibrated_at=calibrated_at))
+        session.add(Baseline(user_id="carol", board_id=2, stats=stats, calibrated_at=calibrated_at))
+        session.commit()
+
+    summary = rescore(7, workers=1, apply=True)
+    assert summary["events"] == 120 and summary["calibrated_users"] == 1
+    assert summary["not_applied_users"] == ["carol"] and summary["applied"] == 80
+
+    with SessionLocal() as session:
+        stored = {user: session.query(Event).filter(Event.user_id == user).order_by(Event.timestamp).all()
+                  for user in ("alice", "bob", "carol")}
+    raw = compute_scores(*bands.T)
+    np.testing.assert_allclose([event.focus_score for event in stored["bob"]], raw["focus_score"])
+    np.testing.assert_allclose([event.focus_score for event in stored["alice"][:20]], raw["focus_score"][:20])
+    assert all(event.focus_score == 0.0 and event.score_version is None for event in stored["carol"])
+
+    # From the calibration on, alice's scores are the live normalization replayed from the saved baseline
+    profile = BaselineProfile.from_row(Baseline(user_id="alice", board_id=1, stats=stats, calibrated_at=calibrated_at))
+    for event in stored["alice"][20:]:
+        tick = {name: getattr(event, name) for name in ("alpha", "beta", "theta", "gamma")}
+        tick.update(compute_scores(event.alpha, event.beta, event.theta, event.gamma), anomaly_score=event.anomaly_score)
+        normalize(profile, tick)
+        assert event.focus_score == tick["focus_score"] and event.load_score == tick["load_score"]
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import retention
+from backend.retention import HOUR, MINUTE
+
+START = datetime(2024, 1, 1, 9)
+
+
+def _add_events(rows):
+    from backend.database import Event, SessionLocal
+    with SessionLocal() as session:
+        session.add_all(Event(timestamp=timestamp, mode=mode, focus_score=focus, load_score=50.0,
+                              anomaly_score=0.0, user_id="u1", alpha=1.0)
+                        for timestamp, mode, focus in rows)
+        session.commit()
+
+
+def _rollups(resolution):
+    from backend.database import EventRollup, SessionLocal
+    with SessionLocal() as session:
+        rows = session.query(EventRollup).filter_by(resolution=resolution).order_by(
+            EventRollup.bucket, EventRollup.mode).all()
+        return [(row.mode, row.bucket, row.count, row.focus_sum, row.focus_min, row.focus_max) for row in rows]
+
+
+def test_compaction_merges_into_existing_rollups(db):
+    from backend.database import Event, SessionLocal
+    _add_events([
+        (START, "study", 10.0),
+        (START + timedelta(seconds=30), "study", 30.0),
+        (START + timedelta(seconds=90), "study", 50.0),
+        (START + timedelta(seconds=100), "meeting", 70.0),
+    ])
+    # Batches smaller than the data split a minute bucket across two passes
+    assert retention.compact_batch(START + timedelta(hours=1), batch_rows=1) == 1
+    assert retention.compact_batch(START + timedelta(hours=1), batch_rows=10) == 3
+    assert retention.compact_batch(START + timedelta(hours=1)) == 0
+    # A late event in an already compacted bucket
+    _add_events([(START + timedelta(seconds=45), "study", 5.0)])
+    assert retention.compact_batch(START + timedelta(hours=1)) == 1
+
+    assert _rollups(MINUTE) == [
+        ("study", START, 3, 45.0, 5.0, 30.0),
+        ("meeting", START + timedelta(minutes=1), 1, 70.0, 70.0, 70.0),
+        ("study", START + timedelta(minutes=1), 1, 50.0, 50.0, 50.0),
+    ]
+    assert _rollups(HOUR) == [
+        ("meeting", START, 1, 70.0, 70.0, 70.0),
+        ("study", START, 4, 95.0, 5.0, 50.0),
+    ]
+    with SessionLocal() as session:
+        assert session.query(Event).count() == 0
+
+
+def test_retention_is_off_unless_raw_days_is_set(db, monkeypatch):
+    from backend.database import Event, SessionLocal
+    monkeypatch.setattr(retention, "RAW_DAYS", 0.0)
+    _add_events([(datetime(2000, 1, 1), "study", 10.0)])
+    assert retention.raw_cutoff() is None
+    assert retention.run_once() == {"events": 0, "minute_rollups": 0, "vacuumed_pages": 0}
+    job = retention.RetentionJob()
+    job.start()
+    assert job._thread is None
+    with SessionLocal() as session:
+        assert session.query(Event).count() == 1
+
+    monkeypatch.setattr(retention, "RAW_DAYS", 30.0)
+    monkeypatch.setattr(retention, "BATCH_PAUSE_SECONDS", 0.0)
+    assert retention.raw_cutoff(datetime(2024, 2, 1, 12, 30)) == datetime(2024, 1, 2, 12)
+    assert retention.run_once()["events"] == 1
+
+
+@pytest.mark.parametrize("oldest, horizon", [
+    (START, START),
+    (START + timedelta(minutes=5), START + timedelta(hours=1)),
+])
+def test_minute_horizon_starts_at_the_first_complete_hour(db, oldest, horizon):
+    from backend.database import SessionLocal
+    _add_events([(oldest, "study", 10.0)])
+    retention.compact_batch(START + timedelta(hours=2))
+    with SessionLocal() as session:
+        assert retention.minute_horizon(session) == horizon
+
+
+def test_lttb_series_includes_compacted_history(db):
+    from fastapi.testclient import TestClient
+    from backend.api import app
+    # A spike in the first hour, which gets compacted, then raw events in the second
+    _add_events([(START + timedelta(minutes=m), "study", 90.0 if m == 20 else 10.0) for m in range(60)])
+    assert retention.compact_batch(START + timedelta(hours=1)) == 60
+    _add_events([(START + timedelta(hours=1, minutes=m), "study", 20.0) for m in range(60)])
+
+    params = {"user_id": "u1", "start": START.isoformat(), "end": (START + timedelta(hours=2)).isoformat(),
+              "points": 50, "method": "lttb", "metrics": "focus_score"}
+    body = TestClient(app).get("/events/series", params=params).json()
+    assert body["total_events"] == 120
+    focus = body["series"]["focus_score"]
+    assert len(focus["values"]) == 50 and 90.0 in focus["values"]
+    assert focus["timestamps"][0] < "2024-01-01T09:01" and focus["timestamps"][-1] == "2024-01-01T10:59:00.000"
+    assert focus["timestamps"] == sorted(focus["timestamps"])
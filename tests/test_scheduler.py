@@ -0,0 +1,127 @@
+import asyncio
+import functools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from backend.scheduler import TickScheduler, check_policy
+
+RATE = 50
+PERIOD = 1.0 / RATE
+
+
+async def _busy_stream(policy: str, ticks: int = 8):
+    """Ticks at RATE with the second tick blocking the loop for about five periods"""
+    timer = TickScheduler.get_instance().add(RATE, policy, name=f"test-{policy}")
+    latenesses = []
+    try:
+        for tick in range(ticks):
+            latenesses.append(await timer.wait())
+            if tick == 1:
+                time.sleep(PERIOD * 5.5)
+    finally:
+        timer.cancel()
+    return timer, latenesses
+
+
+def test_skip_drops_missed_ticks_and_stays_on_the_grid():
+    timer, latenesses = asyncio.run(_busy_stream("skip"))
+    assert timer.missed >= 4 and timer.caught_up == 0
+    # One late tick for the stall, then back on the grid instead of running the missed ones
+    assert latenesses[2] >= PERIOD * 4
+    assert all(lateness < PERIOD for lateness in latenesses[3:])
+    assert timer.stats() == {**timer.stats(), "policy": "skip", "ticks": 8}
+
+
+def test_catch_up_runs_missed_ticks_back_to_back():
+    timer, latenesses = asyncio.run(_busy_stream("catch_up"))
+    assert timer.caught_up >= 4 and timer.missed <= 1
+    # Owed ticks start straight away, already late
+    assert all(lateness >= PERIOD for lateness in latenesses[2:2 + timer.caught_up])
+
+
+def test_pause_does_not_count_missed_ticks():
+    async def go():
+        timer = TickScheduler.get_instance().add(RATE, "catch_up", name="paused")
+        await timer.wait()
+        timer.pause()
+        await asyncio.sleep(PERIOD * 5)
+        timer.resume()
+        await timer.wait()
+        timer.cancel()
+        return timer
+
+    timer = asyncio.run(go())
+    assert (timer.missed, timer.caught_up) == (0, 0)
+
+
+def test_unknown_policy_is_rejected_before_scheduling():
+    assert check_policy("catch_up") == "catch_up"
+
+    async def go():
+        scheduler = TickScheduler()
+        with pytest.raises(ValueError, match="Unknown tick policy 'burst'"):
+            scheduler.add(RATE, "burst")
+        return scheduler
+
+    # No driver was started for the rejected timer
+    assert asyncio.run(go())._driver is None
+
+
+def test_unknown_policy_in_the_environment_fails_at_import():
+    env = {**os.environ, "EEG_TICK_POLICY": "skipp"}
+    result = subprocess.run([sys.executable, "-c", "import backend.scheduler"], env=env,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output=True, text=True)
+    assert result.returncode != 0 and "Unknown tick policy 'skipp'" in result.stderr
+
+
+def test_start_streaming_rejects_an_unknown_policy_before_the_board_starts():
+    from backend.eeg_service import EEGService
+
+    class Board:
+        started = False
+
+        def start_stream(self, size):
+            self.started = True
+
+    service = EEGService()
+    service.board = Board()
+    with pytest.raises(ValueError):
+        service.start_streaming(lambda *args: None, policy="burst")
+    assert not service.board.started and not service.is_streaming
+
+
+def test_start_recording_reports_a_bad_policy_to_the_client(db, monkeypatch):
+    from backend.commands import CommandFailed
+    from backend.database import RecordingSession, SessionLocal
+    from backend.websocket_server import WebSocketServer
+
+    class Board:
+        def start_stream(self, size):
+            raise AssertionError("the board shouldn't start")
+
+        def release_session(self):
+            pass
+
+    class Socket:
+        sent = []
+
+        async def send(self, message):
+            self.sent.append(json.loads(message))
+
+    server = WebSocketServer()
+    service = server.eeg_service
+    monkeypatch.setattr(service, "connect", lambda **kwargs: setattr(service, "board", Board()))
+    monkeypatch.setattr(service, "start_streaming", functools.partial(service.start_streaming, policy="burst"))
+    websocket = Socket()
+    with pytest.raises(CommandFailed):
+        asyncio.run(server.start_recording(websocket, {"serial_port": "/dev/null"}))
+    assert websocket.sent[-1]["type"] == "error" and "Unknown tick policy" in websocket.sent[-1]["message"]
+    assert service.board is None and server.stream_task is None
+    with SessionLocal() as session:
+        assert [row.status for row in session.query(RecordingSession)] == ["interrupted"]
@@ -0,0 +1,25 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.seed_events import MODES, generate_sessions, seed
+
+
+def test_sessions_cover_every_user_and_day():
+    sessions = list(generate_sessions(np.random.default_rng(0), users=3, days=2, sessions_per_day=4,
+                                      session_minutes=30, end=datetime(2024, 1, 10)))
+    assert len(sessions) == 3 * 2 * 4
+    assert {user for user, *_ in sessions} == {"user0000", "user0001", "user0002"}
+    assert all(mode in MODES and length >= 60 for _, mode, _, _, length in sessions)
+
+
+def test_seed_stops_at_max_rows(db):
+    from backend.database import Event, SessionLocal
+    inserted = seed(os.environ["DATABASE_URL"], users=2, days=1, sessions_per_day=2,
+                    session_minutes=5, max_rows=500, seed_value=1)
+    assert inserted == 500
+    with SessionLocal() as session:
+        rows = session.query(Event).all()
+    assert len(rows) == 500
+    assert all(0 <= row.focus_score <= 100 and row.context_id is not None and row.alpha > 0 for row in rows)
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from backend.sessions import ScoreStats, SessionRecorder, SessionSummary
+
+START = datetime(2024, 1, 1, 9)
+
+
+def test_histogram_percentiles_within_a_bin():
+    values = np.random.default_rng(0).uniform(0, 100, 5000)
+    stats = ScoreStats()
+    for value in values:
+        stats.add(float(value))
+    stats.add(None)
+    stats.add(float("nan"))
+    assert stats.count == 5000
+    for q in (10, 50, 90):
+        assert stats.percentile(q) == pytest.approx(np.percentile(values, q), abs=0.5)
+    assert stats.to_dict()["mean"] == pytest.approx(values.mean())
+    assert ScoreStats().to_dict()["p50"] is None
+
+
+def test_summary_tracks_modes_anomalies_and_gaps():
+    summary = SessionSummary(START, "study")
+    summary.add({"focus_score": 60.0, "load_score": 40.0, "anomaly_score": 0.0}, False, START)
+    summary.set_mode("meeting", START + timedelta(seconds=30))
+    summary.set_mode("meeting", START + timedelta(seconds=40))
+    summary.add({"focus_score": 20.0, "gap_seconds": 1.5}, True, START + timedelta(seconds=45))
+    result = summary.to_dict(START + timedelta(seconds=60))
+    assert result["time_in_mode"] == {"study": 30.0, "meeting": 30.0}
+    assert (result["event_count"], result["anomaly_count"], result["gap_count"]) == (2, 1, 1)
+    assert result["gap_seconds"] == 1.5 and result["scores"]["focus_score"]["max"] == 60.0
+
+
+def test_recorder_checkpoints_in_background_and_finalizes(db):
+    from backend.database import RecordingSession, SessionLocal
+
+    def stored(session_id):
+        with SessionLocal() as session:
+            return session.get(RecordingSession, session_id)
+
+    async def run():
+        recorder = SessionRecorder(checkpoint_seconds=10)
+        session_id = await recorder.start("alice", 1, "study", now=START)
+        for i in range(15):
+            recorder.observe({"focus_score": 50.0, "load_score": 50.0, "anomaly_score": 0.0},
+                             now=START + timedelta(seconds=i + 1))
+        # The checkpoint at 10 s runs in a worker thread; the loop carries on meanwhile
+        assert recorder._checkpoint is not None
+        await recorder._checkpoint
+        assert stored(session_id).summary["event_count"] == 10
+
+        # Switching users closes the session and opens another
+        summary = await recorder.finish(now=START + timedelta(seconds=20))
+        assert summary["status"] == "completed" and summary["summary"]["event_count"] == 15
+        second = await recorder.start("bob", 1, "study", now=START + timedelta(seconds=21))
+        return session_id, second
+
+    first, second = asyncio.run(run())
+    assert stored(first).ended_at == START + timedelta(seconds=20)
+    assert stored(second).status == "recording"
+
+    # A new recorder (after a crash) marks the session left open as interrupted
+    asyncio.run(SessionRecorder().start("bob", 1, "study", now=START + timedelta(minutes=5)))
+    assert stored(second).status == "interrupted" and stored(second).ended_at is not None
@@ -0,0 +1,64 @@
+import json
+import threading
+
+from backend import tracing
+from backend.tracing import OTLPJsonFileExporter, Tracer, stage
+
+
+def test_unsampled_ticks_are_not_traced():
+    tracer = Tracer(sample_rate=0.0)
+    assert all(tracer.start_tick() is None for _ in range(100))
+    with stage(None, "acquire"):
+        pass
+
+
+def test_fractional_sample_rate(monkeypatch):
+    tracer = Tracer(sample_rate=0.25)
+    draws = iter([0.1, 0.3, 0.24, 0.9])
+    monkeypatch.setattr("backend.tracing.random.random", lambda: next(draws))
+    sampled = [tracer.start_tick() is not None for _ in range(4)]
+    assert sampled == [True, False, True, False]
+
+
+def test_exporter_traces_every_tick_and_matches_acks(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(OTLPJsonFileExporter(str(path)), sample_rate=0.0)
+    trace = tracer.start_tick()
+    assert trace is not None
+    trace.sample_timestamp = 1700000000.0
+    with trace.span("acquire"):
+        pass
+    trace.finish()
+
+    latency = tracer.record_client_receipt(trace.trace_id, "client", int(1700000000.5 * 1e9))
+    assert abs(latency - 0.5) < 1e-6
+    assert tracer.record_client_receipt("unknown", "client", 0) is None
+
+    tracer.exporter.flush()
+    exported = [json.loads(line) for line in path.read_text().splitlines()]
+    names = [[span["name"] for span in line["resourceSpans"][0]["scopeSpans"][0]["spans"]] for line in exported]
+    assert names == [["tick", "acquire"], ["client_receive"]]
+
+
+def test_export_queues_instead_of_writing_on_the_caller(tmp_path, monkeypatch):
+    writing = threading.Event()
+    release = threading.Event()
+
+    def slow_open(*args, **kwargs):
+        writing.set()
+        release.wait(5)
+        return open(*args, **kwargs)
+
+    monkeypatch.setattr(tracing, "open", slow_open, raising=False)
+    path = tmp_path / "traces.jsonl"
+    exporter = OTLPJsonFileExporter(str(path), max_queued=2)
+    tracer = Tracer(exporter)
+    tracer.start_tick().finish()
+    assert writing.wait(5)
+    # The writer is stuck on the disk; ticks carry on and the overflow is dropped
+    for _ in range(3):
+        tracer.start_tick().finish()
+    assert exporter.dropped == 1
+    release.set()
+    exporter.flush()
+    assert len(path.read_text().splitlines()) == 3